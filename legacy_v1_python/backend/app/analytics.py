@@ -0,0 +1,336 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend.database import models
+from . import response_cache, rollups, schemas
+
+ANALYTICS_CACHE_SIZE = int(os.getenv("SPENDWISE_ANALYTICS_CACHE_SIZE", "1000"))
+
+# Trailing windows, in months, for the rolling burn rates
+BURN_WINDOWS = (3, 6, 12)
+# A category's baseline is its spend over up to this many earlier months...
+BASELINE_MONTHS = 12
+# ...and needs at least this many of them to be meaningful
+MIN_BASELINE_MONTHS = 3
+# A month is anomalous when it is this many standard deviations and this
+# many times above the baseline mean, and at least MIN_ANOMALY cents over it
+ANOMALY_Z = 2.0
+ANOMALY_RATIO = 1.5
+MIN_ANOMALY = 20 * schemas.MINOR_UNITS
+MAX_ANOMALIES = 3
+# Month-over-month change worth reporting
+MOM_THRESHOLD = 0.25
+# Months over which the cash share of spending is fitted, and the change
+# across them (in share points) worth reporting
+TREND_MONTHS = 6
+TREND_THRESHOLD = 0.15
+
+def month_index(month_str: str) -> int:
+    """YYYY-MM as a month count, so month arithmetic is integer arithmetic."""
+    return int(month_str[:4]) * 12 + int(month_str[5:7]) - 1
+
+def month_label(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def _money(cents) -> str:
+    return f"{schemas.from_minor_units(int(cents)):,.2f}"
+
+class Snapshot:
+    """
+    A user's history as dense arrays over consecutive months, from their first
+    ledger or rollup month (index first) to at least the month it was loaded
+    for. Money is int64 cents.
+    income, expense, balance: (wallet type, month); balance is the combined
+    closing balance of the type's wallets, carried across months without a
+    ledger row. category_expense: (category, month).
+    """
+    __slots__ = ("first", "types", "income", "expense", "balance", "categories", "category_expense")
+
+    def __init__(self, first, types, income, expense, balance, categories, category_expense):
+        self.first = first
+        self.types = types
+        self.income = income
+        self.expense = expense
+        self.balance = balance
+        self.categories = categories
+        self.category_expense = category_expense
+
+    @property
+    def last(self) -> int:
+        return self.first + self.income.shape[1] - 1
+
+    def type_row(self, wallet_type: str) -> Optional[int]:
+        return self.types.index(wallet_type) if wallet_type in self.types else None
+
+def load_snapshot(db: Session, user_id: int, wallets, through_month_str: str) -> Snapshot:
+    """
+    Reads every monthly ledger of wallets and the user's expense rollups in
+    two queries and lays them out as a Snapshot covering through_month_str.
+    wallets are objects with id and type (principal wallets).
+    """
+    balances = models.WalletMonthlyBalance
+    ledger_rows = db.execute(
+        select(balances.wallet_id, balances.month, balances.total_income, balances.total_expense, balances.closing_balance)
+        .where(balances.wallet_id.in_([wallet.id for wallet in wallets]))
+    ).all()
+    rollup = models.CategoryMonthlyTotal
+    category_rows = db.execute(
+        select(rollup.category, rollup.month, rollup.total).where(
+            rollup.user_id == user_id, rollup.kind == rollups.EXPENSE
+        )
+    ).all()
+
+    if ledger_rows:
+        wallet_ids, ledger_months, incomes, expenses, closings = map(list, zip(*ledger_rows))
+    else:
+        wallet_ids, ledger_months, incomes, expenses, closings = [], [], [], [], []
+    if category_rows:
+        category_names, category_months, totals = map(list, zip(*category_rows))
+    else:
+        category_names, category_months, totals = [], [], []
+    ledger_months = np.array([month_index(month) for month in ledger_months], dtype=np.int64)
+    category_months = np.array([month_index(month) for month in category_months], dtype=np.int64)
+
+    through = month_index(through_month_str)
+    present_months = [months for months in (ledger_months, category_months) if months.size]
+    first = min([through] + [int(months.min()) for months in present_months])
+    last = max([through] + [int(months.max()) for months in present_months])
+    width = last - first + 1
+
+    types = tuple(sorted({wallet.type for wallet in wallets}))
+    wallet_rows = {wallet.id: row for row, wallet in enumerate(wallets)}
+    wallet_types = np.array([types.index(wallet.type) for wallet in wallets], dtype=np.int64)
+    rows = np.array([wallet_rows[wallet_id] for wallet_id in wallet_ids], dtype=np.int64)
+    columns = ledger_months - first
+
+    income = np.zeros((len(types), width), dtype=np.int64)
+    expense = np.zeros((len(types), width), dtype=np.int64)
+    np.add.at(income, (wallet_types[rows], columns), np.array(incomes, dtype=np.int64))
+    np.add.at(expense, (wallet_types[rows], columns), np.array(expenses, dtype=np.int64))
+
+    # Each wallet's closing balance, forward-filled from its latest ledger
+    # month; 0 before its first
+    closing = np.zeros((len(wallets), width), dtype=np.int64)
+    present = np.zeros((len(wallets), width), dtype=bool)
+    closing[rows, columns] = np.array(closings, dtype=np.int64)
+    present[rows, columns] = True
+    latest = np.maximum.accumulate(np.where(present, np.arange(width), 0), axis=1)
+    filled = np.take_along_axis(closing, latest, axis=1)
+    balance = np.zeros((len(types), width), dtype=np.int64)
+    np.add.at(balance, wallet_types, filled)
+
+    categories, category_rows_index = np.unique(np.array(category_names, dtype=object), return_inverse=True)
+    category_expense = np.zeros((len(categories), width), dtype=np.int64)
+    np.add.at(category_expense, (category_rows_index, category_months - first), np.array(totals, dtype=np.int64))
+
+    return Snapshot(first, types, income, expense, balance, tuple(categories), category_expense)
+
+def _burn_rate(income, expense):
+    if income > 0:
+        burn_rate = expense / income * 100
+        if burn_rate > 100:
+            return {"type": "warning", "message": f"You are spending {burn_rate:.1f}% of your income! (Deficit)"}
+        if burn_rate > 80:
+            return {"type": "caution", "message": f"High burn rate: {burn_rate:.1f}% of income used."}
+        return {"type": "success", "message": f"Healthy burn rate: {burn_rate:.1f}%."}
+    if expense > 0:
+        return {"type": "warning", "message": "Expenses detected with zero income."}
+    return None
+
+def _bank_dependency(snapshot: Snapshot, column: int, expense):
+    if expense <= 0:
+        return None
+    bank = snapshot.type_row("BANK")
+    bank_expense = snapshot.expense[bank, column] if bank is not None else 0
+    bank_share = bank_expense / expense * 100
+    if bank_share > 80:
+        return {"type": "info", "message": f"High bank dependency: {bank_share:.1f}% of expenses via bank."}
+    if bank_share < 20:
+        return {"type": "info", "message": "Heavy cash usage detected."}
+    return None
+
+def _rolling_burn_rates(income, expense, column: int):
+    # Window sums are differences of prefix sums, all windows at once
+    windows = np.array(BURN_WINDOWS)
+    covered = windows <= column + 1
+    if not covered.any():
+        return None
+    windows = windows[covered]
+    prefix_income = np.concatenate(([0], np.cumsum(income)))
+    prefix_expense = np.concatenate(([0], np.cumsum(expense)))
+    starts = column + 1 - windows
+    window_income = prefix_income[column + 1] - prefix_income[starts]
+    window_expense = prefix_expense[column + 1] - prefix_expense[starts]
+    if not (window_income > 0).all():
+        return None
+    rates = window_expense / window_income * 100
+    summary = ", ".join(f"{window}-month {rate:.1f}%" for window, rate in zip(windows, rates))
+    if rates[0] > 100:
+        return {"type": "warning", "message": f"Spending has exceeded income over the last {windows[0]} months ({summary})."}
+    if len(rates) > 1 and rates[0] - rates[-1] > 10:
+        return {"type": "caution", "message": f"Burn rate is rising: {summary}."}
+    return {"type": "info", "message": f"Rolling burn rate: {summary}."}
+
+def _category_anomalies(snapshot: Snapshot, column: int):
+    start = max(0, column - BASELINE_MONTHS)
+    if column - start < MIN_BASELINE_MONTHS or not snapshot.categories:
+        return []
+    baseline = snapshot.category_expense[:, start:column]
+    current = snapshot.category_expense[:, column]
+    mean = baseline.mean(axis=1)
+    # A perfectly steady category still needs a clear jump to count
+    spread = np.maximum(baseline.std(axis=1), mean * 0.1)
+    excess = current - mean
+    flagged = (excess >= MIN_ANOMALY) & (current > mean * ANOMALY_RATIO) & (excess > ANOMALY_Z * spread)
+    insights = []
+    for row in np.flatnonzero(flagged)[np.argsort(-excess[flagged], kind="stable")][:MAX_ANOMALIES]:
+        category = snapshot.categories[row] or "Uncategorized"
+        if mean[row] > 0:
+            message = (f"{category} spending is {_money(current[row])}, {current[row] / mean[row]:.1f}x "
+                       f"your usual {_money(mean[row])} a month.")
+        else:
+            message = f"{category} spending is {_money(current[row])}, where it is usually nothing."
+        insights.append({"type": "caution", "message": message})
+    return insights
+
+def _month_over_month(income, expense, column: int):
+    if column == 0:
+        return []
+    totals = np.stack((income, expense))
+    previous, current = totals[:, column - 1], totals[:, column]
+    change = np.divide(current - previous, previous, out=np.zeros(2), where=previous > 0)
+    insights = []
+    for (label, previous_total, current_total, delta) in zip(("Income", "Expenses"), previous, current, change):
+        if previous_total <= 0 or abs(delta) < MOM_THRESHOLD:
+            continue
+        direction = "up" if delta > 0 else "down"
+        if label == "Expenses":
+            kind = "caution" if delta > 0 else "success"
+        else:
+            kind = "info"
+        insights.append({"type": kind, "message": (
+            f"{label} are {direction} {abs(delta) * 100:.1f}% on last month "
+            f"({_money(current_total)} vs {_money(previous_total)})."
+        )})
+    return insights
+
+def _cash_bank_trend(snapshot: Snapshot, column: int):
+    cash, bank = snapshot.type_row("CASH"), snapshot.type_row("BANK")
+    if cash is None or bank is None:
+        return []
+    insights = []
+    start = max(0, column + 1 - TREND_MONTHS)
+    cash_expense = snapshot.expense[cash, start:column + 1]
+    total = cash_expense + snapshot.expense[bank, start:column + 1]
+    spent = total > 0
+    if spent.sum() >= 3:
+        months = np.flatnonzero(spent)
+        share = cash_expense[spent] / total[spent]
+        slope = np.polyfit(months, share, 1)[0]
+        drift = slope * (months[-1] - months[0])
+        if abs(drift) >= TREND_THRESHOLD:
+            fitted_start = share.mean() - slope * (months.mean() - months[0])
+            direction = "rose" if drift > 0 else "fell"
+            insights.append({"type": "info", "message": (
+                f"Cash share of spending {direction} from {fitted_start * 100:.0f}% to "
+                f"{(fitted_start + drift) * 100:.0f}% over the last {column + 1 - start} months."
+            )})
+
+    # Balances falling every month of the last three
+    if column >= 3:
+        rows = [cash, bank]
+        falling = (np.diff(snapshot.balance[rows, column - 3:column + 1], axis=1) < 0).all(axis=1)
+        for label, row, fell in zip(("Cash", "Bank"), rows, falling):
+            if fell:
+                insights.append({"type": "caution", "message": (
+                    f"{label} balance has fallen three months running, to {_money(snapshot.balance[row, column])}."
+                )})
+    return insights
+
+def insights(snapshot: Snapshot, month_str: str) -> list:
+    """
+    Insights for month_str from a snapshot that covers it: the month's burn
+    rate and bank dependency, rolling burn rates, category anomalies against
+    the user's own baseline, month-over-month changes and cash-versus-bank
+    trends. Each rule is a handful of array operations over the snapshot.
+    """
+    column = month_index(month_str) - snapshot.first
+    if column < 0:
+        return []
+    if column > snapshot.last - snapshot.first:
+        raise ValueError(f"Snapshot ends at {month_label(snapshot.last)}, before {month_str}")
+    income = snapshot.income.sum(axis=0)
+    expense = snapshot.expense.sum(axis=0)
+
+    found = [
+        _burn_rate(income[column], expense[column]),
+        _bank_dependency(snapshot, column, expense[column]),
+        _rolling_burn_rates(income, expense, column),
+    ]
+    found += _category_anomalies(snapshot, column)
+    found += _month_over_month(income, expense, column)
+    found += _cash_bank_trend(snapshot, column)
+    return [insight for insight in found if insight is not None]
+
+class SnapshotCache:
+    """
+    LRU of one Snapshot per user. An entry is tagged with the user's response
+    cache generation when its load began; every write path bumps that
+    generation, so an entry is stale as soon as the user writes anything,
+    including a write that lands while the snapshot is being loaded. Like
+    the response cache, entries also expire after ttl seconds (0: never).
+    """
+
+    def __init__(self, max_size: int = ANALYTICS_CACHE_SIZE, ttl: float = response_cache.RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, generation: int, month_str: str) -> Optional[Snapshot]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is None or entry[0] != generation or entry[1].last < month_index(month_str):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: int, generation: int, snapshot: Snapshot):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+            self._entries[user_id] = (generation, snapshot, expires_at)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+snapshots = SnapshotCache()
@@ -0,0 +1,22 @@
+import functools
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import ledger
+
+# Async versions of the read-side ledger functions for handlers on an
+# AsyncSession. They run the sync implementation through run_sync, so the SQL
+# is shared and each round trip is awaited instead of blocking the event loop.
+# Writes go through the writer connection and stay sync.
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(fn, *args, **kwargs)
+    return wrapper
+
+resolve_monthly_balances = _async(ledger.resolve_monthly_balances)
+scan_ledger_totals = _async(ledger.scan_ledger_totals)
+verify_ledger_totals = _async(ledger.verify_ledger_totals)
+aggregate_monthly_totals = _async(ledger.aggregate_monthly_totals)
+range_series = _async(ledger.range_series)
+range_totals = _async(ledger.range_totals)
+balance_at = _async(ledger.balance_at)
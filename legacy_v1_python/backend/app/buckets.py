@@ -0,0 +1,116 @@
+from sqlalchemy import func, select, delete, literal, union_all
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from backend.database import models
+from . import ledger
+
+# Per-wallet flows by day and by year. With the monthly ledgers between them
+# they are the three levels ledger.range_totals and ledger.balance_at combine.
+COLUMNS = ledger.FLOW_COLUMNS
+
+def _insert(db: Session, model):
+    if db.get_bind().dialect.name == "postgresql":
+        # Imported on use; SQLite deployments never load the Postgres dialect
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def _upsert(db: Session, model, key: str, rows: list):
+    stmt = _insert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["wallet_id", key],
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in COLUMNS},
+    )
+    db.execute(stmt, rows)
+
+def day_key(when) -> str:
+    """YYYY-MM-DD bucket of a transaction date."""
+    return when.strftime("%Y-%m-%d")
+
+def add_to_buckets(db: Session, deltas: dict):
+    """
+    Adds flows to the daily buckets and the yearly ones above them, one
+    executemany upsert per level. deltas maps (wallet_id, day) ->
+    (income, expense, transfers_in, transfers_out) in cents. The monthly
+    level is the ledger itself (ledger.apply_ledger_delta). Does not commit.
+    """
+    if not deltas:
+        return
+    years = {}
+    for (wallet_id, day), amounts in deltas.items():
+        year = years.setdefault((wallet_id, day[:4]), [0, 0, 0, 0])
+        for index, amount in enumerate(amounts):
+            year[index] += amount
+    _upsert(db, models.WalletDailyTotal, "day", [
+        {"wallet_id": wallet_id, "day": day, **dict(zip(COLUMNS, amounts))}
+        for (wallet_id, day), amounts in deltas.items()
+    ])
+    _upsert(db, models.WalletYearlyTotal, "year", [
+        {"wallet_id": wallet_id, "year": year, **dict(zip(COLUMNS, amounts))}
+        for (wallet_id, year), amounts in years.items()
+    ])
+
+def add_to_bucket(db: Session, wallet_id: int, when, income: int = 0, expense: int = 0,
+                  transfers_in: int = 0, transfers_out: int = 0):
+    add_to_buckets(db, {(wallet_id, day_key(when)): (income, expense, transfers_in, transfers_out)})
+
+def _daily_flows(db: Session, wallet_id: int = None, start_date=None):
+    """SELECT of (wallet_id, day, income, expense, transfers_in, transfers_out) per transaction side."""
+    sides = (
+        (models.Income, models.Income.wallet_id, 0),
+        (models.Expense, models.Expense.wallet_id, 1),
+        (models.WalletTransfer, models.WalletTransfer.target_wallet_id, 2),
+        (models.WalletTransfer, models.WalletTransfer.source_wallet_id, 3),
+    )
+    selects = []
+    for model, wallet_column, position in sides:
+        amounts = [model.amount if index == position else literal(0) for index in range(len(COLUMNS))]
+        source = select(
+            wallet_column.label("wallet_id"), ledger.day_bucket(db, model.date).label("day"),
+            *(amount.label(name) for amount, name in zip(amounts, COLUMNS))
+        )
+        if wallet_id is not None:
+            source = source.where(wallet_column == wallet_id)
+        if start_date is not None:
+            source = source.where(model.date >= start_date)
+        selects.append(source)
+    flows = union_all(*selects).subquery()
+    return select(
+        flows.c.wallet_id, flows.c.day, *(func.sum(flows.c[name]) for name in COLUMNS)
+    ).group_by(flows.c.wallet_id, flows.c.day)
+
+def rebuild_buckets(db: Session, wallet_id: int = None, start_month_str: str = None):
+    """
+    Recomputes the daily buckets from the transaction tables for one wallet
+    (or every wallet) from start_month_str onwards (or all history), then the
+    yearly buckets from the daily ones for every year from start_month_str's.
+    Set-based: one DELETE plus one INSERT ... SELECT per level. Does not commit.
+    """
+    daily = models.WalletDailyTotal
+    yearly = models.WalletYearlyTotal
+    start_date = ledger.get_month_bounds(start_month_str)[0] if start_month_str is not None else None
+
+    clear_days = delete(daily)
+    clear_years = delete(yearly)
+    if wallet_id is not None:
+        clear_days = clear_days.where(daily.wallet_id == wallet_id)
+        clear_years = clear_years.where(yearly.wallet_id == wallet_id)
+    if start_date is not None:
+        clear_days = clear_days.where(daily.day >= day_key(start_date))
+        clear_years = clear_years.where(yearly.year >= start_month_str[:4])
+    db.execute(clear_days)
+    db.execute(clear_years)
+
+    db.execute(daily.__table__.insert().from_select(
+        ["wallet_id", "day", *COLUMNS], _daily_flows(db, wallet_id, start_date)
+    ))
+
+    year = func.substr(daily.day, 1, 4)
+    source = select(daily.wallet_id, year, *(func.sum(getattr(daily, name)) for name in COLUMNS))
+    if wallet_id is not None:
+        source = source.where(daily.wallet_id == wallet_id)
+    if start_month_str is not None:
+        source = source.where(daily.day >= f"{start_month_str[:4]}-01-01")
+    db.execute(yearly.__table__.insert().from_select(
+        ["wallet_id", "year", *COLUMNS], source.group_by(daily.wallet_id, year)
+    ))
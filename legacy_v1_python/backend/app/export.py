@@ -0,0 +1,160 @@
+import argparse
+import csv
+import heapq
+import io
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from backend.database import models
+from backend.database.database import SessionLocal
+from . import history, schemas
+
+EXPORT_BATCH_SIZE = int(os.getenv("SPENDWISE_EXPORT_BATCH_SIZE", "1000"))
+
+COLUMNS = ["date", "kind", "id", "wallet_id", "target_wallet_id", "amount", "category", "description"]
+
+# format -> media type
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "columnar": "application/x-ndjson",
+}
+
+def _stream(db: Session, model, kind: str, wallet_column, wallet_id: int, start, end, exclude_source=None):
+    """
+    One wallet's rows of one table in (date, id) order through a server-side
+    cursor, fetched yield_per rows at a time. Yields (sort key, row tuple).
+    """
+    rank = history.KIND_RANKS[kind]
+    if model is models.WalletTransfer:
+        columns = (model.id, model.date, model.source_wallet_id, model.target_wallet_id, model.amount, model.description)
+    else:
+        columns = (model.id, model.date, model.wallet_id, model.amount, model.category, model.description)
+    stmt = select(*columns).where(wallet_column == wallet_id)
+    if start is not None:
+        stmt = stmt.where(model.date >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        stmt = stmt.where(model.date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if exclude_source is not None:
+        stmt = stmt.where(model.source_wallet_id != exclude_source)
+    stmt = stmt.order_by(model.date, model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    for row in db.execute(stmt):
+        if model is models.WalletTransfer:
+            row_id, when, source, target, amount, description = row
+            yield (when, rank, row_id), (when.isoformat(), kind, row_id, source, target, amount, None, description)
+        else:
+            row_id, when, wallet, amount, category, description = row
+            yield (when, rank, row_id), (when.isoformat(), kind, row_id, wallet, None, amount, category, description)
+
+def iter_rows(db: Session, wallet_ids: list, start: Optional[date] = None, end: Optional[date] = None, all_wallets: bool = True) -> Iterator[tuple]:
+    """
+    Every income, expense and transfer on wallet_ids in (date, kind, id)
+    order, as tuples matching COLUMNS with amounts in cents. Each (table,
+    wallet) stream walks the history index in order and the streams are
+    merged lazily, so memory stays at one batch per stream.
+    all_wallets says wallet_ids is everything the user owns; then each
+    transfer is read once from its source side.
+    """
+    streams = []
+    for wallet_id in wallet_ids:
+        streams.append(_stream(db, models.Income, history.INCOME, models.Income.wallet_id, wallet_id, start, end))
+        streams.append(_stream(db, models.Expense, history.EXPENSE, models.Expense.wallet_id, wallet_id, start, end))
+        streams.append(_stream(db, models.WalletTransfer, history.TRANSFER, models.WalletTransfer.source_wallet_id, wallet_id, start, end))
+        if not all_wallets:
+            streams.append(_stream(
+                db, models.WalletTransfer, history.TRANSFER, models.WalletTransfer.target_wallet_id, wallet_id, start, end,
+                exclude_source=wallet_id,
+            ))
+    for _, row in heapq.merge(*streams, key=lambda entry: entry[0]):
+        yield row
+
+def _batches(rows: Iterator[tuple], size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _amount(cents: int) -> str:
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{abs(cents) // schemas.MINOR_UNITS}.{abs(cents) % schemas.MINOR_UNITS:02d}"
+
+def _csv(batches) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows(row[:5] + (_amount(row[5]),) + row[6:] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _ndjson(batches) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(COLUMNS, row[:5] + (schemas.from_minor_units(row[5]),) + row[6:]))) + "\n"
+            for row in batch
+        )
+
+def _columnar(batches) -> Iterator[str]:
+    """
+    A header line naming the columns, then one line per batch holding a list
+    of column arrays. Amounts stay integer cents here.
+    """
+    yield json.dumps({"format": "spendwise-columnar", "version": 1, "columns": COLUMNS, "amount_unit": "cents"}) + "\n"
+    for batch in batches:
+        yield json.dumps([list(column) for column in zip(*batch)], separators=(",", ":")) + "\n"
+
+WRITERS = {
+    "csv": _csv,
+    "ndjson": _ndjson,
+    "columnar": _columnar,
+}
+
+def export(format: str, wallet_ids: list, start: Optional[date] = None, end: Optional[date] = None, all_wallets: bool = True, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """
+    Renders the export as text chunks, one per batch of rows. Opens its own
+    session, since a streamed response outlives the request's dependencies.
+    """
+    db = SessionLocal()
+    try:
+        rows = iter_rows(db, wallet_ids, start, end, all_wallets)
+        yield from WRITERS[format](_batches(rows, batch_size))
+    finally:
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a user's transactions.")
+    parser.add_argument("email")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat)
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    with SessionLocal() as db:
+        user = db.query(models.User).filter(models.User.email == args.email).first()
+        if user is None:
+            parser.error(f"no user {args.email}")
+        wallet_ids = [wallet.id for wallet in user.wallets]
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for chunk in export(args.format, wallet_ids, args.start, args.end):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+HASH_WORKERS = int(os.getenv("SPENDWISE_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("SPENDWISE_HASH_MAX_PENDING", "64"))
+BCRYPT_ROUNDS = int(os.getenv("SPENDWISE_BCRYPT_ROUNDS", "12"))
+
+class HashingOverloaded(Exception):
+    """Raised when more hashing jobs are waiting than HASH_MAX_PENDING allows."""
+
+@lru_cache(maxsize=None)
+def _crypt_context(rounds: int):
+    from passlib.context import CryptContext
+    # Pinning min/max to the configured cost flags any hash made with another cost for rehash
+    return CryptContext(
+        schemes=["bcrypt"], deprecated="auto",
+        bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds,
+    )
+
+# Module-level so they can be pickled into the worker processes
+def _hash(password: str, rounds: int) -> str:
+    return _crypt_context(rounds).hash(password)
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int):
+    return _crypt_context(rounds).verify_and_update(password, hashed_password)
+
+class HashingPool:
+    """
+    Runs bcrypt in a dedicated process pool so hashing neither holds the GIL
+    nor ties up the request threadpool. With workers=0 the work runs on the
+    event loop's default executor instead (useful where processes can't be spawned).
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING, rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and self.workers > 0:
+                # spawn: forking a process that already runs threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HashingOverloaded()
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            latency = time.perf_counter() - started
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._total_latency += latency
+                self._max_latency = max(self._max_latency, latency)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """Returns (valid, new_hash); new_hash is set when the stored hash uses another cost."""
+        valid, new_hash = await self._run(_verify_and_update, password, hashed_password, self.rounds)
+        if new_hash:
+            with self._lock:
+                self._rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "queue_depth": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "rehashed": self._rehashed,
+                "avg_latency_ms": (self._total_latency / self._completed * 1000) if self._completed else 0.0,
+                "max_latency_ms": self._max_latency * 1000,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+pool = HashingPool()
@@ -0,0 +1,126 @@
+import base64
+import heapq
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from backend.database import models
+
+INCOME = "income"
+EXPENSE = "expense"
+TRANSFER = "transfer"
+
+# Tiebreak between kinds on the same date, so (date, rank, id) is a total order
+KIND_RANKS = {INCOME: 0, EXPENSE: 1, TRANSFER: 2}
+
+MAX_PAGE_SIZE = 200
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(key) -> str:
+    when, rank, row_id = key
+    raw = f"{when.isoformat()}|{rank}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        when, rank, row_id = raw.split("|")
+        return datetime.fromisoformat(when), int(rank), int(row_id)
+    except ValueError as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+def _stream(db: Session, model, kind: str, wallet_column, wallet_id: int, after, filters: list, limit: int):
+    """
+    One wallet's rows of one table in (date, id) descending order, resuming
+    after the cursor. Seeks the (wallet, date, id) history index, so the cost
+    does not depend on how deep the cursor is.
+    """
+    rank = KIND_RANKS[kind]
+    query = db.query(model).filter(wallet_column == wallet_id, *filters)
+    if after is not None:
+        when, after_rank, after_id = after
+        if rank < after_rank:
+            query = query.filter(model.date <= when)
+        elif rank > after_rank:
+            query = query.filter(model.date < when)
+        else:
+            # The plain bound lets the index seek; the OR only trims ties on that date
+            query = query.filter(model.date <= when, or_(model.date < when, and_(model.date == when, model.id < after_id)))
+    rows = query.order_by(model.date.desc(), model.id.desc()).limit(limit)
+    return (((row.date, rank, row.id), kind, row) for row in rows)
+
+def list_transactions(
+    db: Session,
+    wallet_ids: list,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    kind: Optional[str] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[int] = None,
+    max_amount: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> dict:
+    """
+    Newest-first page of incomes, expenses and transfers on wallet_ids,
+    ordered by (date, kind, id). Each table and wallet is read as its own
+    ordered stream of at most limit + 1 rows and the streams are merged, so
+    a page costs the same however far into the history it is.
+    Returns {"items": [...], "next_cursor": str or None}.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    def filters(model):
+        conditions = []
+        if min_amount is not None:
+            conditions.append(model.amount >= min_amount)
+        if max_amount is not None:
+            conditions.append(model.amount <= max_amount)
+        if start is not None:
+            conditions.append(model.date >= datetime.combine(start, datetime.min.time()))
+        if end is not None:
+            conditions.append(model.date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        if category is not None and model is not models.WalletTransfer:
+            conditions.append(model.category == category)
+        return conditions
+
+    streams = []
+    for wallet_id in wallet_ids:
+        if kind in (None, INCOME):
+            streams.append(_stream(db, models.Income, INCOME, models.Income.wallet_id, wallet_id, after, filters(models.Income), limit + 1))
+        if kind in (None, EXPENSE):
+            streams.append(_stream(db, models.Expense, EXPENSE, models.Expense.wallet_id, wallet_id, after, filters(models.Expense), limit + 1))
+        # Transfers have no category
+        if kind in (None, TRANSFER) and category is None:
+            transfer_filters = filters(models.WalletTransfer)
+            streams.append(_stream(db, models.WalletTransfer, TRANSFER, models.WalletTransfer.source_wallet_id, wallet_id, after, transfer_filters, limit + 1))
+            streams.append(_stream(db, models.WalletTransfer, TRANSFER, models.WalletTransfer.target_wallet_id, wallet_id, after, transfer_filters, limit + 1))
+
+    items = []
+    seen = set()
+    last_key = None
+    # A transfer between two listed wallets arrives from both sides
+    merged = heapq.merge(*streams, key=lambda entry: entry[0], reverse=True)
+    for key, entry_kind, row in merged:
+        if key in seen:
+            continue
+        seen.add(key)
+        if len(items) == limit:
+            return {"items": items, "next_cursor": encode_cursor(last_key)}
+        items.append(transaction_item(entry_kind, row))
+        last_key = key
+    return {"items": items, "next_cursor": None}
+
+def transaction_item(kind: str, row) -> dict:
+    if kind == TRANSFER:
+        return {
+            "id": row.id, "kind": kind, "wallet_id": row.source_wallet_id, "target_wallet_id": row.target_wallet_id,
+            "amount": row.amount, "date": row.date, "category": None, "description": row.description,
+        }
+    return {
+        "id": row.id, "kind": kind, "wallet_id": row.wallet_id, "target_wallet_id": None,
+        "amount": row.amount, "date": row.date, "category": row.category, "description": row.description,
+    }
@@ -0,0 +1,95 @@
+import csv
+import re
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple
+from pydantic import BaseModel, ValidationError
+from backend.app import schemas
+from backend.app.ingest import INCOME, EXPENSE, TRANSFER
+
+DEFAULT_CATEGORY = "Imported"
+
+class InvalidImportRow(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+def _build(line: int, kind: str, data: dict) -> Tuple[str, BaseModel]:
+    schema = {
+        INCOME: schemas.IncomeCreate,
+        EXPENSE: schemas.ExpenseCreate,
+        TRANSFER: schemas.TransferCreate,
+    }.get(kind)
+    if schema is None:
+        raise InvalidImportRow(line, f"unknown transaction type '{kind}'")
+    try:
+        return kind, schema(**data)
+    except ValidationError as e:
+        raise InvalidImportRow(line, str(e.errors()[0]["msg"]))
+
+def parse_csv(lines: Iterable[str], default_wallet_id: Optional[int] = None) -> Iterator[Tuple[str, BaseModel]]:
+    """
+    Streams records from a CSV with a header row. Columns: date, amount and
+    optionally type (income/expense/transfer), wallet_id, target_wallet_id,
+    category, description. Without a type column, negative amounts are
+    expenses and positive ones incomes, as in most bank statement exports.
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        line = reader.line_num
+        row = {key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+        try:
+            amount = float(row.get("amount", ""))
+        except ValueError:
+            raise InvalidImportRow(line, "amount is not a number")
+        kind = row.get("type", "").lower() or (EXPENSE if amount < 0 else INCOME)
+        wallet_id = row.get("wallet_id") or default_wallet_id
+        if wallet_id is None:
+            raise InvalidImportRow(line, "wallet_id is required")
+
+        data = {"amount": abs(amount), "date": row.get("date"), "description": row.get("description") or None}
+        if kind == TRANSFER:
+            data.update(source_wallet_id=wallet_id, target_wallet_id=row.get("target_wallet_id"))
+        else:
+            data.update(wallet_id=wallet_id, category=row.get("category") or DEFAULT_CATEGORY)
+        yield _build(line, kind, data)
+
+_OFX_TAG = re.compile(r"<(/?)([A-Z0-9.]+)>([^<\r\n]*)")
+
+def _parse_ofx_date(value: str) -> datetime:
+    # OFX dates look like 20250114 or 20250114120000[-5:EST]
+    if len(value) >= 14 and value[:14].isdigit():
+        return datetime.strptime(value[:14], "%Y%m%d%H%M%S")
+    return datetime.strptime(value[:8], "%Y%m%d")
+
+def parse_ofx(lines: Iterable[str], wallet_id: int) -> Iterator[Tuple[str, BaseModel]]:
+    """
+    Streams <STMTTRN> entries from an OFX/QFX statement (SGML or XML flavour)
+    into incomes (credits) and expenses (debits) on wallet_id.
+    """
+    current = None
+    for line_number, line in enumerate(lines, start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            if tag == "STMTTRN":
+                if not closing:
+                    current = {"line": line_number}
+                elif current is not None:
+                    yield _ofx_record(current, wallet_id)
+                    current = None
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+def _ofx_record(entry: dict, wallet_id: int) -> Tuple[str, BaseModel]:
+    line = entry["line"]
+    try:
+        amount = float(entry.get("TRNAMT", ""))
+        date = _parse_ofx_date(entry.get("DTPOSTED", ""))
+    except ValueError:
+        raise InvalidImportRow(line, "invalid TRNAMT or DTPOSTED")
+    description = " ".join(filter(None, [entry.get("NAME"), entry.get("MEMO")])) or None
+    return _build(line, EXPENSE if amount < 0 else INCOME, {
+        "wallet_id": wallet_id,
+        "amount": abs(amount),
+        "date": date,
+        "category": entry.get("TRNTYPE", "").title() or DEFAULT_CATEGORY,
+        "description": description,
+    })
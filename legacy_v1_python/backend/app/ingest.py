@@ -0,0 +1,103 @@
+from typing import Iterable, Tuple
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from backend.database import models
+from backend.app import ledger, buckets, rollups
+
+INCOME = "income"
+EXPENSE = "expense"
+TRANSFER = "transfer"
+
+MODELS = {
+    INCOME: models.Income,
+    EXPENSE: models.Expense,
+    TRANSFER: models.WalletTransfer,
+}
+
+# Record kinds that feed the category rollups
+ROLLUP_KINDS = {
+    INCOME: rollups.INCOME,
+    EXPENSE: rollups.EXPENSE,
+}
+
+class UnknownWallet(Exception):
+    """A record references a wallet the importing user does not own."""
+
+    def __init__(self, wallet_id: int):
+        super().__init__(f"Wallet {wallet_id} not found")
+        self.wallet_id = wallet_id
+
+def _wallet_ids(kind: str, record: BaseModel):
+    if kind == TRANSFER:
+        return (record.source_wallet_id, record.target_wallet_id)
+    return (record.wallet_id,)
+
+def ingest_transactions(db: Session, user_id: int, owned_wallet_ids, records: Iterable[Tuple[str, BaseModel]], batch_size: int = 1000) -> dict:
+    """
+    Inserts a stream of (kind, schema) records in a single transaction.
+    Rows are written with executemany in batches, then each affected wallet's
+    ledgers are recomputed once from its earliest touched month through its
+    latest one, and user_id's category rollups get one upsert per touched
+    (kind, month, category), the time buckets one per touched (wallet, day). Balance checks are not applied: imported statements record
+    what already happened.
+    Raises UnknownWallet (after rolling back) if a record references a wallet
+    outside owned_wallet_ids.
+    """
+    owned = set(owned_wallet_ids)
+    counts = {INCOME: 0, EXPENSE: 0, TRANSFER: 0}
+    # wallet_id -> [earliest month, latest month]
+    touched = {}
+    # (kind, month, category) -> amount for the category rollups
+    category_totals = {}
+    # (wallet_id, day) -> [income, expense, transfers in, transfers out] for the time buckets
+    bucket_totals = {}
+    batches = {INCOME: [], EXPENSE: [], TRANSFER: []}
+
+    def flush(kind):
+        if batches[kind]:
+            db.bulk_insert_mappings(MODELS[kind], batches[kind])
+            counts[kind] += len(batches[kind])
+            batches[kind] = []
+
+    try:
+        for kind, record in records:
+            month_str = record.date.strftime("%Y-%m")
+            for wallet_id in _wallet_ids(kind, record):
+                if wallet_id not in owned:
+                    raise UnknownWallet(wallet_id)
+                span = touched.setdefault(wallet_id, [month_str, month_str])
+                span[0] = min(span[0], month_str)
+                span[1] = max(span[1], month_str)
+
+            day = buckets.day_key(record.date)
+            if kind == TRANSFER:
+                bucket_totals.setdefault((record.source_wallet_id, day), [0, 0, 0, 0])[3] += record.amount
+                bucket_totals.setdefault((record.target_wallet_id, day), [0, 0, 0, 0])[2] += record.amount
+            else:
+                bucket_totals.setdefault((record.wallet_id, day), [0, 0, 0, 0])[0 if kind == INCOME else 1] += record.amount
+
+            if kind in ROLLUP_KINDS:
+                key = (ROLLUP_KINDS[kind], month_str, record.category)
+                category_totals[key] = category_totals.get(key, 0) + record.amount
+
+            batches[kind].append(record.model_dump())
+            if len(batches[kind]) >= batch_size:
+                flush(kind)
+        for kind in batches:
+            flush(kind)
+
+        for wallet_id, (start_month, end_month) in touched.items():
+            ledger.cascade_recalculation(db, wallet_id, start_month, end_month_str=end_month, commit=False)
+        rollups.add_to_rollups(db, user_id, category_totals)
+        buckets.add_to_buckets(db, bucket_totals)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {
+        "incomes": counts[INCOME],
+        "expenses": counts[EXPENSE],
+        "transfers": counts[TRANSFER],
+        "recalculated_wallets": len(touched),
+    }
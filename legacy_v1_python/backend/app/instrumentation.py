@@ -0,0 +1,313 @@
+import bisect
+import heapq
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their statement breakdown
+SLOW_REQUEST_MS = float(os.getenv("SPENDWISE_SLOW_REQUEST_MS", "500"))
+SLOWEST_STATEMENTS = int(os.getenv("SPENDWISE_SLOWEST_STATEMENTS", "5"))
+
+# Sampling profiler: off unless a threshold is set
+PROFILE_THRESHOLD_MS = os.getenv("SPENDWISE_PROFILE_THRESHOLD_MS")
+PROFILE_INTERVAL_MS = float(os.getenv("SPENDWISE_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("SPENDWISE_PROFILE_DIR", "profiles")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+class RequestStats:
+    """Database work done on behalf of one request."""
+    __slots__ = ("statements", "db_seconds", "commits", "slowest")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.commits = 0
+        # Min-heap of (seconds, statement), the slowest SLOWEST_STATEMENTS kept
+        self.slowest = []
+
+    def record(self, statement: str, seconds: float):
+        self.statements += 1
+        self.db_seconds += seconds
+        if len(self.slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+# Set by the middleware; copied into threadpool calls and SQLAlchemy's async greenlets
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+_instrumented = set()
+
+def instrument_engine(engine):
+    """
+    Times every statement and counts commits on engine, charging them to the
+    request that issued them. Work outside a request (the recalculation
+    workers, migrations) is not counted. Safe to call twice for one engine.
+    """
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["statement_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("statement_started"):
+            conn.info["statement_started"].pop()
+
+    @event.listens_for(engine, "commit")
+    def commit(conn):
+        stats = _current.get()
+        if stats is not None:
+            stats.commits += 1
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Metrics:
+    """
+    Per-route request metrics in the Prometheus text format: request counts by
+    status, latency and statements-per-request histograms, and DB time and
+    commit totals. Routes are their templates (/stats/range, not the URL), so
+    the series count stays bounded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = Counter()
+        self._latency = {}
+        self._statements = {}
+        self._db_seconds = Counter()
+        self._commits = Counter()
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        with self._lock:
+            self._requests[(method, route, status)] += 1
+            self._latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self._statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+            self._db_seconds[key] += stats.db_seconds
+            self._commits[key] += stats.commits
+
+    def render(self, components: dict = None) -> str:
+        """
+        The exposition text. components maps a name to a stats() dict whose
+        numeric values are exported as spendwise_<name>_<key>.
+        """
+        lines = []
+        with self._lock:
+            lines += ["# HELP http_requests_total Requests by route and status.", "# TYPE http_requests_total counter"]
+            for (method, route, status), count in sorted(self._requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_label(route)}",status="{status}"}} {count}')
+            for name, help_text, histograms in (
+                ("http_request_duration_seconds", "Request latency.", self._latency),
+                ("http_request_db_statements", "SQL statements issued per request.", self._statements),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, route), histogram in sorted(histograms.items()):
+                    lines += histogram.render(name, f'method="{method}",route="{_label(route)}"')
+            for name, help_text, totals in (
+                ("http_request_db_seconds_total", "Time spent in SQL statements.", self._db_seconds),
+                ("http_request_db_commits_total", "Commits issued by requests.", self._commits),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (method, route), total in sorted(totals.items()):
+                    lines.append(f'{name}{{method="{method}",route="{_label(route)}"}} {total}')
+
+        for component, stats in (components or {}).items():
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"spendwise_{component}_{key}"
+                lines += [f"# TYPE {name} untyped", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            for series in (self._requests, self._latency, self._statements, self._db_seconds, self._commits):
+                series.clear()
+
+# Leaf frames of threads that are parked rather than working
+IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get")}
+
+class _Profile:
+    __slots__ = ("samples",)
+
+    def __init__(self):
+        self.samples = Counter()
+
+class SamplingProfiler:
+    """
+    While profiled requests are in flight, a background thread samples the
+    stack of every busy thread each interval. A request that ends above the
+    threshold has its samples written to directory as folded stacks
+    ("frame;frame;frame count" lines), the input flamegraph.pl and speedscope
+    take. Samples are per process, not per request: under concurrent load a
+    profile also contains whatever else was running, so profile one request
+    at a time for a clean picture.
+    """
+
+    def __init__(self, threshold_ms: float, interval_ms: float = PROFILE_INTERVAL_MS, directory: str = PROFILE_DIR):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.directory = Path(directory)
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self) -> _Profile:
+        profile = _Profile()
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def end(self, profile: _Profile, seconds: float, method: str, route: str) -> Optional[Path]:
+        """Stops sampling for profile; returns the file written, if it was slow enough."""
+        with self._lock:
+            self._active.discard(profile)
+        if seconds < self.threshold or not profile.samples:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = self.directory / f"{time.strftime('%Y%m%dT%H%M%S')}-{int(seconds * 1000)}ms-{method}-{slug}.folded"
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in profile.samples.most_common()))
+        return path
+
+    def _stacks(self) -> list:
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks.append(";".join(reversed(names)))
+        return stacks
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            stacks = self._stacks()
+            for profile in active:
+                profile.samples.update(stacks)
+
+metrics = Metrics()
+profiler = SamplingProfiler(float(PROFILE_THRESHOLD_MS)) if PROFILE_THRESHOLD_MS else None
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths are collapsed so scanners can't blow up the series count
+    return getattr(route, "path", None) or "unmatched"
+
+class InstrumentationMiddleware:
+    """
+    Measures each HTTP request: latency, SQL statement count, DB time and
+    commits (via instrument_engine's hooks) go into metrics, and the response
+    carries them in a Server-Timing header. Slow requests are logged with
+    their slowest statements, and profiled when the profiler is on.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        profile = profiler.begin() if profiler else None
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} statements", total;dur={elapsed * 1000:.2f}',
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            method, route = scope["method"], _route(scope)
+            metrics.observe(method, route, status, elapsed, stats)
+            if profile is not None:
+                path = profiler.end(profile, elapsed, method, route)
+                if path is not None:
+                    logger.info("Profiled %s %s (%.0f ms) to %s", method, route, elapsed * 1000, path)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s: %.0f ms, %d statements, %.0f ms in the database, %d commits; slowest: %s",
+                    method, route, elapsed * 1000, stats.statements, stats.db_seconds * 1000, stats.commits,
+                    "; ".join(f"{seconds * 1000:.1f} ms {' '.join(sql.split())[:200]}" for seconds, sql in sorted(stats.slowest, reverse=True)),
+                )
@@ -1,8 +1,26 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy import func, case, or_, and_, select, update, insert, literal, exists, bindparam, union_all
+from datetime import date, datetime, timedelta
+import functools
+import os
 from backend.database import models
 
+CLOSE_MONTH_CHUNK_SIZE = int(os.getenv("SPENDWISE_CLOSE_MONTH_CHUNK_SIZE", "500"))
+LEDGER_WRITE_RETRIES = int(os.getenv("SPENDWISE_LEDGER_WRITE_RETRIES", "5"))
+
+# Flow columns shared by the monthly ledgers and the daily and yearly buckets
+FLOW_COLUMNS = ("total_income", "total_expense", "total_transfers_in", "total_transfers_out")
+
+class InsufficientFunds(Exception):
+    def __init__(self, wallet_id: int):
+        super().__init__(f"Insufficient funds in wallet {wallet_id}")
+        self.wallet_id = wallet_id
+
+class LedgerConflict(Exception):
+    def __init__(self, wallet_id: int):
+        super().__init__(f"Wallet {wallet_id} is being updated concurrently, retry")
+        self.wallet_id = wallet_id
+
 def get_previous_month(month_str: str) -> str:
     """Returns YYYY-MM for the previous month."""
     dt = datetime.strptime(month_str, "%Y-%m")
@@ -15,11 +33,39 @@ def get_next_month(month_str: str) -> str:
     next_month = (dt.replace(day=1) + timedelta(days=32)).replace(day=1)
     return next_month.strftime("%Y-%m")
 
+def get_month_bounds(month_str: str):
+    """Returns (first day of month, first day of next month) for YYYY-MM."""
+    start_date = datetime.strptime(month_str, "%Y-%m").replace(day=1)
+    next_month = (start_date + timedelta(days=32)).replace(day=1)
+    return start_date, next_month
+
+def month_bucket(db: Session, column):
+    """SQL expression truncating a DateTime column to YYYY-MM for GROUP BY."""
+    if db.bind.dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM")
+    return func.strftime("%Y-%m", column)
+
+def day_bucket(db: Session, column):
+    """SQL expression truncating a DateTime column to YYYY-MM-DD for GROUP BY."""
+    if db.bind.dialect.name == "postgresql":
+        return func.to_char(column, "YYYY-MM-DD")
+    return func.date(column)
+
+def _nearest_prior_ledger(db: Session, wallet_id: int, month_str: str):
+    """
+    The wallet's latest ledger before month_str, or None. Months without
+    activity have no ledger, so this is not necessarily the previous month.
+    """
+    return db.query(models.WalletMonthlyBalance).filter(
+        models.WalletMonthlyBalance.wallet_id == wallet_id,
+        models.WalletMonthlyBalance.month < month_str
+    ).order_by(models.WalletMonthlyBalance.month.desc()).first()
+
 def get_or_create_monthly_balance(db: Session, wallet_id: int, month_str: str) -> models.WalletMonthlyBalance:
     """
     Retrieves the ledger for a specific wallet and month.
-    If it doesn't exist, it creates it, carrying over the closing balance 
-    from the previous month as the opening balance.
+    If it doesn't exist, it creates it, carrying over the closing balance and
+    running totals of the nearest prior ledger, like resolve_monthly_balances.
     """
     ledger = db.query(models.WalletMonthlyBalance).filter(
         models.WalletMonthlyBalance.wallet_id == wallet_id,
@@ -29,137 +75,674 @@ def get_or_create_monthly_balance(db: Session, wallet_id: int, month_str: str) -
     if ledger:
         return ledger
 
-    prev_month_str = get_previous_month(month_str)
-    
-    # Try to find previous month record
-    prev_ledger = db.query(models.WalletMonthlyBalance).filter(
-        models.WalletMonthlyBalance.wallet_id == wallet_id,
-        models.WalletMonthlyBalance.month == prev_month_str
-    ).first()
+    prev_ledger = _nearest_prior_ledger(db, wallet_id, month_str)
     
-    opening_balance = 0.0
+    opening_balance = 0
+    cumulative_income = 0
+    cumulative_expense = 0
     
     if prev_ledger:
         opening_balance = prev_ledger.closing_balance
+        cumulative_income = prev_ledger.cumulative_income
+        cumulative_expense = prev_ledger.cumulative_expense
         
     new_ledger = models.WalletMonthlyBalance(
         wallet_id=wallet_id,
         month=month_str,
         opening_balance=opening_balance,
-        total_income=0.0,
-        total_expense=0.0,
-        total_transfers_in=0.0,
-        total_transfers_out=0.0,
-        closing_balance=opening_balance
+        total_income=0,
+        total_expense=0,
+        total_transfers_in=0,
+        total_transfers_out=0,
+        closing_balance=opening_balance,
+        cumulative_income=cumulative_income,
+        cumulative_expense=cumulative_expense
     )
     db.add(new_ledger)
     db.commit()
     db.refresh(new_ledger)
     return new_ledger
 
-def update_ledger_totals(db: Session, ledger: models.WalletMonthlyBalance):
+def resolve_monthly_balances(db: Session, wallet_ids: list, month_str: str) -> dict:
     """
-    Recalculates totals for a single ledger entry based on actual transactions
-    and upates closing balance.
+    Read-only counterpart of get_or_create_monthly_balance for a set of wallets.
+    Returns {wallet_id: ledger}. Wallets without a ledger for the month get a
+    transient row derived from their nearest prior closing balance, which is
+    never added to the session, so GET paths don't take the write lock.
     """
-    dt = datetime.strptime(ledger.month, "%Y-%m")
-    start_date = dt.replace(day=1)
-    # Get first day of next month
-    next_month = (start_date + timedelta(days=32)).replace(day=1)
+    if not wallet_ids:
+        return {}
+
+    ledgers = {
+        monthly.wallet_id: monthly for monthly in db.query(models.WalletMonthlyBalance).filter(
+            models.WalletMonthlyBalance.wallet_id.in_(wallet_ids),
+            models.WalletMonthlyBalance.month == month_str
+        )
+    }
+
+    missing = [wallet_id for wallet_id in wallet_ids if wallet_id not in ledgers]
+    if not missing:
+        return ledgers
+
+    latest = db.query(
+        models.WalletMonthlyBalance.wallet_id,
+        func.max(models.WalletMonthlyBalance.month).label("month")
+    ).filter(
+        models.WalletMonthlyBalance.wallet_id.in_(missing),
+        models.WalletMonthlyBalance.month < month_str
+    ).group_by(models.WalletMonthlyBalance.wallet_id).subquery()
+
+    prior = {
+        row.wallet_id: row for row in db.query(
+            models.WalletMonthlyBalance.wallet_id,
+            models.WalletMonthlyBalance.closing_balance,
+            models.WalletMonthlyBalance.cumulative_income,
+            models.WalletMonthlyBalance.cumulative_expense
+        ).join(latest, and_(
+            models.WalletMonthlyBalance.wallet_id == latest.c.wallet_id,
+            models.WalletMonthlyBalance.month == latest.c.month
+        ))
+    }
+
+    for wallet_id in missing:
+        row = prior.get(wallet_id)
+        opening_balance = row.closing_balance if row else 0
+        ledgers[wallet_id] = models.WalletMonthlyBalance(
+            wallet_id=wallet_id,
+            month=month_str,
+            opening_balance=opening_balance,
+            total_income=0,
+            total_expense=0,
+            total_transfers_in=0,
+            total_transfers_out=0,
+            closing_balance=opening_balance,
+            cumulative_income=row.cumulative_income if row else 0,
+            cumulative_expense=row.cumulative_expense if row else 0,
+            is_closed=False
+        )
+    return ledgers
+
+def apply_ledger_delta(db: Session, wallet_id: int, month_str: str,
+                       income: int = 0, expense: int = 0,
+                       transfers_in: int = 0, transfers_out: int = 0,
+                       expected_version: int = None) -> int:
+    """
+    Applies a single transaction's amounts to an existing ledger as one atomic
+    in-place UPDATE instead of re-summing the whole month. With expected_version
+    the UPDATE only applies if the ledger is still at that version.
+    Returns the number of rows updated (0 or 1).
+    Does not commit, so the caller can keep it in the same transaction as the insert.
+    """
+    net = income - expense + transfers_in - transfers_out
+    query = db.query(models.WalletMonthlyBalance).filter(
+        models.WalletMonthlyBalance.wallet_id == wallet_id,
+        models.WalletMonthlyBalance.month == month_str
+    )
+    if expected_version is not None:
+        query = query.filter(models.WalletMonthlyBalance.version == expected_version)
+    return query.update({
+        models.WalletMonthlyBalance.total_income: models.WalletMonthlyBalance.total_income + income,
+        models.WalletMonthlyBalance.total_expense: models.WalletMonthlyBalance.total_expense + expense,
+        models.WalletMonthlyBalance.total_transfers_in: models.WalletMonthlyBalance.total_transfers_in + transfers_in,
+        models.WalletMonthlyBalance.total_transfers_out: models.WalletMonthlyBalance.total_transfers_out + transfers_out,
+        models.WalletMonthlyBalance.closing_balance: models.WalletMonthlyBalance.closing_balance + net,
+        models.WalletMonthlyBalance.cumulative_income: models.WalletMonthlyBalance.cumulative_income + income,
+        models.WalletMonthlyBalance.cumulative_expense: models.WalletMonthlyBalance.cumulative_expense + expense,
+        models.WalletMonthlyBalance.version: models.WalletMonthlyBalance.version + 1,
+    })
+
+def debit_ledger(db: Session, wallet_id: int, month_str: str, expense: int = 0, transfers_out: int = 0,
+                 retries: int = LEDGER_WRITE_RETRIES) -> models.WalletMonthlyBalance:
+    """
+    Applies an expense or outgoing transfer if the month's closing balance
+    covers it. Check and update are one compare-and-swap on the ledger's
+    version: if another writer changed the ledger after it was read, the
+    UPDATE matches nothing and the ledger is re-read and re-checked, so two
+    debits can't both pass against the same balance. No lock is held between
+    the read and the write, and writers on other wallets never conflict.
+    Raises InsufficientFunds, or LedgerConflict when every one of retries + 1
+    attempts lost a race. Does not commit.
+    """
+    amount = expense + transfers_out
+    for _ in range(retries + 1):
+        ledger = get_or_create_monthly_balance(db, wallet_id, month_str)
+        if ledger.closing_balance < amount:
+            raise InsufficientFunds(wallet_id)
+        if apply_ledger_delta(db, wallet_id, month_str, expense=expense, transfers_out=transfers_out, expected_version=ledger.version):
+            return ledger
+        # Lost the race: the next read reloads the row
+        db.expire(ledger)
+    raise LedgerConflict(wallet_id)
+
+def scan_ledger_totals(db: Session, wallet_id: int, month_str: str) -> dict:
+    """
+    Full rescan of a wallet's transactions for the month. Used for verification
+    and repair; the write path uses apply_ledger_delta.
+    """
+    start_date, next_month = get_month_bounds(month_str)
     
     total_income = db.query(func.sum(models.Income.amount)).filter(
-        models.Income.wallet_id == ledger.wallet_id,
+        models.Income.wallet_id == wallet_id,
         models.Income.date >= start_date,
         models.Income.date < next_month
-    ).scalar() or 0.0
+    ).scalar() or 0
     
     total_expense = db.query(func.sum(models.Expense.amount)).filter(
-        models.Expense.wallet_id == ledger.wallet_id,
+        models.Expense.wallet_id == wallet_id,
         models.Expense.date >= start_date,
         models.Expense.date < next_month
-    ).scalar() or 0.0
+    ).scalar() or 0
     
     total_transfers_in = db.query(func.sum(models.WalletTransfer.amount)).filter(
-        models.WalletTransfer.target_wallet_id == ledger.wallet_id,
+        models.WalletTransfer.target_wallet_id == wallet_id,
         models.WalletTransfer.date >= start_date,
         models.WalletTransfer.date < next_month
-    ).scalar() or 0.0
+    ).scalar() or 0
 
     total_transfers_out = db.query(func.sum(models.WalletTransfer.amount)).filter(
-        models.WalletTransfer.source_wallet_id == ledger.wallet_id,
+        models.WalletTransfer.source_wallet_id == wallet_id,
         models.WalletTransfer.date >= start_date,
         models.WalletTransfer.date < next_month
-    ).scalar() or 0.0
+    ).scalar() or 0
+    
+    return {
+        "total_income": total_income,
+        "total_expense": total_expense,
+        "total_transfers_in": total_transfers_in,
+        "total_transfers_out": total_transfers_out,
+    }
+
+def verify_ledger_totals(db: Session, ledger: models.WalletMonthlyBalance) -> dict:
+    """
+    Compares the incrementally maintained totals against a full rescan.
+    Returns {column: (stored, actual)} for every column that drifted.
+    """
+    totals = scan_ledger_totals(db, ledger.wallet_id, ledger.month)
+    totals["closing_balance"] = (
+        ledger.opening_balance +
+        totals["total_income"] -
+        totals["total_expense"] +
+        totals["total_transfers_in"] -
+        totals["total_transfers_out"]
+    )
+    drift = {}
+    for column, actual in totals.items():
+        stored = getattr(ledger, column)
+        if stored != actual:
+            drift[column] = (stored, actual)
+    return drift
+
+def update_ledger_totals(db: Session, ledger: models.WalletMonthlyBalance):
+    """
+    Recalculates totals for a single ledger entry based on actual transactions
+    and upates closing balance. This is the repair path for apply_ledger_delta.
+    """
+    totals = scan_ledger_totals(db, ledger.wallet_id, ledger.month)
     
-    ledger.total_income = total_income
-    ledger.total_expense = total_expense
-    ledger.total_transfers_in = total_transfers_in
-    ledger.total_transfers_out = total_transfers_out
+    ledger.cumulative_income += totals["total_income"] - ledger.total_income
+    ledger.cumulative_expense += totals["total_expense"] - ledger.total_expense
+    ledger.total_income = totals["total_income"]
+    ledger.total_expense = totals["total_expense"]
+    ledger.total_transfers_in = totals["total_transfers_in"]
+    ledger.total_transfers_out = totals["total_transfers_out"]
     
     ledger.closing_balance = (
         ledger.opening_balance + 
-        total_income - 
-        total_expense + 
-        total_transfers_in - 
-        total_transfers_out
+        ledger.total_income - 
+        ledger.total_expense + 
+        ledger.total_transfers_in - 
+        ledger.total_transfers_out
     )
+    ledger.version = models.WalletMonthlyBalance.version + 1
     
     db.commit()
     db.refresh(ledger)
     return ledger
 
-def cascade_recalculation(db: Session, wallet_id: int, start_month_str: str):
+def aggregate_monthly_totals(db: Session, wallet_id: int, start_date: datetime, end_date: datetime) -> dict:
+    """
+    Per-month totals for a wallet between start_date and end_date, as
+    {month: {column: total}}. One GROUP BY query per transaction table.
+    """
+    totals = {}
+
+    def add(month, column, value):
+        totals.setdefault(month, {})[column] = value or 0
+
+    income_month = month_bucket(db, models.Income.date)
+    for month, value in db.query(income_month, func.sum(models.Income.amount)).filter(
+        models.Income.wallet_id == wallet_id,
+        models.Income.date >= start_date,
+        models.Income.date < end_date
+    ).group_by(income_month):
+        add(month, "total_income", value)
+
+    expense_month = month_bucket(db, models.Expense.date)
+    for month, value in db.query(expense_month, func.sum(models.Expense.amount)).filter(
+        models.Expense.wallet_id == wallet_id,
+        models.Expense.date >= start_date,
+        models.Expense.date < end_date
+    ).group_by(expense_month):
+        add(month, "total_expense", value)
+
+    transfer_month = month_bucket(db, models.WalletTransfer.date)
+    for month, value_in, value_out in db.query(
+        transfer_month,
+        func.sum(case((models.WalletTransfer.target_wallet_id == wallet_id, models.WalletTransfer.amount), else_=0)),
+        func.sum(case((models.WalletTransfer.source_wallet_id == wallet_id, models.WalletTransfer.amount), else_=0))
+    ).filter(
+        or_(models.WalletTransfer.target_wallet_id == wallet_id,
+            models.WalletTransfer.source_wallet_id == wallet_id),
+        models.WalletTransfer.date >= start_date,
+        models.WalletTransfer.date < end_date
+    ).group_by(transfer_month):
+        add(month, "total_transfers_in", value_in)
+        add(month, "total_transfers_out", value_out)
+
+    return totals
+
+def cascade_recalculation(db: Session, wallet_id: int, start_month_str: str, end_month_str: str = None, commit: bool = True):
     """
     Recalculates balances starting from start_month_str and propagating to future months.
+    All affected ledgers and per-month aggregates are loaded up front, the
+    running balances are computed in memory and written back in one bulk
+    UPDATE and one commit, so the query count does not grow with the month span.
+    Missing ledgers up to end_month_str are created (bulk imports use this to
+    backfill months). Later ledgers are all propagated; a month without a
+    ledger in between carries the running balance over, as it does when
+    resolve_monthly_balances reads across it.
     """
-    current_month_str = start_month_str
     max_months = 120 # Safety limit
-    count = 0
-    
-    while count < max_months:
-        ledger = get_or_create_monthly_balance(db, wallet_id, current_month_str)
-        
-        if count > 0:
-            prev_month = get_previous_month(current_month_str)
-            prev_ledger = db.query(models.WalletMonthlyBalance).filter(
-                models.WalletMonthlyBalance.wallet_id == wallet_id,
-                models.WalletMonthlyBalance.month == prev_month
-            ).first()
-            if prev_ledger:
-                ledger.opening_balance = prev_ledger.closing_balance
-            else:
-                ledger.opening_balance = 0.0
-        
-        update_ledger_totals(db, ledger)
-        
-        # Check ahead
-        next_month_str = get_next_month(current_month_str)
-        next_exists = db.query(models.WalletMonthlyBalance).filter(
-            models.WalletMonthlyBalance.wallet_id == wallet_id,
-            models.WalletMonthlyBalance.month == next_month_str
-        ).first()
-        
-        if not next_exists:
+
+    # The ledgers from the nearest one before the start onwards, in one query
+    nearest_prior_month = select(func.max(models.WalletMonthlyBalance.month)).where(
+        models.WalletMonthlyBalance.wallet_id == wallet_id,
+        models.WalletMonthlyBalance.month < start_month_str
+    ).scalar_subquery()
+    ledgers = db.query(models.WalletMonthlyBalance).filter(
+        models.WalletMonthlyBalance.wallet_id == wallet_id,
+        models.WalletMonthlyBalance.month >= func.coalesce(nearest_prior_month, start_month_str)
+    ).order_by(models.WalletMonthlyBalance.month).limit(max_months + 1).all()
+
+    prev_ledger = ledgers.pop(0) if ledgers and ledgers[0].month < start_month_str else None
+    by_month = {monthly.month: monthly for monthly in ledgers}
+
+    created = False
+    current_month_str = start_month_str
+    while len(by_month) < max_months:
+        if current_month_str not in by_month:
+            by_month[current_month_str] = models.WalletMonthlyBalance(
+                wallet_id=wallet_id,
+                month=current_month_str,
+                opening_balance=0,
+                total_income=0,
+                total_expense=0,
+                total_transfers_in=0,
+                total_transfers_out=0,
+                closing_balance=0,
+                cumulative_income=0,
+                cumulative_expense=0
+            )
+            db.add(by_month[current_month_str])
+            created = True
+        if end_month_str is None or current_month_str >= end_month_str:
             break
-            
-        current_month_str = next_month_str
-        count += 1
+        current_month_str = get_next_month(current_month_str)
+
+    if created:
+        db.flush()
+
+    run = [by_month[month_str] for month_str in sorted(by_month)[:max_months]]
+    start_date, _ = get_month_bounds(run[0].month)
+    _, end_date = get_month_bounds(run[-1].month)
+    totals = aggregate_monthly_totals(db, wallet_id, start_date, end_date)
+
+    mappings = []
+    opening_balance = prev_ledger.closing_balance if prev_ledger else 0
+    cumulative_income = prev_ledger.cumulative_income if prev_ledger else 0
+    cumulative_expense = prev_ledger.cumulative_expense if prev_ledger else 0
+    for month_str in _month_range(run[0].month, run[-1].month):
+        month_totals = totals.get(month_str, {})
+        row = {
+            "opening_balance": opening_balance,
+            "total_income": month_totals.get("total_income", 0),
+            "total_expense": month_totals.get("total_expense", 0),
+            "total_transfers_in": month_totals.get("total_transfers_in", 0),
+            "total_transfers_out": month_totals.get("total_transfers_out", 0),
+        }
+        row["closing_balance"] = (
+            opening_balance +
+            row["total_income"] -
+            row["total_expense"] +
+            row["total_transfers_in"] -
+            row["total_transfers_out"]
+        )
+        cumulative_income += row["total_income"]
+        cumulative_expense += row["total_expense"]
+        row["cumulative_income"] = cumulative_income
+        row["cumulative_expense"] = cumulative_expense
+        opening_balance = row["closing_balance"]
+        if month_str in by_month:
+            mappings.append({"id": by_month[month_str].id, **row})
+
+    # One executemany UPDATE; the version bump is in SQL so a debit that read
+    # any of these rows before the rewrite retries
+    table = models.WalletMonthlyBalance.__table__
+    columns = [name for name in mappings[0] if name != "id"]
+    db.execute(
+        update(table).where(table.c.id == bindparam("b_id")).values(
+            {**{name: bindparam(f"b_{name}") for name in columns}, "version": table.c.version + 1}
+        ),
+        [{f"b_{name}": value for name, value in row.items()} for row in mappings],
+    )
+    # The ORM copies of these rows are stale now
+    for monthly in run:
+        db.expire(monthly)
+    if commit:
+        db.commit()
+    return len(mappings)
 
-def close_month(db: Session, month_str: str):
+def _wallet_month_sum(amount, wallet_column, wallet_id, date_column, start_date, end_date):
+    """Correlated SUM for one wallet and month; resolves to an index seek per wallet."""
+    return func.coalesce(
+        select(func.sum(amount)).where(
+            wallet_column == wallet_id,
+            date_column >= start_date,
+            date_column < end_date
+        ).scalar_subquery(),
+        0
+    )
+
+def close_wallet_range(db: Session, month_str: str, first_wallet_id: int, last_wallet_id: int) -> int:
+    """
+    Closes the open ledgers of month_str for wallets in [first_wallet_id, last_wallet_id]
+    and opens next month for them: two UPDATEs and one INSERT ... SELECT.
+    Returns the number of ledgers closed. Does not commit.
+    """
+    start_date, end_date = get_month_bounds(month_str)
+    next_month_str = get_next_month(month_str)
+    ledgers = models.WalletMonthlyBalance
+    in_chunk = (
+        ledgers.month == month_str,
+        ledgers.wallet_id >= first_wallet_id,
+        ledgers.wallet_id <= last_wallet_id,
+    )
+
+    # SET expressions see the old row, so this drops the old totals from the running ones
+    db.execute(update(ledgers).where(*in_chunk, ledgers.is_closed == False).values(
+        cumulative_income=ledgers.cumulative_income - ledgers.total_income,
+        cumulative_expense=ledgers.cumulative_expense - ledgers.total_expense,
+        total_income=_wallet_month_sum(models.Income.amount, models.Income.wallet_id, ledgers.wallet_id, models.Income.date, start_date, end_date),
+        total_expense=_wallet_month_sum(models.Expense.amount, models.Expense.wallet_id, ledgers.wallet_id, models.Expense.date, start_date, end_date),
+        total_transfers_in=_wallet_month_sum(models.WalletTransfer.amount, models.WalletTransfer.target_wallet_id, ledgers.wallet_id, models.WalletTransfer.date, start_date, end_date),
+        total_transfers_out=_wallet_month_sum(models.WalletTransfer.amount, models.WalletTransfer.source_wallet_id, ledgers.wallet_id, models.WalletTransfer.date, start_date, end_date),
+    ).execution_options(synchronize_session=False))
+
+    closed = db.execute(update(ledgers).where(*in_chunk, ledgers.is_closed == False).values(
+        closing_balance=(
+            ledgers.opening_balance +
+            ledgers.total_income -
+            ledgers.total_expense +
+            ledgers.total_transfers_in -
+            ledgers.total_transfers_out
+        ),
+        cumulative_income=ledgers.cumulative_income + ledgers.total_income,
+        cumulative_expense=ledgers.cumulative_expense + ledgers.total_expense,
+        is_closed=True,
+        version=ledgers.version + 1,
+    ).execution_options(synchronize_session=False))
+
+    table = ledgers.__table__
+    next_ledger = table.alias("next_ledger")
+    db.execute(insert(table).from_select(
+        ["wallet_id", "month", "opening_balance", "total_income", "total_expense",
+         "total_transfers_in", "total_transfers_out", "closing_balance",
+         "cumulative_income", "cumulative_expense", "is_closed"],
+        select(
+            table.c.wallet_id, literal(next_month_str), table.c.closing_balance,
+            literal(0), literal(0), literal(0), literal(0), table.c.closing_balance,
+            table.c.cumulative_income, table.c.cumulative_expense, literal(False)
+        ).where(
+            table.c.month == month_str,
+            table.c.wallet_id >= first_wallet_id,
+            table.c.wallet_id <= last_wallet_id,
+            ~exists().where(next_ledger.c.wallet_id == table.c.wallet_id, next_ledger.c.month == next_month_str)
+        )
+    ))
+    return closed.rowcount
+
+def close_month(db: Session, month_str: str, chunk_size: int = CLOSE_MONTH_CHUNK_SIZE, progress=None) -> int:
     """
     Closes the month-end for all wallets.
+    Works set-based on chunks of wallets in wallet_id order, one transaction per
+    chunk. Closed ledgers are skipped, so an interrupted run resumes from the
+    first unclosed chunk. progress(done, total) is called after each chunk.
+    Returns the number of ledgers closed.
     """
-    ledgers = db.query(models.WalletMonthlyBalance).filter(
-        models.WalletMonthlyBalance.month == month_str,
-        models.WalletMonthlyBalance.is_closed == False
-    ).all()
-    
-    for ledger in ledgers:
-        update_ledger_totals(db, ledger) 
-        ledger.is_closed = True
-        
-        # Initialize next month
-        next_month = get_next_month(month_str)
-        get_or_create_monthly_balance(db, ledger.wallet_id, next_month)
-    
-    db.commit()
+    ledgers = models.WalletMonthlyBalance
+    is_open = (ledgers.month == month_str, ledgers.is_closed == False)
+    total = db.query(func.count(ledgers.id)).filter(*is_open).scalar()
+
+    done = 0
+    last_wallet_id = None
+    while True:
+        query = db.query(ledgers.wallet_id).filter(*is_open)
+        if last_wallet_id is not None:
+            query = query.filter(ledgers.wallet_id > last_wallet_id)
+        wallet_ids = [row[0] for row in query.order_by(ledgers.wallet_id).limit(chunk_size)]
+        if not wallet_ids:
+            break
+
+        close_wallet_range(db, month_str, wallet_ids[0], wallet_ids[-1])
+        db.commit()
+
+        done += len(wallet_ids)
+        last_wallet_id = wallet_ids[-1]
+        if progress:
+            progress(done, total)
+    return done
+
+def _month_start(index: int) -> date:
+    return date(index // 12, index % 12 + 1, 1)
+
+def bucket_spans(start: date, end: date) -> dict:
+    """
+    Covers the inclusive day range start..end with the coarsest buckets:
+    whole years as yearly buckets, the whole months on either side as monthly
+    ledgers and the leftover days as daily buckets.
+    Returns {"day" | "month" | "year": [(first key, last key)]}, with at most
+    two key ranges per level.
+    """
+    spans = {"day": [], "month": [], "year": []}
+    if start > end:
+        return spans
+    # Months counted from year 0, so month and year boundaries are integer arithmetic
+    first_month = start.year * 12 + start.month - 1 + (start.day != 1)
+    last_month = end.year * 12 + end.month - 1 - ((end + timedelta(days=1)).day != 1)
+    if first_month > last_month:
+        spans["day"].append((start.isoformat(), end.isoformat()))
+        return spans
+
+    if start.day != 1:
+        spans["day"].append((start.isoformat(), (_month_start(first_month) - timedelta(days=1)).isoformat()))
+    if last_month != end.year * 12 + end.month - 1:
+        spans["day"].append((_month_start(last_month + 1).isoformat(), end.isoformat()))
+
+    def month_key(index):
+        return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+    first_year = -(-first_month // 12)
+    last_year = (last_month + 1) // 12 - 1
+    if first_year > last_year:
+        spans["month"].append((month_key(first_month), month_key(last_month)))
+        return spans
+    if first_month != first_year * 12:
+        spans["month"].append((month_key(first_month), month_key(first_year * 12 - 1)))
+    if last_month != last_year * 12 + 11:
+        spans["month"].append((month_key(last_year * 12 + 12), month_key(last_month)))
+    spans["year"].append((f"{first_year:04d}", f"{last_year:04d}"))
+    return spans
+
+BUCKET_LEVELS = ("day", "month", "year")
+
+@functools.lru_cache(maxsize=None)
+def _range_totals_statement(shape: tuple):
+    """
+    UNION ALL of one SUM per key range, shape giving the number of ranges per
+    level. One SELECT per range keeps each a seek on (wallet_id, key). There
+    are only a few shapes, so each is built once and reused with new parameters.
+    """
+    tables = {
+        "day": (models.WalletDailyTotal, models.WalletDailyTotal.day),
+        "month": (models.WalletMonthlyBalance, models.WalletMonthlyBalance.month),
+        "year": (models.WalletYearlyTotal, models.WalletYearlyTotal.year),
+    }
+    selects = []
+    for level, count in zip(BUCKET_LEVELS, shape):
+        model, key = tables[level]
+        for _ in range(count):
+            index = len(selects)
+            selects.append(select(*(func.coalesce(func.sum(getattr(model, name)), 0) for name in FLOW_COLUMNS)).where(
+                model.wallet_id.in_(bindparam("wallet_ids", expanding=True)),
+                key >= bindparam(f"first_{index}"),
+                key <= bindparam(f"last_{index}"),
+            ))
+    return union_all(*selects)
+
+def range_totals(db: Session, wallet_ids: list, start: date, end: date) -> dict:
+    """
+    Income, expense and transfer totals of a set of wallets over the
+    inclusive day range start..end, plus net (income - expense) and
+    balance_change (net with transfers). The range is read from the coarsest
+    buckets that cover it (bucket_spans): at most two partial months of daily
+    buckets, two partial years of monthly ledgers and one yearly bucket per
+    year, all as index range seeks in a single query. The cost therefore
+    follows the number of years in the range rather than its transactions.
+    """
+    totals = dict.fromkeys(FLOW_COLUMNS, 0)
+    spans = bucket_spans(start, end)
+    key_ranges = [key_range for level in BUCKET_LEVELS for key_range in spans[level]]
+    if wallet_ids and key_ranges:
+        statement = _range_totals_statement(tuple(len(spans[level]) for level in BUCKET_LEVELS))
+        params = {"wallet_ids": list(wallet_ids)}
+        for index, (first, last) in enumerate(key_ranges):
+            params[f"first_{index}"] = first
+            params[f"last_{index}"] = last
+        for row in db.execute(statement, params):
+            for name, value in zip(FLOW_COLUMNS, row):
+                totals[name] += value
+    totals["net"] = totals["total_income"] - totals["total_expense"]
+    totals["balance_change"] = totals["net"] + totals["total_transfers_in"] - totals["total_transfers_out"]
+    return totals
+
+def balance_at(db: Session, wallet_id: int, day: date) -> int:
+    """The wallet's balance at the end of day: every flow through it, summed over range_totals' buckets."""
+    return range_totals(db, [wallet_id], date.min, day)["balance_change"]
+
+RANGE_GRANULARITIES = ("day", "week", "month")
+
+def _month_range(first_month_str: str, last_month_str: str):
+    month_str = first_month_str
+    while month_str <= last_month_str:
+        yield month_str
+        month_str = get_next_month(month_str)
+
+def range_series(db: Session, wallet_ids: list, start: date, end: date, granularity: str = "month") -> dict:
+    """
+    Income, expense, net and balance for a set of wallets from start to end
+    (inclusive), as totals plus one point per day, week (keyed by its Monday)
+    or month. Month granularity covers whole months. Transfers between the
+    wallets cancel out of the balance.
+    Month ranges are served from the monthly ledgers: the balance before the
+    range from resolve_monthly_balances, then each month's ledger totals and
+    closing balance, read in one query. A month without a ledger has no flows
+    and keeps the previous balance. Day and week series read the daily buckets
+    over the range, on top of the balance before it from range_totals.
+    """
+    if granularity != "month":
+        opening_balance = range_totals(db, wallet_ids, date.min, start - timedelta(days=1))["balance_change"] if start > date.min else 0
+        series = _daily_series(db, wallet_ids, start, end, granularity, opening_balance)
+        total_income = sum(point["income"] for point in series)
+        total_expense = sum(point["expense"] for point in series)
+        return {
+            "opening_balance": opening_balance,
+            "closing_balance": series[-1]["balance"] if series else opening_balance,
+            "total_income": total_income,
+            "total_expense": total_expense,
+            "net": total_income - total_expense,
+            "series": series,
+        }
+
+    first_month = start.strftime("%Y-%m")
+    last_month = end.strftime("%Y-%m")
+    before = resolve_monthly_balances(db, wallet_ids, get_previous_month(first_month))
+
+    # wallet_id -> balance at the latest month seen; a month without a ledger
+    # has no flows and carries the wallet's balance over
+    balances = {wallet_id: monthly.closing_balance for wallet_id, monthly in before.items()}
+    ledgers = models.WalletMonthlyBalance
+    by_month = {}
+    if wallet_ids:
+        for row in db.query(
+            ledgers.wallet_id, ledgers.month, ledgers.closing_balance,
+            ledgers.total_income, ledgers.total_expense
+        ).filter(
+            ledgers.wallet_id.in_(wallet_ids),
+            ledgers.month >= first_month,
+            ledgers.month <= last_month
+        ):
+            by_month.setdefault(row.month, []).append(row)
+
+    opening_balance = sum(balances.values())
+    series = []
+    for month_str in _month_range(first_month, last_month):
+        rows = by_month.get(month_str, ())
+        for row in rows:
+            balances[row.wallet_id] = row.closing_balance
+        # Each month's own totals: the running totals of two stored rows only
+        # differ by the months between them when no month is missing
+        income = sum(row.total_income for row in rows)
+        expense = sum(row.total_expense for row in rows)
+        series.append({"period": month_str, "income": income, "expense": expense, "net": income - expense, "balance": sum(balances.values())})
+
+    total_income = sum(point["income"] for point in series)
+    total_expense = sum(point["expense"] for point in series)
+    return {
+        "opening_balance": opening_balance,
+        "closing_balance": series[-1]["balance"] if series else opening_balance,
+        "total_income": total_income,
+        "total_expense": total_expense,
+        "net": total_income - total_expense,
+        "series": series,
+    }
+
+def _daily_series(db: Session, wallet_ids: list, start: date, end: date, granularity: str, opening_balance: int) -> list:
+    """Day or week points from the daily buckets, starting from the balance before start."""
+    daily = models.WalletDailyTotal
+    flows = {}
+    if wallet_ids:
+        for day_str, *amounts in db.query(daily.day, *(func.sum(getattr(daily, name)) for name in FLOW_COLUMNS)).filter(
+            daily.wallet_id.in_(wallet_ids),
+            daily.day >= start.isoformat(),
+            daily.day <= end.isoformat()
+        ).group_by(daily.day):
+            flows[day_str] = amounts
+
+    balance = opening_balance
+    series = []
+    points = {}
+    day = start
+    while day <= end:
+        income, expense, transfers_in, transfers_out = flows.get(day.isoformat(), (0, 0, 0, 0))
+        balance += income - expense + transfers_in - transfers_out
+        period = day if granularity == "day" else day - timedelta(days=day.weekday())
+        point = points.get(period)
+        if point is None:
+            point = points[period] = {"period": period.isoformat(), "income": 0, "expense": 0, "net": 0, "balance": 0}
+            series.append(point)
+        point["income"] += income
+        point["expense"] += expense
+        point["net"] += income - expense
+        point["balance"] = balance
+        day += timedelta(days=1)
+    return series
@@ -0,0 +1,195 @@
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from backend.database import models
+from backend.database.database import WriterSessionLocal, is_sqlite
+from . import ledger
+
+logger = logging.getLogger(__name__)
+
+# SQLite runs one write transaction at a time, so worker processes only add
+# start-up cost and lock waits there; server databases close partitions in parallel
+MONTH_CLOSE_WORKERS = int(os.getenv("SPENDWISE_MONTH_CLOSE_WORKERS", "0" if is_sqlite else str(min(4, os.cpu_count() or 1))))
+MONTH_CLOSE_PARTITION_SIZE = int(os.getenv("SPENDWISE_MONTH_CLOSE_PARTITION_SIZE", str(ledger.CLOSE_MONTH_CHUNK_SIZE)))
+MONTH_CLOSE_ATTEMPTS = int(os.getenv("SPENDWISE_MONTH_CLOSE_ATTEMPTS", "3"))
+
+def plan_partitions(db: Session, month_str: str, partition_size: int = MONTH_CLOSE_PARTITION_SIZE):
+    """
+    Splits the wallets with an open ledger in month_str into wallet_id ranges
+    of up to partition_size and records them as checkpoints. A month that was
+    planned before keeps its partitions; wallets past the last planned range
+    (opened since) get new ones. Commits.
+    Returns (pending partitions as (partition, first_wallet_id, last_wallet_id), completed count).
+    """
+    checkpoints = models.MonthClosePartition
+    ledgers = models.WalletMonthlyBalance
+    last_partition, last_wallet_id = db.query(
+        func.max(checkpoints.partition), func.max(checkpoints.last_wallet_id)
+    ).filter(checkpoints.month == month_str).one()
+
+    is_open = [ledgers.month == month_str, ledgers.is_closed == False]
+    if last_wallet_id is not None:
+        is_open.append(ledgers.wallet_id > last_wallet_id)
+    # Numbering the open ledgers in wallet order cuts every range in one query
+    numbered = select(
+        ledgers.wallet_id,
+        ((func.row_number().over(order_by=ledgers.wallet_id) - 1) // partition_size).label("slot"),
+    ).where(*is_open).subquery()
+    ranges = db.execute(
+        select(numbered.c.slot, func.min(numbered.c.wallet_id), func.max(numbered.c.wallet_id))
+        .group_by(numbered.c.slot).order_by(numbered.c.slot)
+    ).all()
+    first_partition = 0 if last_partition is None else last_partition + 1
+    if ranges:
+        db.execute(models.MonthClosePartition.__table__.insert(), [
+            {"month": month_str, "partition": first_partition + slot, "first_wallet_id": first, "last_wallet_id": last}
+            for slot, first, last in ranges
+        ])
+        db.commit()
+
+    pending = db.query(checkpoints.partition, checkpoints.first_wallet_id, checkpoints.last_wallet_id).filter(
+        checkpoints.month == month_str, checkpoints.completed_at.is_(None)
+    ).order_by(checkpoints.partition).all()
+    completed = db.query(func.count()).filter(
+        checkpoints.month == month_str, checkpoints.completed_at.isnot(None)
+    ).scalar()
+    return [tuple(row) for row in pending], completed
+
+def affected_users(db: Session, month_str: str) -> list:
+    """Ids of the users with a ledger in month_str: the ones whose balances and totals a close can change."""
+    return [user_id for (user_id,) in db.query(models.Wallet.user_id).join(
+        models.WalletMonthlyBalance, models.WalletMonthlyBalance.wallet_id == models.Wallet.id
+    ).filter(models.WalletMonthlyBalance.month == month_str).distinct()]
+
+def close_partition(db: Session, month_str: str, partition: int, first_wallet_id: int, last_wallet_id: int) -> int:
+    """Closes one partition and checkpoints it in the same transaction. Returns the ledgers closed."""
+    closed = ledger.close_wallet_range(db, month_str, first_wallet_id, last_wallet_id)
+    checkpoints = models.MonthClosePartition
+    db.execute(update(checkpoints).where(
+        checkpoints.month == month_str, checkpoints.partition == partition
+    ).values(closed=closed, completed_at=datetime.now(timezone.utc)))
+    db.commit()
+    return closed
+
+# Module-level so it can be pickled into the worker processes, which open the
+# database from SPENDWISE_DATABASE_URL themselves
+def _close_partition_in_worker(month_str: str, partition: int, first_wallet_id: int, last_wallet_id: int) -> int:
+    with WriterSessionLocal() as db:
+        return close_partition(db, month_str, partition, first_wallet_id, last_wallet_id)
+
+def _run_inline(fn, *args) -> Future:
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+def run(
+    month_str: str,
+    workers: int = MONTH_CLOSE_WORKERS,
+    partition_size: int = MONTH_CLOSE_PARTITION_SIZE,
+    attempts: int = MONTH_CLOSE_ATTEMPTS,
+    session_factory=WriterSessionLocal,
+    progress=None,
+) -> dict:
+    """
+    Closes month_str for every wallet. Wallets are planned into partitions
+    (plan_partitions) that a process pool of workers closes independently,
+    each in one transaction that also checkpoints it, so a crashed or
+    interrupted run picks up at the first unfinished partition. A failing
+    partition is retried up to attempts times in total. Once every partition
+    is done, ledgers opened inside already-closed ranges meanwhile are swept
+    up by ledger.close_month. progress(done, total) is called per partition.
+
+    workers=0 closes the partitions in this process on session_factory's
+    session. Worker processes connect through WriterSessionLocal, so
+    session_factory must be bound to the same database when workers > 0.
+
+    Returns a report with the partition counts, the ledgers closed by this
+    run and its throughput in wallets per second.
+    """
+    started = time.perf_counter()
+    with session_factory() as db:
+        pending, completed = plan_partitions(db, month_str, partition_size)
+    total = len(pending) + completed
+    closed = 0
+    failed = []
+
+    executor = None
+    db = None
+    if workers > 0 and pending:
+        # spawn: forking a process that already runs threads is unsafe
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, len(pending)), mp_context=multiprocessing.get_context("spawn")
+        )
+        submit = functools.partial(executor.submit, _close_partition_in_worker, month_str)
+        # Keep every worker busy without queueing the whole month up front
+        in_flight = 2 * workers
+    else:
+        db = session_factory()
+
+        def submit(*partition):
+            future = _run_inline(close_partition, db, month_str, *partition)
+            if future.exception() is not None:
+                db.rollback()
+            return future
+        in_flight = 1
+
+    try:
+        tries = {}
+        waiting = list(reversed(pending))
+        futures = {}
+        done = completed
+        while waiting or futures:
+            while waiting and len(futures) < in_flight:
+                partition = waiting.pop()
+                futures[submit(*partition)] = partition
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                partition = futures.pop(future)
+                error = future.exception()
+                if error is not None:
+                    if tries.get(partition, 1) < attempts:
+                        tries[partition] = tries.get(partition, 1) + 1
+                        logger.warning("Month close %s partition %d failed (%s), retrying", month_str, partition[0], error)
+                        waiting.append(partition)
+                    else:
+                        logger.error("Month close %s partition %d failed %d times: %s", month_str, partition[0], attempts, error)
+                        failed.append(partition[0])
+                    continue
+                closed += future.result()
+                done += 1
+                if progress:
+                    progress(done, total)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if db is not None:
+            db.close()
+
+    if not failed:
+        with session_factory() as db:
+            closed += ledger.close_month(db, month_str)
+
+    seconds = time.perf_counter() - started
+    report = {
+        "month": month_str,
+        "partitions": total,
+        "resumed": completed,
+        "failed": sorted(failed),
+        "closed": closed,
+        "seconds": round(seconds, 3),
+        "wallets_per_second": round(closed / seconds, 1) if seconds > 0 else None,
+    }
+    logger.info(
+        "Month close %s: %d wallets closed in %.2fs (%.1f wallets/s), %d partitions, %d resumed, %d failed",
+        month_str, closed, seconds, closed / seconds if seconds > 0 else 0.0, total, completed, len(failed),
+    )
+    return report
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from backend.database import models
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("SPENDWISE_PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("SPENDWISE_PRINCIPAL_CACHE_SIZE", "10000"))
+
+@dataclass(frozen=True)
+class WalletInfo:
+    id: int
+    name: str
+    type: str
+
+@dataclass(frozen=True)
+class Principal:
+    """Authenticated user as seen by the routers: id, email and wallets, detached from any session."""
+    id: int
+    email: str
+    wallets: Tuple[WalletInfo, ...]
+
+    def get_wallet(self, wallet_id: int) -> Optional[WalletInfo]:
+        return next((wallet for wallet in self.wallets if wallet.id == wallet_id), None)
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            email=user.email,
+            wallets=tuple(WalletInfo(id=w.id, name=w.name, type=w.type) for w in user.wallets),
+        )
+
+class PrincipalCache:
+    """
+    TTL + LRU cache of principals keyed by token subject (the user's email).
+    Entries are dropped when the user or one of their wallets is written.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[subject]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, subject: str, principal: Principal):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            stale = [key for key, (principal, _) in self._entries.items() if principal.id == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+cache = PrincipalCache()
+
+# Invalidation is collected at flush and applied after commit, so a concurrent
+# request can't re-cache the pre-commit state.
+def _mark_stale(user_id):
+    def handler(mapper, connection, target):
+        session = object_session(target)
+        if session is not None and user_id(target) is not None:
+            session.info.setdefault("stale_principals", set()).add(user_id(target))
+    return handler
+
+for _event in ("after_insert", "after_update", "after_delete"):
+    event.listen(models.User, _event, _mark_stale(lambda user: user.id))
+    event.listen(models.Wallet, _event, _mark_stale(lambda wallet: wallet.user_id))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for user_id in session.info.pop("stale_principals", ()):
+        cache.invalidate_user(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("stale_principals", None)
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+RESPONSE_CACHE_BYTES = int(os.getenv("SPENDWISE_RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+# Bounds how stale an entry can get through writes this process never hears
+# about, such as a month close run by backend/worker.py; 0 keeps entries until invalidated
+RESPONSE_CACHE_TTL = float(os.getenv("SPENDWISE_RESPONSE_CACHE_TTL", "900"))
+
+# Month range bounds for entries that depend on every earlier or later month
+FIRST_MONTH = "0000-00"
+LAST_MONTH = "9999-99"
+
+# Rough per-entry bookkeeping cost counted against the memory bound
+ENTRY_OVERHEAD = 256
+
+class _Entry:
+    __slots__ = ("body", "etag", "first_month", "last_month", "size", "expires_at")
+
+    def __init__(self, body: bytes, etag: str, first_month: str, last_month: str):
+        self.body = body
+        self.etag = etag
+        self.first_month = first_month
+        self.last_month = last_month
+        self.size = len(body) + ENTRY_OVERHEAD
+        self.expires_at = None
+
+class ResponseCache:
+    """
+    Per-user LRU of serialized JSON responses, keyed by (user, endpoint, params)
+    and bounded by total body size.
+    Each entry records the span of months its result depends on; a write to a
+    month drops only the user's entries whose span covers it. A per-user
+    generation counter keeps a response computed before an invalidation from
+    being stored after it. Entries also expire ttl seconds after they are
+    stored (0: never).
+    """
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_BYTES, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, user_id: int) -> int:
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, key) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry: _Entry, generation: int):
+        user_id = key[0]
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                # Invalidated while this response was being computed
+                return
+            self._remove(key)
+            if self.ttl > 0:
+                entry.expires_at = time.monotonic() + self.ttl
+            self._entries[key] = entry
+            self._by_user.setdefault(user_id, set()).add(key)
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def invalidate(self, user_id: int, first_month: str, last_month: Optional[str] = None):
+        """Drops the user's entries that depend on any month in [first_month, last_month]."""
+        last_month = last_month or first_month
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            stale = [
+                key for key in self._by_user.get(user_id, ())
+                if self._entries[key].first_month <= last_month and first_month <= self._entries[key].last_month
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def invalidate_user(self, user_id: int):
+        self.invalidate(user_id, FIRST_MONTH, LAST_MONTH)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._generations.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+cache = ResponseCache()
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def _respond(request: Request, entry: _Entry) -> Response:
+    # no-cache: the client may store it but must revalidate with If-None-Match
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if _matches(request, entry.etag):
+        cache.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+_adapters = {}
+
+def _type_adapter(response_model) -> TypeAdapter:
+    adapter = _adapters.get(response_model)
+    if adapter is None:
+        adapter = _adapters[response_model] = TypeAdapter(response_model)
+    return adapter
+
+async def cached_response(
+    request: Request,
+    user_id: int,
+    endpoint: str,
+    params: dict,
+    months: Tuple[str, str],
+    response_model,
+    compute: Callable[[], Awaitable],
+) -> Response:
+    """
+    Serves endpoint(params) for user_id from the cache, or awaits compute(),
+    serializes it with response_model and caches it as depending on the
+    inclusive month span months. Honors If-None-Match with 304.
+    """
+    key = (user_id, endpoint, tuple(sorted(params.items())))
+    entry = cache.get(key)
+    if entry is None:
+        generation = cache.generation(user_id)
+        adapter = _type_adapter(response_model)
+        body = adapter.dump_json(adapter.validate_python(await compute()))
+        entry = _Entry(body, _etag(body), *months)
+        cache.put(key, entry, generation)
+    return _respond(request, entry)
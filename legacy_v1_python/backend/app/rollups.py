@@ -0,0 +1,70 @@
+from sqlalchemy import func, select, delete, literal
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from backend.database import models
+from . import ledger
+
+INCOME = "income"
+EXPENSE = "expense"
+
+# kind -> transaction model rolled up under it
+SOURCES = {
+    INCOME: models.Income,
+    EXPENSE: models.Expense,
+}
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        # Imported on use; SQLite deployments never load the Postgres dialect
+        from sqlalchemy.dialects import postgresql
+        return postgresql.insert(models.CategoryMonthlyTotal)
+    return sqlite.insert(models.CategoryMonthlyTotal)
+
+def add_to_rollups(db: Session, user_id: int, deltas: dict):
+    """
+    Adds amounts to the user's category totals in one executemany upsert.
+    deltas maps (kind, month, category) -> amount in cents. Does not commit.
+    """
+    if not deltas:
+        return
+    stmt = _insert(db)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "kind", "month", "category"],
+        set_={"total": models.CategoryMonthlyTotal.total + stmt.excluded.total},
+    )
+    db.execute(stmt, [
+        {"user_id": user_id, "kind": kind, "month": month, "category": category or "", "total": amount}
+        for (kind, month, category), amount in deltas.items()
+    ])
+
+def add_to_rollup(db: Session, user_id: int, kind: str, month_str: str, category: str, amount: int):
+    add_to_rollups(db, user_id, {(kind, month_str, category): amount})
+
+def rebuild_rollups(db: Session, user_id: int = None, start_month_str: str = None):
+    """
+    Recomputes category totals from the transaction tables, for one user (or
+    everyone) from start_month_str onwards (or all history). Set-based: one
+    DELETE plus one INSERT ... SELECT per kind. Does not commit.
+    """
+    rollup = models.CategoryMonthlyTotal
+    clear = delete(rollup)
+    if user_id is not None:
+        clear = clear.where(rollup.user_id == user_id)
+    if start_month_str is not None:
+        clear = clear.where(rollup.month >= start_month_str)
+    db.execute(clear)
+
+    for kind, model in SOURCES.items():
+        month = ledger.month_bucket(db, model.date)
+        category = func.coalesce(model.category, "")
+        source = select(
+            models.Wallet.user_id, literal(kind), month, category, func.sum(model.amount)
+        ).join(models.Wallet, models.Wallet.id == model.wallet_id)
+        if user_id is not None:
+            source = source.where(models.Wallet.user_id == user_id)
+        if start_month_str is not None:
+            source = source.where(model.date >= ledger.get_month_bounds(start_month_str)[0])
+        source = source.group_by(models.Wallet.user_id, month, category)
+        db.execute(rollup.__table__.insert().from_select(
+            ["user_id", "kind", "month", "category", "total"], source
+        ))
@@ -1,35 +1,56 @@
+import logging
+import anyio.from_thread
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from datetime import timedelta
 from backend.database import models
-from backend.database.database import get_db
-from backend.app import schemas, auth
+from backend.database.database import get_async_db, get_write_db, WriterSessionLocal
+from backend.app import schemas, auth, hashing
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
 )
 
+def overloaded_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+# Sync so its Session calls run on the threadpool, never on the event loop;
+# only the hashing is handed back to the loop, which awaits the hashing pool
 @router.post("/register", response_model=schemas.UserResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(user: schemas.UserCreate, db: Session = Depends(get_write_db)):
     try:
-        print(f"Attempting to register: {user.email}")
+        logger.debug("Registering %s", user.email)
         db_user = db.query(models.User).filter(models.User.email == user.email).first()
         if db_user:
             raise HTTPException(status_code=400, detail="Email already registered")
-        
-        print("Hashing password...")
+        # Release the write lock while hashing
+        db.rollback()
+
         try:
-            hashed_password = auth.get_password_hash(user.password)
-            print("Password hashed successfully")
-        except Exception as e:
-            print(f"HASHING ERROR: {e}")
-            raise e
+            hashed_password = anyio.from_thread.run(auth.get_password_hash, user.password)
+        except hashing.HashingOverloaded:
+            raise overloaded_exception()
 
         new_user = models.User(email=user.email, hashed_password=hashed_password)
         db.add(new_user)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Same email registered while we were hashing
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Email already registered")
         db.refresh(new_user)
         
         # Create default wallets (Step 4 Requirement)
@@ -39,29 +60,38 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         db.add(bank_wallet)
         db.commit()
         
-        print(f"User created: {new_user.id}, {new_user.email}, {new_user.created_at}")
-        try:
-            resp = schemas.UserResponse.model_validate(new_user)
-            print("Validation successful")
-            return resp
-        except Exception as e:
-            print(f"VALIDATION ERROR: {e}")
-            raise e
+        logger.info("Registered user %s", new_user.id)
+        return schemas.UserResponse.model_validate(new_user)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Registration of %s failed", user.email)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _store_rehash(user_id: int, new_hash: str):
+    with WriterSessionLocal() as write_db:
+        write_db.query(models.User).filter(models.User.id == user_id).update({"hashed_password": new_hash})
+        write_db.commit()
+
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(models.User).where(models.User.email == form_data.username))).scalars().first()
+    valid = False
+    if user:
+        try:
+            valid, new_hash = await auth.verify_password(form_data.password, user.hashed_password)
+        except hashing.HashingOverloaded:
+            raise overloaded_exception()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # bcrypt cost changed since this hash was made; the writer may be busy, so wait off the loop
+        await run_in_threadpool(_store_rehash, user.id, new_hash)
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
@@ -1,33 +1,45 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from backend.database import models
-from backend.database.database import get_db
-from backend.app import auth, ledger
+from backend.database.database import get_async_db
+from backend.app import auth, async_ledger, schemas, response_cache
 
 router = APIRouter(
     prefix="/dashboard",
     tags=["dashboard"],
 )
 
-@router.get("/summary")
-def get_dashboard_summary(month: str = None, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+@router.get("/summary", response_model=schemas.DashboardSummary)
+async def get_dashboard_summary(request: Request, month: str = None, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # Canonical form, so "2025-1" and "2025-01" share an entry and its invalidation
+    try:
+        month_str = datetime.strptime(month, "%Y-%m").strftime("%Y-%m") if month else datetime.now().strftime("%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+    # Opening balances carry every earlier month forward
+    return await response_cache.cached_response(
+        request, current_user.id, "dashboard.summary", {"month": month_str},
+        (response_cache.FIRST_MONTH, month_str), schemas.DashboardSummary,
+        lambda: _summary(db, current_user, month_str),
+    )
+
+async def _summary(db: AsyncSession, current_user: auth.Principal, month_str: str):
     wallets = current_user.wallets
-    month_str = month if month else datetime.now().strftime("%Y-%m")
     
     summary = {
-        "cash": {"opening": 0.0, "closing": 0.0},
-        "bank": {"opening": 0.0, "closing": 0.0},
-        "total_income": 0.0,
-        "total_expense": 0.0,
-        "total_balance": 0.0
+        "cash": {"opening": 0, "closing": 0},
+        "bank": {"opening": 0, "closing": 0},
+        "total_income": 0,
+        "total_expense": 0,
+        "total_balance": 0
     }
     
+    # Read-only: months without a ledger are derived, not created
+    ledgers = await async_ledger.resolve_monthly_balances(db, [wallet.id for wallet in wallets], month_str)
+    
     for wallet in wallets:
-        # Get ledger
-        monthly = ledger.get_or_create_monthly_balance(db, wallet.id, month_str)
-        # Maybe calling get_or_create on GET request is a bit heavy (write op), 
-        # but ensures consistency. Good for MVP.
+        monthly = ledgers[wallet.id]
         
         if wallet.type == "CASH":
             summary["cash"]["opening"] += monthly.opening_balance
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from backend.database import models
-from backend.database.database import get_db
-from backend.app import auth, ledger
+from typing import Optional
+from backend.database.database import get_async_db
+from backend.app import auth, response_cache
 
 router = APIRouter(
     prefix="/insights",
@@ -11,44 +11,26 @@ router = APIRouter(
 )
 
 @router.get("/")
-def get_insights(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    month_str = datetime.now().strftime("%Y-%m")
-    
-    total_income = 0.0
-    total_expense = 0.0
-    cash_expense = 0.0
-    bank_expense = 0.0
-    
-    insights = []
-    
-    for wallet in current_user.wallets:
-        ledger_entry = ledger.get_or_create_monthly_balance(db, wallet.id, month_str)
-        total_income += ledger_entry.total_income
-        total_expense += ledger_entry.total_expense
-        
-        if wallet.type == "CASH":
-            cash_expense += ledger_entry.total_expense
-        elif wallet.type == "BANK":
-            bank_expense += ledger_entry.total_expense
-            
-    # Rule 1: Cash Burn Rate
-    if total_income > 0:
-        burn_rate = (total_expense / total_income) * 100
-        if burn_rate > 100:
-            insights.append({"type": "warning", "message": f"You are spending {burn_rate:.1f}% of your income! (Deficit)"})
-        elif burn_rate > 80:
-            insights.append({"type": "caution", "message": f"High burn rate: {burn_rate:.1f}% of income used."})
-        else:
-            insights.append({"type": "success", "message": f"Healthy burn rate: {burn_rate:.1f}%."})
-    elif total_expense > 0:
-        insights.append({"type": "warning", "message": "Expenses detected with zero income."})
-        
-    # Rule 2: Bank Dependency
-    if total_expense > 0:
-        bank_share = (bank_expense / total_expense) * 100
-        if bank_share > 80:
-            insights.append({"type": "info", "message": f"High bank dependency: {bank_share:.1f}% of expenses via bank."})
-        elif bank_share < 20:
-            insights.append({"type": "info", "message": "Heavy cash usage detected."})
-            
-    return insights
+async def get_insights(request: Request, month: Optional[str] = None, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(get_async_db)):
+    current_month = datetime.now().strftime("%Y-%m")
+    try:
+        month_str = datetime.strptime(month, "%Y-%m").strftime("%Y-%m") if month else current_month
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+    # Baselines and balances reach back through the user's whole history
+    return await response_cache.cached_response(
+        request, current_user.id, "insights", {"month": month_str},
+        (response_cache.FIRST_MONTH, month_str), list,
+        lambda: _insights(db, current_user, month_str, max(month_str, current_month)),
+    )
+
+async def _insights(db: AsyncSession, current_user: auth.Principal, month_str: str, through_month_str: str):
+    # NumPy adds ~150 ms to import, so processes load it on their first insights request
+    from backend.app import analytics
+    # One snapshot per user serves every month's insights until the user's next write
+    generation = response_cache.cache.generation(current_user.id)
+    snapshot = analytics.snapshots.get(current_user.id, generation, month_str)
+    if snapshot is None:
+        snapshot = await db.run_sync(analytics.load_snapshot, current_user.id, current_user.wallets, through_month_str)
+        analytics.snapshots.put(current_user.id, generation, snapshot)
+    return analytics.insights(snapshot, month_str)
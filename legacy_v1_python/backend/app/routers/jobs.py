@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
-from backend.database.database import SessionLocal, get_db
-from backend.app import ledger, auth
+from backend.database.database import SessionLocal, WriterSessionLocal, get_write_db
+from backend.app import ledger, auth, buckets, hashing, month_close, principals, scheduler, schemas, response_cache, rollups
 from backend.database import models
 from sqlalchemy.orm import Session
 
@@ -9,31 +9,106 @@ router = APIRouter(
     tags=["jobs"],
 )
 
+# month -> progress of the latest month close run in this process
+month_close_progress = {}
+
 def run_month_close(month_str: str):
-    db = SessionLocal()
+    status = month_close_progress[month_str] = {"state": "running", "partitions_done": 0, "partitions": None}
+
+    def progress(done, total):
+        status.update(partitions_done=done, partitions=total)
+
+    # Inline in this worker; backend/worker.py runs the same checkpointed close on a process pool
     try:
-        ledger.close_month(db, month_str)
+        report = month_close.run(month_str, workers=0, progress=progress)
+    except Exception:
+        # Checkpointed partitions stay closed; triggering again resumes
+        status["state"] = "failed"
+        raise
     finally:
-        db.close()
+        # Closing recomputes the month's totals and balances and opens next month's
+        # ledgers. Bumping each owner's generation also retires their insight snapshots.
+        with SessionLocal() as db:
+            for user_id in month_close.affected_users(db, month_str):
+                response_cache.cache.invalidate(user_id, month_str, response_cache.LAST_MONTH)
+    status.update(report, state="failed" if report["failed"] else "done")
 
 def run_recalculation(wallet_id: int, start_month: str):
-    db = SessionLocal()
+    db = WriterSessionLocal()
     try:
-        ledger.cascade_recalculation(db, wallet_id, start_month)
+        ledger.cascade_recalculation(db, wallet_id, start_month, commit=False)
+        # The day and year buckets are reconciled along with the monthly ledgers
+        buckets.rebuild_buckets(db, wallet_id, start_month)
+        user_id = db.query(models.Wallet.user_id).filter(models.Wallet.id == wallet_id).scalar()
+        if user_id is not None:
+            # Reconciles the incremental rollup updates made by the writes
+            rollups.rebuild_rollups(db, user_id, start_month)
+        db.commit()
     finally:
         db.close()
+    if user_id is not None:
+        # Balances from start_month onwards may have moved
+        response_cache.cache.invalidate(user_id, start_month, response_cache.LAST_MONTH)
+
+# All ledger recalculation goes through this queue instead of per-request background tasks
+recalc_scheduler = scheduler.RecalculationScheduler(run_recalculation)
 
 @router.post("/close-month")
-def trigger_month_close(month_str: str, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
+async def trigger_month_close(month_str: str, background_tasks: BackgroundTasks, current_user: auth.Principal = Depends(auth.get_current_user)):
     # In production, verify admin status
     background_tasks.add_task(run_month_close, month_str)
     return {"status": "accepted", "message": f"Month close for {month_str} scheduled"}
 
+@router.get("/close-month")
+async def get_month_close_progress(month_str: str, current_user: auth.Principal = Depends(auth.get_current_user)):
+    if month_str not in month_close_progress:
+        raise HTTPException(status_code=404, detail="No month close run for this month")
+    return month_close_progress[month_str]
+
 @router.post("/recalculate")
-def trigger_recalculation(wallet_id: int, start_month: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    wallet = db.query(models.Wallet).filter(models.Wallet.id == wallet_id, models.Wallet.user_id == current_user.id).first()
+async def trigger_recalculation(wallet_id: int, start_month: str, current_user: auth.Principal = Depends(auth.get_current_user)):
+    wallet = current_user.get_wallet(wallet_id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    background_tasks.add_task(run_recalculation, wallet_id, start_month)
+    recalc_scheduler.schedule(wallet_id, start_month)
     return {"status": "accepted", "message": "Recalculation scheduled"}
+
+@router.get("/queue")
+async def get_queue_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    return recalc_scheduler.stats()
+
+@router.post("/verify", response_model=schemas.LedgerVerifyResponse)
+def verify_ledger(wallet_id: int, month_str: str, repair: bool = False, db: Session = Depends(get_write_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    wallet = current_user.get_wallet(wallet_id)
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    monthly = db.query(models.WalletMonthlyBalance).filter(
+        models.WalletMonthlyBalance.wallet_id == wallet_id,
+        models.WalletMonthlyBalance.month == month_str
+    ).first()
+    if not monthly:
+        raise HTTPException(status_code=404, detail="Ledger not found")
+
+    drift = ledger.verify_ledger_totals(db, monthly)
+    if drift and repair:
+        ledger.update_ledger_totals(db, monthly)
+        response_cache.cache.invalidate(current_user.id, month_str, response_cache.LAST_MONTH)
+    return {
+        "status": "drift" if drift else "ok",
+        "repaired": bool(drift) and repair,
+        "drift": {column: {"stored": stored, "actual": actual} for column, (stored, actual) in drift.items()},
+    }
+
+@router.get("/hashing")
+async def get_hashing_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    return hashing.pool.stats()
+
+@router.get("/principal-cache")
+async def get_principal_cache_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    return principals.cache.stats()
+
+@router.get("/response-cache")
+async def get_response_cache_stats(current_user: auth.Principal = Depends(auth.get_current_user)):
+    return response_cache.cache.stats()
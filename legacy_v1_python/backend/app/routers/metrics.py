@@ -0,0 +1,33 @@
+import sys
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from backend.database.database import engine, writer_engine
+from backend.app import hashing, instrumentation, principals, response_cache
+from backend.app.routers import jobs
+
+router = APIRouter(tags=["metrics"])
+
+def _pool_stats(bound) -> dict:
+    pool = bound.pool
+    return {
+        "size": getattr(pool, "size", lambda: 0)(),
+        "checked_out": getattr(pool, "checkedout", lambda: 0)(),
+        "overflow": getattr(pool, "overflow", lambda: 0)(),
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Prometheus scrapes without credentials; nothing here is per-user
+    components = {
+        "db_read_pool": _pool_stats(engine),
+        "db_write_pool": _pool_stats(writer_engine),
+        "response_cache": response_cache.cache.stats(),
+        "principal_cache": principals.cache.stats(),
+        "hashing": hashing.pool.stats(),
+        "recalc": jobs.recalc_scheduler.stats(),
+    }
+    # Only once an insights request has imported it
+    analytics = sys.modules.get("backend.app.analytics")
+    if analytics is not None:
+        components["analytics_cache"] = analytics.snapshots.stats()
+    return PlainTextResponse(instrumentation.metrics.render(components), media_type="text/plain; version=0.0.4")
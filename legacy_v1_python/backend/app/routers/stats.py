@@ -1,47 +1,130 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Any
 from backend.database import models
-from backend.database.database import get_db
-from backend.app import auth
+from backend.database.database import get_async_db
+from backend.app import auth, async_ledger, ledger, schemas, response_cache, rollups
 
 router = APIRouter(
     prefix="/stats",
     tags=["stats"],
 )
 
-@router.get("/expenses-by-category")
-def get_expenses_by_category(month: str, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    dt = datetime.strptime(month, "%Y-%m")
-    start_date = dt.replace(day=1)
-    next_month = (start_date + timedelta(days=32)).replace(day=1)
-    
-    results = db.query(models.Expense.category, func.sum(models.Expense.amount)).join(models.Wallet).filter(
-        models.Wallet.user_id == current_user.id,
-        models.Expense.date >= start_date,
-        models.Expense.date < next_month
-    ).group_by(models.Expense.category).all()
+@router.get("/expenses-by-category", response_model=Dict[str, schemas.Cents])
+async def get_expenses_by_category(request: Request, month: str, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # Canonical form, so "2025-1" and "2025-01" share an entry and its invalidation
+    month = datetime.strptime(month, "%Y-%m").strftime("%Y-%m")
+    return await response_cache.cached_response(
+        request, current_user.id, "stats.expenses_by_category", {"month": month},
+        (month, month), Dict[str, schemas.Cents],
+        lambda: _expenses_by_category(db, current_user, month),
+    )
+
+async def _expenses_by_category(db: AsyncSession, current_user: auth.Principal, month: str):
+    rollup = models.CategoryMonthlyTotal
+    results = (await db.execute(
+        select(rollup.category, rollup.total).where(
+            rollup.user_id == current_user.id,
+            rollup.kind == rollups.EXPENSE,
+            rollup.month == month
+        )
+    )).all()
     
     return {r[0]: r[1] for r in results}
 
-@router.get("/monthly-trend")
-def get_monthly_trend(year: int, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    items = db.query(models.WalletMonthlyBalance.month, 
-                     func.sum(models.WalletMonthlyBalance.total_income), 
-                     func.sum(models.WalletMonthlyBalance.total_expense)).join(models.Wallet).filter(
-        models.Wallet.user_id == current_user.id,
-        models.WalletMonthlyBalance.month.like(f"{year}-%")
-    ).group_by(models.WalletMonthlyBalance.month).all()
+@router.get("/category-trend", response_model=Dict[str, Dict[str, schemas.Cents]])
+async def get_category_trend(request: Request, start_month: str, end_month: str, kind: str = rollups.EXPENSE, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(get_async_db)):
+    # {category: {month: total}} over the inclusive month range
+    if kind not in rollups.SOURCES:
+        raise HTTPException(status_code=400, detail="kind must be income or expense")
+    start_month = datetime.strptime(start_month, "%Y-%m").strftime("%Y-%m")
+    end_month = datetime.strptime(end_month, "%Y-%m").strftime("%Y-%m")
+    return await response_cache.cached_response(
+        request, current_user.id, "stats.category_trend", {"start": start_month, "end": end_month, "kind": kind},
+        (start_month, end_month), Dict[str, Dict[str, schemas.Cents]],
+        lambda: _category_trend(db, current_user, kind, start_month, end_month),
+    )
+
+async def _category_trend(db: AsyncSession, current_user: auth.Principal, kind: str, start_month: str, end_month: str):
+    rollup = models.CategoryMonthlyTotal
+    results = (await db.execute(
+        select(rollup.category, rollup.month, rollup.total).where(
+            rollup.user_id == current_user.id,
+            rollup.kind == kind,
+            rollup.month >= start_month,
+            rollup.month <= end_month
+        ).order_by(rollup.month)
+    )).all()
+
+    trend = {}
+    for category, month, total in results:
+        trend.setdefault(category, {})[month] = total
+    return trend
+
+@router.get("/monthly-trend", response_model=List[schemas.MonthlyTrendPoint])
+async def get_monthly_trend(request: Request, year: int, current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(get_async_db)):
+    return await response_cache.cached_response(
+        request, current_user.id, "stats.monthly_trend", {"year": year},
+        (f"{year}-01", f"{year}-12"), List[schemas.MonthlyTrendPoint],
+        lambda: _monthly_trend(db, current_user, year),
+    )
+
+async def _monthly_trend(db: AsyncSession, current_user: auth.Principal, year: int):
+    wallet_ids = [wallet.id for wallet in current_user.wallets]
+    items = (await db.execute(
+        select(models.WalletMonthlyBalance.month,
+               func.sum(models.WalletMonthlyBalance.total_income),
+               func.sum(models.WalletMonthlyBalance.total_expense)).where(
+            models.WalletMonthlyBalance.wallet_id.in_(wallet_ids),
+            models.WalletMonthlyBalance.month >= f"{year}-01",
+            models.WalletMonthlyBalance.month <= f"{year}-12"
+        ).group_by(models.WalletMonthlyBalance.month)
+    )).all()
+    by_month = {month: (income, expense) for month, income, expense in items}
     
     data = []
     for m in range(1, 13):
         m_str = f"{year}-{m:02d}"
-        found = next((i for i in items if i[0] == m_str), None)
-        if found:
-            data.append({"month": m_str, "income": found[1], "expense": found[2]})
-        else:
-            data.append({"month": m_str, "income": 0, "expense": 0})
+        income, expense = by_month.get(m_str, (0, 0))
+        data.append({"month": m_str, "income": income, "expense": expense})
             
     return data
+
+# Caps day series at roughly 27 years
+MAX_RANGE_POINTS = 10000
+
+def _parse_bound(value: str, end: bool) -> date:
+    """YYYY-MM-DD, or YYYY-MM meaning the first (start) or last (end) day of that month."""
+    try:
+        if len(value) == 7:
+            start_date, next_month = ledger.get_month_bounds(value)
+            return (next_month - timedelta(days=1)).date() if end else start_date.date()
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date {value!r}, expected YYYY-MM or YYYY-MM-DD")
+
+@router.get("/range", response_model=schemas.RangeAnalytics)
+async def get_range(request: Request, start: str, end: str, granularity: str = "month", current_user: auth.Principal = Depends(auth.get_current_user), db: AsyncSession = Depends(get_async_db)):
+    if granularity not in ledger.RANGE_GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be day, week or month")
+    start_date = _parse_bound(start, end=False)
+    end_date = _parse_bound(end, end=True)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if granularity == "day" and (end_date - start_date).days >= MAX_RANGE_POINTS:
+        raise HTTPException(status_code=400, detail="Range too long for daily points")
+
+    # Balances depend on every month before the range too
+    return await response_cache.cached_response(
+        request, current_user.id, "stats.range",
+        {"start": start_date.isoformat(), "end": end_date.isoformat(), "granularity": granularity},
+        (response_cache.FIRST_MONTH, end_date.strftime("%Y-%m")), schemas.RangeAnalytics,
+        lambda: _range(db, current_user, start_date, end_date, granularity),
+    )
+
+async def _range(db: AsyncSession, current_user: auth.Principal, start_date: date, end_date: date, granularity: str):
+    wallet_ids = [wallet.id for wallet in current_user.wallets]
+    result = await async_ledger.range_series(db, wallet_ids, start_date, end_date, granularity)
+    return {"start": start_date.isoformat(), "end": end_date.isoformat(), "granularity": granularity, **result}
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
+import io
+import itertools
 from backend.database import models
-from backend.database.database import get_db
-from backend.app import schemas, auth, ledger
+from backend.database.database import get_async_db, get_write_db
+from backend.app import schemas, auth, ledger, buckets, ingest, importer, response_cache, rollups, history, export, search
 from backend.app.routers import jobs
 
 router = APIRouter(
@@ -11,73 +16,205 @@ router = APIRouter(
     tags=["transactions"],
 )
 
+@router.get("/", response_model=schemas.TransactionPage)
+async def list_transactions(
+    wallet_id: Optional[int] = None,
+    kind: Optional[str] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[schemas.Amount] = None,
+    max_amount: Optional[schemas.Amount] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if wallet_id is not None:
+        if not current_user.get_wallet(wallet_id):
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        wallet_ids = [wallet_id]
+    else:
+        wallet_ids = [wallet.id for wallet in current_user.wallets]
+    if kind is not None and kind not in history.KIND_RANKS:
+        raise HTTPException(status_code=400, detail="kind must be income, expense or transfer")
+
+    try:
+        return await db.run_sync(
+            history.list_transactions, wallet_ids, limit=limit, cursor=cursor, kind=kind, category=category,
+            min_amount=min_amount, max_amount=max_amount, start=start, end=end,
+        )
+    except history.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/search", response_model=schemas.TransactionSearchPage)
+async def search_transactions(
+    q: str,
+    wallet_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if wallet_id is not None:
+        if not current_user.get_wallet(wallet_id):
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        wallet_ids = [wallet_id]
+    else:
+        wallet_ids = [wallet.id for wallet in current_user.wallets]
+
+    try:
+        return await db.run_sync(search.search, wallet_ids, q, limit=limit, offset=offset)
+    except search.InvalidQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/export")
+async def export_transactions(
+    format: str = "csv",
+    wallet_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv, ndjson or columnar")
+    if wallet_id is not None:
+        if not current_user.get_wallet(wallet_id):
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        wallet_ids = [wallet_id]
+    else:
+        wallet_ids = [wallet.id for wallet in current_user.wallets]
+
+    # Sync generator: Starlette iterates it on the threadpool, one batch per chunk
+    chunks = export.export(format, wallet_ids, start, end, all_wallets=wallet_id is None)
+    extension = "csv" if format == "csv" else "ndjson"
+    return StreamingResponse(chunks, media_type=export.FORMATS[format], headers={
+        "Content-Disposition": f'attachment; filename="spendwise-transactions.{extension}"',
+    })
+
 @router.post("/income")
-def add_income(income: schemas.IncomeCreate, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    wallet = db.query(models.Wallet).filter(models.Wallet.id == income.wallet_id, models.Wallet.user_id == current_user.id).first()
+def add_income(income: schemas.IncomeCreate, current_user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_write_db)):
+    wallet = current_user.get_wallet(income.wallet_id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
+    month_str = income.date.strftime("%Y-%m")
+    ledger.get_or_create_monthly_balance(db, wallet.id, month_str)
+
+    # Insert and ledger delta commit together
     new_income = models.Income(**income.dict())
     db.add(new_income)
+    ledger.apply_ledger_delta(db, wallet.id, month_str, income=income.amount)
+    buckets.add_to_bucket(db, wallet.id, income.date, income=income.amount)
+    rollups.add_to_rollup(db, current_user.id, rollups.INCOME, month_str, income.category, income.amount)
     db.commit()
+    response_cache.cache.invalidate(current_user.id, month_str)
     
-    # Update Ledger
-    month_str = income.date.strftime("%Y-%m")
-    # Immediate update for feedback
-    monthly_ledger = ledger.get_or_create_monthly_balance(db, wallet.id, month_str)
-    ledger.update_ledger_totals(db, monthly_ledger)
-    
-    # Background recalculation for propagation
-    background_tasks.add_task(jobs.run_recalculation, wallet.id, month_str)
+    # Propagate to later months off the request path
+    jobs.recalc_scheduler.schedule(wallet.id, month_str)
     
     return {"status": "success", "message": "Income added"}
 
 @router.post("/expense")
-def add_expense(expense: schemas.ExpenseCreate, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    wallet = db.query(models.Wallet).filter(models.Wallet.id == expense.wallet_id, models.Wallet.user_id == current_user.id).first()
+def add_expense(expense: schemas.ExpenseCreate, current_user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_write_db)):
+    wallet = current_user.get_wallet(expense.wallet_id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    # Check balance
     month_str = expense.date.strftime("%Y-%m")
-    monthly_ledger = ledger.get_or_create_monthly_balance(db, wallet.id, month_str)
-    
-    if monthly_ledger.closing_balance < expense.amount:
+    # Balance check and debit in one compare-and-swap on the ledger row
+    try:
+        ledger.debit_ledger(db, wallet.id, month_str, expense=expense.amount)
+    except ledger.InsufficientFunds:
+        # The balance read opened a write transaction; release the writer now, not at teardown
+        db.rollback()
         raise HTTPException(status_code=400, detail="Insufficient funds")
+    except ledger.LedgerConflict as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
 
     new_expense = models.Expense(**expense.dict())
     db.add(new_expense)
+    buckets.add_to_bucket(db, wallet.id, expense.date, expense=expense.amount)
+    rollups.add_to_rollup(db, current_user.id, rollups.EXPENSE, month_str, expense.category, expense.amount)
     db.commit()
+    response_cache.cache.invalidate(current_user.id, month_str)
     
-    ledger.update_ledger_totals(db, monthly_ledger)
-    background_tasks.add_task(jobs.run_recalculation, wallet.id, month_str)
+    jobs.recalc_scheduler.schedule(wallet.id, month_str)
     
     return {"status": "success", "message": "Expense added"}
 
 @router.post("/transfer")
-def wallet_transfer(transfer: schemas.TransferCreate, background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
-    source_wallet = db.query(models.Wallet).filter(models.Wallet.id == transfer.source_wallet_id, models.Wallet.user_id == current_user.id).first()
-    target_wallet = db.query(models.Wallet).filter(models.Wallet.id == transfer.target_wallet_id, models.Wallet.user_id == current_user.id).first()
+def wallet_transfer(transfer: schemas.TransferCreate, current_user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_write_db)):
+    source_wallet = current_user.get_wallet(transfer.source_wallet_id)
+    target_wallet = current_user.get_wallet(transfer.target_wallet_id)
     
     if not source_wallet or not target_wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
 
     month_str = transfer.date.strftime("%Y-%m")
-    source_ledger = ledger.get_or_create_monthly_balance(db, source_wallet.id, month_str)
-    
-    if source_ledger.closing_balance < transfer.amount:
+    # Creating a ledger commits, so do it before the debit joins the transaction
+    ledger.get_or_create_monthly_balance(db, target_wallet.id, month_str)
+    try:
+        ledger.debit_ledger(db, source_wallet.id, month_str, transfers_out=transfer.amount)
+    except ledger.InsufficientFunds:
+        # The balance read opened a write transaction; release the writer now, not at teardown
+        db.rollback()
         raise HTTPException(status_code=400, detail="Insufficient funds in source wallet")
+    except ledger.LedgerConflict as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
 
     new_transfer = models.WalletTransfer(**transfer.dict())
     db.add(new_transfer)
+    ledger.apply_ledger_delta(db, target_wallet.id, month_str, transfers_in=transfer.amount)
+    day = buckets.day_key(transfer.date)
+    buckets.add_to_buckets(db, {
+        (source_wallet.id, day): (0, 0, 0, transfer.amount),
+        (target_wallet.id, day): (0, 0, transfer.amount, 0),
+    })
     db.commit()
+    response_cache.cache.invalidate(current_user.id, month_str)
     
-    target_ledger = ledger.get_or_create_monthly_balance(db, target_wallet.id, month_str)
-    
-    ledger.update_ledger_totals(db, source_ledger)
-    ledger.update_ledger_totals(db, target_ledger)
-    
-    background_tasks.add_task(jobs.run_recalculation, source_wallet.id, month_str)
-    background_tasks.add_task(jobs.run_recalculation, target_wallet.id, month_str)
+    jobs.recalc_scheduler.schedule(source_wallet.id, month_str)
+    jobs.recalc_scheduler.schedule(target_wallet.id, month_str)
     
     return {"status": "success", "message": "Transfer successful"}
+
+@router.post("/bulk", response_model=schemas.BulkTransactionsResponse)
+def add_bulk(bulk: schemas.BulkTransactionsCreate, current_user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_write_db)):
+    records = itertools.chain(
+        ((ingest.INCOME, income) for income in bulk.incomes),
+        ((ingest.EXPENSE, expense) for expense in bulk.expenses),
+        ((ingest.TRANSFER, transfer) for transfer in bulk.transfers),
+    )
+    try:
+        result = ingest.ingest_transactions(db, current_user.id, [w.id for w in current_user.wallets], records)
+    except ingest.UnknownWallet as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    response_cache.cache.invalidate_user(current_user.id)
+    return {"status": "success", **result}
+
+@router.post("/import", response_model=schemas.BulkTransactionsResponse)
+def import_statement(file: UploadFile = File(...), format: str = "csv", wallet_id: Optional[int] = None, current_user: auth.Principal = Depends(auth.get_current_user), db: Session = Depends(get_write_db)):
+    # Decoded lazily so the upload is parsed and inserted as a stream
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        records = importer.parse_csv(lines, default_wallet_id=wallet_id)
+    elif format == "ofx":
+        if wallet_id is None:
+            raise HTTPException(status_code=400, detail="wallet_id is required for OFX imports")
+        records = importer.parse_ofx(lines, wallet_id)
+    else:
+        raise HTTPException(status_code=400, detail="format must be csv or ofx")
+
+    try:
+        result = ingest.ingest_transactions(db, current_user.id, [w.id for w in current_user.wallets], records)
+    except ingest.UnknownWallet as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except importer.InvalidImportRow as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Statement files must be UTF-8 encoded")
+    response_cache.cache.invalidate_user(current_user.id)
+    return {"status": "success", **result}
@@ -1,8 +1,5 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 from typing import List
-from backend.database import models
-from backend.database.database import get_db
 from backend.app import auth, schemas
 
 router = APIRouter(
@@ -11,5 +8,5 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[schemas.WalletResponse])
-def get_wallets(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+async def get_wallets(current_user: auth.Principal = Depends(auth.get_current_user)):
     return current_user.wallets
@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+RECALC_WORKERS = int(os.getenv("SPENDWISE_RECALC_WORKERS", "2"))
+RECALC_DEBOUNCE_MS = float(os.getenv("SPENDWISE_RECALC_DEBOUNCE_MS", "200"))
+RECALC_MAX_RETRIES = int(os.getenv("SPENDWISE_RECALC_MAX_RETRIES", "3"))
+
+logger = logging.getLogger(__name__)
+
+class _PendingJob:
+    __slots__ = ("start_month", "enqueued_at", "due_at", "attempts")
+
+    def __init__(self, start_month: str, now: float, due_at: float, attempts: int = 0):
+        self.start_month = start_month
+        self.enqueued_at = now
+        self.due_at = due_at
+        self.attempts = attempts
+
+class RecalculationScheduler:
+    """
+    Coalescing queue for per-wallet ledger recalculation.
+    Jobs for the same wallet are merged, keeping the earliest start month, and
+    held for a debounce window (capped at 10x so a steady stream still runs).
+    A wallet is never recalculated by two workers at once; work arriving while
+    it runs is queued behind it. A fixed set of daemon worker threads runs the
+    jobs, independent of any request.
+    """
+
+    def __init__(self, job, workers: int = RECALC_WORKERS, debounce_ms: float = RECALC_DEBOUNCE_MS, max_retries: int = RECALC_MAX_RETRIES):
+        self._job = job
+        self.workers = workers
+        self.debounce = debounce_ms / 1000
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._running = set()
+        self._threads = []
+        self._stopping = False
+        self.scheduled = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.recent = deque(maxlen=100)
+
+    def _ensure_started(self):
+        if self._threads or self._stopping:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"recalc-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def schedule(self, wallet_id: int, start_month: str):
+        now = time.monotonic()
+        with self._cond:
+            self._ensure_started()
+            self.scheduled += 1
+            job = self._pending.get(wallet_id)
+            if job is None:
+                self._pending[wallet_id] = _PendingJob(start_month, now, now + self.debounce)
+            else:
+                self.coalesced += 1
+                job.start_month = min(job.start_month, start_month)
+                job.due_at = min(now + self.debounce, job.enqueued_at + self.debounce * 10)
+            self._cond.notify()
+
+    def _next_ready(self):
+        """Pops a due job for an idle wallet as (wallet_id, job, None), or returns (None, None, seconds to wait)."""
+        now = time.monotonic()
+        wait = None
+        for wallet_id, job in self._pending.items():
+            if wallet_id in self._running:
+                continue
+            if job.due_at <= now:
+                del self._pending[wallet_id]
+                self._running.add(wallet_id)
+                return wallet_id, job, None
+            wait = job.due_at - now if wait is None else min(wait, job.due_at - now)
+        return None, None, wait
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping and not self._pending:
+                        return
+                    wallet_id, job, wait = self._next_ready()
+                    if wallet_id is not None:
+                        break
+                    self._cond.wait(wait)
+
+            started = time.monotonic()
+            error = None
+            try:
+                self._job(wallet_id, job.start_month)
+            except Exception as e:
+                error = e
+                logger.exception("Recalculation of wallet %s from %s failed", wallet_id, job.start_month)
+            finished = time.monotonic()
+
+            with self._cond:
+                self._running.discard(wallet_id)
+                if error is None:
+                    self.completed += 1
+                elif job.attempts < self.max_retries:
+                    # Typically a lost write-lock race; requeue, merged with anything newer
+                    self.retried += 1
+                    pending = self._pending.get(wallet_id)
+                    if pending is None:
+                        self._pending[wallet_id] = _PendingJob(job.start_month, finished, finished + self.debounce * (2 ** job.attempts), job.attempts + 1)
+                    else:
+                        pending.start_month = min(pending.start_month, job.start_month)
+                else:
+                    self.failed += 1
+                self.recent.append({
+                    "wallet_id": wallet_id,
+                    "start_month": job.start_month,
+                    "wait_ms": round((started - job.enqueued_at) * 1000, 3),
+                    "run_ms": round((finished - started) * 1000, 3),
+                    "ok": error is None,
+                })
+                self._cond.notify_all()
+
+    def drain(self, timeout: float = None) -> bool:
+        """Runs everything pending now, skipping the debounce, and waits for it. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._ensure_started()
+            while self._pending or self._running:
+                now = time.monotonic()
+                for job in self._pending.values():
+                    job.due_at = min(job.due_at, now)
+                self._cond.notify_all()
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            recent = list(self.recent)
+            return {
+                "workers": self.workers,
+                "debounce_ms": self.debounce * 1000,
+                "queue_length": len(self._pending),
+                "running": len(self._running),
+                "scheduled": self.scheduled,
+                "coalesced": self.coalesced,
+                "completed": self.completed,
+                "retried": self.retried,
+                "failed": self.failed,
+                "avg_run_ms": round(sum(j["run_ms"] for j in recent) / len(recent), 3) if recent else 0.0,
+                "recent": recent[-10:],
+            }
+
+    def shutdown(self, timeout: float = None):
+        self.drain(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
@@ -1,6 +1,30 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, BeforeValidator, PlainSerializer
+from typing import Optional, List, Dict, Annotated
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Money is stored as integer minor units (cents). The API speaks major units,
+# and this module is the only place that converts between the two.
+MINOR_UNITS = 100
+
+def to_minor_units(amount) -> int:
+    if isinstance(amount, bool):
+        raise ValueError("amount must be a number")
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError("amount must be a number")
+    if not value.is_finite():
+        raise ValueError("amount must be finite")
+    return int((value * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def from_minor_units(value: int) -> float:
+    return value / MINOR_UNITS
+
+# Request field: major units in, cents on the model
+Amount = Annotated[int, BeforeValidator(to_minor_units)]
+# Response field: cents on the model, major units in JSON
+Cents = Annotated[int, PlainSerializer(from_minor_units, return_type=float, when_used="json")]
 
 class UserCreate(BaseModel):
     email: EmailStr
@@ -23,14 +47,14 @@ class TokenData(BaseModel):
 
 class IncomeCreate(BaseModel):
     wallet_id: int
-    amount: float
+    amount: Amount
     date: datetime
     category: str
     description: Optional[str] = None
 
 class ExpenseCreate(BaseModel):
     wallet_id: int
-    amount: float
+    amount: Amount
     date: datetime
     category: str
     description: Optional[str] = None
@@ -38,7 +62,7 @@ class ExpenseCreate(BaseModel):
 class TransferCreate(BaseModel):
     source_wallet_id: int
     target_wallet_id: int
-    amount: float
+    amount: Amount
     date: datetime
     description: Optional[str] = None
 
@@ -48,3 +72,76 @@ class WalletResponse(BaseModel):
     type: str
     class Config:
         from_attributes = True
+
+class BulkTransactionsCreate(BaseModel):
+    incomes: List[IncomeCreate] = []
+    expenses: List[ExpenseCreate] = []
+    transfers: List[TransferCreate] = []
+
+class BulkTransactionsResponse(BaseModel):
+    status: str
+    incomes: int
+    expenses: int
+    transfers: int
+    recalculated_wallets: int
+
+class WalletBalance(BaseModel):
+    opening: Cents = 0
+    closing: Cents = 0
+
+class DashboardSummary(BaseModel):
+    cash: WalletBalance
+    bank: WalletBalance
+    total_income: Cents = 0
+    total_expense: Cents = 0
+    total_balance: Cents = 0
+
+class MonthlyTrendPoint(BaseModel):
+    month: str
+    income: Cents
+    expense: Cents
+
+class RangePoint(BaseModel):
+    period: str # YYYY-MM, or YYYY-MM-DD for days and for weeks (their Monday)
+    income: Cents
+    expense: Cents
+    net: Cents
+    balance: Cents
+
+class RangeAnalytics(BaseModel):
+    start: str
+    end: str
+    granularity: str
+    opening_balance: Cents
+    closing_balance: Cents
+    total_income: Cents
+    total_expense: Cents
+    net: Cents
+    series: List[RangePoint]
+
+class TransactionItem(BaseModel):
+    id: int
+    kind: str # "income", "expense" or "transfer"
+    wallet_id: int # source wallet for transfers
+    target_wallet_id: Optional[int] = None
+    amount: Cents
+    date: datetime
+    category: Optional[str] = None
+    description: Optional[str] = None
+
+class TransactionPage(BaseModel):
+    items: List[TransactionItem]
+    next_cursor: Optional[str] = None
+
+class TransactionSearchPage(BaseModel):
+    items: List[TransactionItem] # best match first
+    next_offset: Optional[int] = None
+
+class LedgerDrift(BaseModel):
+    stored: Cents
+    actual: Cents
+
+class LedgerVerifyResponse(BaseModel):
+    status: str
+    repaired: bool
+    drift: Dict[str, LedgerDrift]
@@ -0,0 +1,148 @@
+import re
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+from backend.database import models
+from . import history
+
+FTS_TABLE = "transactions_fts"
+
+MAX_PAGE_SIZE = 200
+
+# Index rowid = source id * KIND_SLOTS + kind rank, so the three tables share one index
+KIND_SLOTS = 4
+
+# kind -> (table, SQL expression for the wallet tokens of a row)
+SOURCES = {
+    history.INCOME: (models.Income.__tablename__, "'w' || {row}.wallet_id"),
+    history.EXPENSE: (models.Expense.__tablename__, "'w' || {row}.wallet_id"),
+    # A transfer is found from either of its wallets
+    history.TRANSFER: (models.WalletTransfer.__tablename__, "'w' || {row}.source_wallet_id || ' w' || {row}.target_wallet_id"),
+}
+
+MODELS = {
+    history.INCOME: models.Income,
+    history.EXPENSE: models.Expense,
+    history.TRANSFER: models.WalletTransfer,
+}
+
+class InvalidQuery(ValueError):
+    pass
+
+def _category(kind: str, row: str) -> str:
+    return "NULL" if kind == history.TRANSFER else f"{row}.category"
+
+def _row_values(kind: str, row: str) -> str:
+    _, wallets = SOURCES[kind]
+    return (
+        f"{row}.id * {KIND_SLOTS} + {history.KIND_RANKS[kind]}, "
+        f"{row}.description, {_category(kind, row)}, {wallets.format(row=row)}"
+    )
+
+def create_search_index(conn, backfill: bool = False):
+    """
+    Creates the FTS5 index over transaction descriptions and categories and
+    the triggers that keep it in step with every insert, update and delete,
+    including the executemany bulk paths. Idempotent. With backfill, the
+    index is refilled from the transaction tables. SQLite only; elsewhere
+    search() falls back to ILIKE.
+    """
+    if conn.dialect.name != "sqlite":
+        return
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": FTS_TABLE}).first()
+    if not exists:
+        # wallets holds w<id> tokens so the user scoping is answered by the index too
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "description, category, wallets, "
+            "prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        # Persistent ranking: wallet tokens must not weigh in
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(1.0, 0.5, 0.0)')"))
+        backfill = True
+
+    for kind, (table, _) in SOURCES.items():
+        insert = f"INSERT INTO {FTS_TABLE}(rowid, description, category, wallets) VALUES ({_row_values(kind, 'new')});"
+        delete = f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id * {KIND_SLOTS} + {history.KIND_RANKS[kind]};"
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN {insert} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN {delete} END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN {delete} {insert} END"))
+
+    if backfill:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        for kind, (table, _) in SOURCES.items():
+            conn.execute(text(
+                f"INSERT INTO {FTS_TABLE}(rowid, description, category, wallets) "
+                f"SELECT {_row_values(kind, table)} FROM {table}"
+            ))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+
+def _terms(query: str) -> list:
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        raise InvalidQuery("Search query has no words")
+    return terms
+
+def _match_expression(terms: list, wallet_ids: list) -> str:
+    # Every term is quoted, so user input never reaches the FTS5 query syntax
+    words = " ".join(f'"{term}"*' for term in terms)
+    wallets = " OR ".join(f'"w{wallet_id}"' for wallet_id in wallet_ids)
+    return f"{{description category}} : ({words}) AND wallets : ({wallets})"
+
+def search(db: Session, wallet_ids: list, query: str, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Transactions on wallet_ids whose description or category contain every
+    word of query (as prefixes), best match first. Ranking, paging and the
+    wallet scoping all run inside the FTS5 index; only the page's rows are
+    then loaded from their tables.
+    Returns {"items": [...], "next_offset": int or None}.
+    """
+    terms = _terms(query)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    if not wallet_ids:
+        return {"items": [], "next_offset": None}
+    if db.get_bind().dialect.name != "sqlite":
+        return _search_like(db, wallet_ids, terms, limit, offset)
+
+    rowids = db.execute(text(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+    ), {"match": _match_expression(terms, wallet_ids), "limit": limit + 1, "offset": offset}).scalars().all()
+
+    has_more = len(rowids) > limit
+    rowids = rowids[:limit]
+    ranks = {rank: kind for kind, rank in history.KIND_RANKS.items()}
+    wanted = {}
+    for rowid in rowids:
+        wanted.setdefault(ranks[rowid % KIND_SLOTS], []).append(rowid // KIND_SLOTS)
+    rows = {}
+    for kind, ids in wanted.items():
+        model = MODELS[kind]
+        for row in db.query(model).filter(model.id.in_(ids)):
+            rows[row.id * KIND_SLOTS + history.KIND_RANKS[kind]] = history.transaction_item(kind, row)
+
+    return {
+        "items": [rows[rowid] for rowid in rowids if rowid in rows],
+        "next_offset": offset + limit if has_more else None,
+    }
+
+def _like_pattern(term: str) -> str:
+    """%term% with LIKE's wildcards in term escaped; \\w+ terms can contain _."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _search_like(db: Session, wallet_ids: list, terms: list, limit: int, offset: int) -> dict:
+    """Unranked fallback for databases without FTS5: newest matches first."""
+    items = []
+    for kind, model in MODELS.items():
+        if kind == history.TRANSFER:
+            scope = or_(model.source_wallet_id.in_(wallet_ids), model.target_wallet_id.in_(wallet_ids))
+            fields = [model.description]
+        else:
+            scope = model.wallet_id.in_(wallet_ids)
+            fields = [model.description, model.category]
+        matches = and_(*(or_(*(field.ilike(_like_pattern(term), escape="\\") for field in fields)) for term in terms))
+        rows = db.query(model).filter(scope, matches).order_by(model.date.desc(), model.id.desc()).limit(offset + limit + 1)
+        items += [history.transaction_item(kind, row) for row in rows]
+    items.sort(key=lambda item: (item["date"], history.KIND_RANKS[item["kind"]], item["id"]), reverse=True)
+    page = items[offset:offset + limit]
+    return {"items": page, "next_offset": offset + limit if len(items) > offset + limit else None}
@@ -0,0 +1,90 @@
+import asyncio
+import time
+import httpx
+from backend.app import auth, response_cache
+from .timing import summarize
+
+def endpoints(months: list) -> dict:
+    """name -> GET path exercised per user, over the dataset's months."""
+    mid_month, last_month = months[len(months) // 2], months[-1]
+    year = int(last_month[:4])
+    return {
+        "dashboard.summary": f"/dashboard/summary?month={mid_month}",
+        "insights": "/insights/",
+        "stats.expenses_by_category": f"/stats/expenses-by-category?month={mid_month}",
+        "stats.category_trend": f"/stats/category-trend?start_month={months[0]}&end_month={last_month}",
+        "stats.monthly_trend": f"/stats/monthly-trend?year={year}",
+        "stats.range.month": f"/stats/range?start={months[0]}&end={last_month}&granularity=month",
+        "stats.range.day": f"/stats/range?start={last_month}-01&end={last_month}-28&granularity=day",
+        "transactions.list": "/transactions/?limit=50",
+        "transactions.search": "/transactions/search?q=coffee",
+        "wallets": "/wallets/",
+    }
+
+async def _load(client: httpx.AsyncClient, requests: list, concurrency: int):
+    """
+    Issues (path, headers) GETs, or (path, headers, json) POSTs, with at most
+    concurrency in flight. Returns (latencies, errors, wall seconds).
+    """
+    queue = list(reversed(requests))
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            path, headers, *body = queue.pop()
+            started = time.perf_counter()
+            if body:
+                res = await client.post(path, headers=headers, json=body[0])
+            else:
+                res = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if res.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+async def run(app, emails: list, months: list, requests: int = 200, concurrency: int = 8) -> dict:
+    """
+    Drives each endpoint through the ASGI app in-process (no sockets), rotating
+    across emails, and records latency and throughput twice: with the response
+    cache disabled (every request computes) and warm (served from the cache).
+    Then times small expenses posted through the single writer; these are
+    the only requests that change the dataset.
+    Returns {name: summary}.
+    """
+    headers = [{"Authorization": f"Bearer {auth.create_access_token({'sub': email})}"} for email in emails]
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Warm the principal cache and the connection pools
+            await _load(client, [("/wallets/", h) for h in headers], concurrency)
+            max_bytes = response_cache.cache.max_bytes
+            for name, path in endpoints(months).items():
+                batch = [(path, headers[i % len(headers)]) for i in range(requests)]
+                for mode in ("cold", "warm"):
+                    response_cache.cache.clear()
+                    response_cache.cache.max_bytes = 0 if mode == "cold" else max_bytes
+                    if mode == "warm":
+                        await _load(client, batch[:len(headers)], concurrency)
+                    latencies, errors, wall = await _load(client, batch, concurrency)
+                    results[f"api.{name}.{mode}"] = {**summarize(latencies, wall), "errors": errors}
+            response_cache.cache.max_bytes = max_bytes
+
+            writes = []
+            for h in headers:
+                wallets = (await client.get("/wallets/", headers=h)).json()
+                bank = next(w["id"] for w in wallets if w["type"] == "BANK")
+                writes.append((bank, h))
+            when = f"{months[-1]}-15T12:00:00"
+            batch = [
+                ("/transactions/expense", h, {"wallet_id": bank, "amount": 0.01, "date": when, "category": "Benchmark"})
+                for bank, h in (writes[i % len(writes)] for i in range(requests))
+            ]
+            latencies, errors, wall = await _load(client, batch, concurrency)
+            results["api.transactions.expense.write"] = {**summarize(latencies, wall), "errors": errors}
+    return results
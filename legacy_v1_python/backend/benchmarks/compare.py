@@ -0,0 +1,60 @@
+import argparse
+import json
+import sys
+
+def compare(baseline: dict, candidate: dict, metric: str = "p50_ms", threshold: float = 0.15) -> list:
+    """
+    Rows of (name, baseline value, candidate value, relative change, status)
+    for every benchmark in either report. status is "regression" when the
+    candidate is slower by more than threshold, "improvement" when faster by
+    more than threshold, else "ok"; "added"/"removed" for one-sided entries.
+    """
+    rows = []
+    before, after = baseline["results"], candidate["results"]
+    for name in sorted(set(before) | set(after)):
+        if name not in after:
+            rows.append((name, before[name][metric], None, None, "removed"))
+            continue
+        if name not in before:
+            rows.append((name, None, after[name][metric], None, "added"))
+            continue
+        old, new = before[name][metric], after[name][metric]
+        change = (new - old) / old if old else 0.0
+        status = "regression" if change > threshold else "improvement" if change < -threshold else "ok"
+        rows.append((name, old, new, change, status))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--metric", default="p50_ms", help="summary field to compare (default p50_ms)")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline["meta"]["parameters"] != candidate["meta"]["parameters"]:
+        print("warning: the runs used different parameters", file=sys.stderr)
+
+    rows = compare(baseline, candidate, args.metric, args.threshold)
+    width = max(len(row[0]) for row in rows)
+    print(f"{'benchmark':<{width}}  {'before':>10}  {'after':>10}  {'change':>8}")
+
+    def cell(value):
+        return f"{value:>10.3f}" if value is not None else f"{'-':>10}"
+
+    for name, old, new, change, status in rows:
+        delta = f"{change:+8.1%}" if change is not None else f"{'':>8}"
+        flag = "" if status == "ok" else f"  {status}"
+        print(f"{name:<{width}}  {cell(old)}  {cell(new)}  {delta}{flag}")
+
+    regressions = [row for row in rows if row[4] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%} in {args.metric}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
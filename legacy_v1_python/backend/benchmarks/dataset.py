@@ -0,0 +1,155 @@
+import math
+import random
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from backend.database import models
+from backend.app import buckets, ledger, rollups
+
+# The dataset ends here rather than today so that a seed always produces the same rows
+DEFAULT_END_MONTH = "2025-12"
+
+# (category, relative frequency, median amount in cents); frequencies follow a Zipf-like tail
+EXPENSE_CATEGORIES = [
+    ("Groceries", 30, 4500),
+    ("Food", 24, 1800),
+    ("Transport", 16, 1200),
+    ("Coffee", 14, 450),
+    ("Shopping", 8, 6000),
+    ("Utilities", 4, 9000),
+    ("Entertainment", 4, 3000),
+    ("Health", 2, 5000),
+    ("Travel", 1, 40000),
+    ("Gifts", 1, 7000),
+]
+
+MERCHANTS = {
+    "Groceries": ["Fresh Market", "Corner grocery", "Bulk store", "Farmers market"],
+    "Food": ["Pizza place", "Noodle bar", "Canteen lunch", "Burger joint", "Sushi takeaway"],
+    "Transport": ["Metro card", "Taxi ride", "Fuel station", "Bike share"],
+    "Coffee": ["Café latte", "Espresso bar", "Bakery coffee"],
+    "Shopping": ["Bookshop", "Online order", "Clothing store", "Hardware store"],
+    "Utilities": ["Electricity bill", "Water bill", "Internet plan", "Phone plan"],
+    "Entertainment": ["Cinema tickets", "Concert", "Streaming subscription"],
+    "Health": ["Pharmacy", "Dentist", "Gym membership"],
+    "Travel": ["Flight tickets", "Hotel booking", "Train tickets"],
+    "Gifts": ["Birthday gift", "Flowers"],
+}
+
+INCOME_CATEGORIES = [("Freelance", 2, 40000), ("Refund", 1, 3000), ("Interest", 1, 500)]
+
+INSERT_BATCH_SIZE = 5000
+
+def month_span(end_month: str, count: int) -> list:
+    """The count months ending at end_month, oldest first."""
+    months = [end_month]
+    while len(months) < count:
+        months.append(ledger.get_previous_month(months[-1]))
+    return months[::-1]
+
+def _lognormal_cents(rng: random.Random, median: int, sigma: float = 0.6) -> int:
+    return max(1, int(rng.lognormvariate(math.log(median), sigma)))
+
+def _when(rng: random.Random, month_str: str) -> datetime:
+    start, next_month = ledger.get_month_bounds(month_str)
+    days = (next_month - start).days
+    # Spending clusters in the waking hours
+    return start.replace(day=rng.randint(1, days), hour=rng.choice(range(7, 23)), minute=rng.randint(0, 59))
+
+def _pick(rng: random.Random, choices: list):
+    return rng.choices(choices, weights=[weight for _, weight, _ in choices])[0]
+
+def generate(
+    db: Session,
+    users: int = 50,
+    wallets_per_user: int = 3,
+    years: int = 3,
+    transactions_per_month: int = 40,
+    seed: int = 42,
+    end_month: str = DEFAULT_END_MONTH,
+    hashed_password: str = "",
+) -> dict:
+    """
+    Fills an empty database with a reproducible synthetic history: users with
+    wallets_per_user wallets each (cash, bank, then savings), years of monthly
+    salaries, expenses and transfers ending at end_month. Activity is skewed:
+    per-user volume is Pareto distributed around transactions_per_month,
+    categories and merchants follow a long tail, amounts are log-normal and
+    most spending goes through the bank wallet.
+    Rows are bulk inserted, then ledgers and category rollups are rebuilt the
+    way an import does. Returns the row counts.
+    """
+    rng = random.Random(seed)
+    months = month_span(end_month, years * 12)
+    wallets_per_user = max(2, wallets_per_user)
+    counts = {"users": users, "wallets": 0, "incomes": 0, "expenses": 0, "transfers": 0, "months": len(months)}
+    pending = {models.Income: [], models.Expense: [], models.WalletTransfer: []}
+
+    def add(model, row):
+        pending[model].append(row)
+        if len(pending[model]) >= INSERT_BATCH_SIZE:
+            flush(model)
+
+    def flush(model):
+        if pending[model]:
+            db.execute(insert(model), pending[model])
+            pending[model] = []
+
+    user_rows = [
+        {"email": f"bench{index}@example.com", "hashed_password": hashed_password, "created_at": datetime(2020, 1, 1)}
+        for index in range(users)
+    ]
+    db.execute(insert(models.User), user_rows)
+    user_ids = [row.id for row in db.query(models.User.id).order_by(models.User.id)]
+
+    for user_id in user_ids:
+        names = [("Cash", "CASH"), ("Bank", "BANK")] + [(f"Savings {n}", "BANK") for n in range(1, wallets_per_user - 1)]
+        for name, wallet_type in names:
+            db.add(models.Wallet(user_id=user_id, name=name, type=wallet_type))
+    db.flush()
+
+    for user_id in user_ids:
+        cash, bank, *savings = [w.id for w in db.query(models.Wallet).filter(models.Wallet.user_id == user_id).order_by(models.Wallet.id)]
+        counts["wallets"] += 2 + len(savings)
+        # A few heavy users, a long tail of light ones
+        activity = min(rng.paretovariate(1.5) / 3.0, 8.0)
+        salary = _lognormal_cents(rng, 350000, 0.4)
+        # Most spending is by card
+        spend_wallets, spend_weights = [bank, cash] + savings, [70, 25] + [5] * len(savings)
+
+        for month_str in months:
+            start, _ = ledger.get_month_bounds(month_str)
+            add(models.Income, {"wallet_id": bank, "amount": salary, "date": start, "category": "Salary", "description": "Monthly salary"})
+            counts["incomes"] += 1
+            if rng.random() < 0.3:
+                category, _, median = _pick(rng, INCOME_CATEGORIES)
+                add(models.Income, {"wallet_id": bank, "amount": _lognormal_cents(rng, median), "date": _when(rng, month_str), "category": category, "description": None})
+                counts["incomes"] += 1
+
+            for _ in range(max(1, int(rng.gauss(transactions_per_month * activity, 5)))):
+                category, _, median = _pick(rng, EXPENSE_CATEGORIES)
+                add(models.Expense, {
+                    "wallet_id": rng.choices(spend_wallets, weights=spend_weights)[0],
+                    "amount": _lognormal_cents(rng, median),
+                    "date": _when(rng, month_str),
+                    "category": category,
+                    "description": rng.choice(MERCHANTS[category]),
+                })
+                counts["expenses"] += 1
+
+            add(models.WalletTransfer, {"source_wallet_id": bank, "target_wallet_id": cash, "amount": salary // 5, "date": _when(rng, month_str), "description": "ATM withdrawal"})
+            counts["transfers"] += 1
+            for wallet_id in savings:
+                add(models.WalletTransfer, {"source_wallet_id": bank, "target_wallet_id": wallet_id, "amount": salary // 10, "date": _when(rng, month_str), "description": "Savings"})
+                counts["transfers"] += 1
+
+    for model in pending:
+        flush(model)
+
+    wallet_ids = [wallet_id for (wallet_id,) in db.query(models.Wallet.id)]
+    for wallet_id in wallet_ids:
+        ledger.cascade_recalculation(db, wallet_id, months[0], end_month_str=months[-1], commit=False)
+    rollups.rebuild_rollups(db)
+    buckets.rebuild_buckets(db)
+    db.commit()
+    return counts
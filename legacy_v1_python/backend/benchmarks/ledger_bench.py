@@ -0,0 +1,65 @@
+from datetime import date
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from backend.database import models
+from backend.app import buckets, ledger, rollups
+from .timing import measure
+
+def busiest_wallet(db: Session):
+    """(wallet_id, user_id) of the wallet with the most expenses: the worst case for per-wallet work."""
+    wallet_id = db.query(models.Expense.wallet_id).group_by(models.Expense.wallet_id).order_by(
+        func.count(models.Expense.id).desc(), models.Expense.wallet_id
+    ).limit(1).scalar()
+    user_id = db.query(models.Wallet.user_id).filter(models.Wallet.id == wallet_id).scalar()
+    return wallet_id, user_id
+
+def run(db: Session, months: list, repeat: int = 20) -> dict:
+    """
+    Times each ledger function (and the rollup rebuild) on the busiest wallet
+    and its owner. db must be a writer session: mutating functions are rolled
+    back, and close_month is undone, after every call so the dataset stays put.
+    Returns {name: summary}.
+    """
+    wallet_id, user_id = busiest_wallet(db)
+    wallet_ids = [wallet_id for (wallet_id,) in db.query(models.Wallet.id).filter(models.Wallet.user_id == user_id)]
+    first_month, last_month = months[0], months[-1]
+    mid_month = months[len(months) // 2]
+    year_start, _ = ledger.get_month_bounds(months[-12] if len(months) >= 12 else first_month)
+    _, year_end = ledger.get_month_bounds(last_month)
+    range_start = date.fromisoformat(f"{first_month}-01")
+    range_end = ledger.get_month_bounds(last_month)[1].date()
+    # Mid-month, so balance_at reads every level
+    mid_day = date.fromisoformat(f"{mid_month}-15")
+    month_ledger = ledger.get_or_create_monthly_balance(db, wallet_id, mid_month)
+    db.rollback()
+
+    def reopen():
+        db.execute(update(models.WalletMonthlyBalance).where(models.WalletMonthlyBalance.month == mid_month).values(is_closed=False))
+        db.commit()
+
+    cases = {
+        "get_or_create_monthly_balance": dict(fn=lambda: ledger.get_or_create_monthly_balance(db, wallet_id, mid_month)),
+        "resolve_monthly_balances": dict(fn=lambda: ledger.resolve_monthly_balances(db, wallet_ids, mid_month)),
+        "apply_ledger_delta": dict(fn=lambda: ledger.apply_ledger_delta(db, wallet_id, mid_month, expense=100), teardown=db.rollback),
+        "scan_ledger_totals": dict(fn=lambda: ledger.scan_ledger_totals(db, wallet_id, mid_month)),
+        "verify_ledger_totals": dict(fn=lambda: ledger.verify_ledger_totals(db, month_ledger)),
+        "update_ledger_totals": dict(fn=lambda: ledger.update_ledger_totals(db, month_ledger), teardown=db.rollback),
+        "aggregate_monthly_totals.year": dict(fn=lambda: ledger.aggregate_monthly_totals(db, wallet_id, year_start, year_end)),
+        "cascade_recalculation.full_history": dict(
+            fn=lambda: ledger.cascade_recalculation(db, wallet_id, first_month, commit=False), teardown=db.rollback,
+        ),
+        "close_month": dict(fn=lambda: ledger.close_month(db, mid_month), teardown=reopen),
+        "range_series.month": dict(fn=lambda: ledger.range_series(db, wallet_ids, range_start, range_end, "month")),
+        "range_series.day": dict(fn=lambda: ledger.range_series(db, wallet_ids, range_start, range_end, "day")),
+        "range_totals.full_history": dict(fn=lambda: ledger.range_totals(db, wallet_ids, range_start, range_end)),
+        "balance_at": dict(fn=lambda: ledger.balance_at(db, wallet_id, mid_day)),
+        "rebuild_buckets.wallet": dict(fn=lambda: buckets.rebuild_buckets(db, wallet_id, first_month), teardown=db.rollback),
+        "rebuild_rollups.user": dict(fn=lambda: rollups.rebuild_rollups(db, user_id), teardown=db.rollback),
+    }
+    results = {}
+    for name, case in cases.items():
+        # close_month and the full rebuilds touch every row they own; fewer runs keep the suite short
+        runs = max(3, repeat // 4) if name in ("close_month", "cascade_recalculation.full_history") else repeat
+        results[f"ledger.{name}"] = measure(case["fn"], repeat=runs, teardown=case.get("teardown"))
+        db.rollback()
+    return results
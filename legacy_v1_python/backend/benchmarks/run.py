@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_DB = "spendwise-bench.db"
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ledger and the API on a synthetic dataset.")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite file to (re)create for the run")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--wallets", type=int, default=3, help="wallets per user (at least 2)")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--transactions-per-month", type=int, default=40, help="mean expenses per user per month")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per ledger benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and cache mode")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--startup-runs", type=int, default=10, help="cold starts of the API in fresh interpreters")
+    parser.add_argument("--only", choices=["ledger", "api", "startup"], help="run one suite")
+    parser.add_argument("--output", help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # The engines are built from the environment at import time, so point them at
+    # the benchmark database before anything from backend.database is imported
+    db_path = Path(args.db).resolve()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    os.environ["SPENDWISE_DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.pop("SPENDWISE_ASYNC_DATABASE_URL", None)
+
+    from backend.main import app
+    from backend.app import auth
+    from backend.database import migrations
+    from backend.database.database import WriterSessionLocal
+    from . import api_bench, dataset, ledger_bench, startup_bench
+
+    migrations.migrate()
+    hashed_password = asyncio.run(auth.get_password_hash("benchmark"))
+    started = time.perf_counter()
+    with WriterSessionLocal() as db:
+        counts = dataset.generate(
+            db, users=args.users, wallets_per_user=args.wallets, years=args.years,
+            transactions_per_month=args.transactions_per_month, seed=args.seed, hashed_password=hashed_password,
+        )
+    generate_seconds = time.perf_counter() - started
+    months = dataset.month_span(dataset.DEFAULT_END_MONTH, args.years * 12)
+    print(f"generated {counts} in {generate_seconds:.1f}s", file=sys.stderr)
+
+    results = {}
+    if args.only in (None, "ledger"):
+        with WriterSessionLocal() as db:
+            results.update(ledger_bench.run(db, months, repeat=args.repeat))
+    if args.only in (None, "api"):
+        emails = [f"bench{index}@example.com" for index in range(args.users)]
+        results.update(asyncio.run(api_bench.run(app, emails, months, requests=args.requests, concurrency=args.concurrency)))
+    if args.only in (None, "startup"):
+        # Child interpreters inherit SPENDWISE_DATABASE_URL, so they start against the generated dataset
+        results.update(startup_bench.run(repeat=args.startup_runs))
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("db", "output")},
+            "dataset": counts,
+            "generate_seconds": round(generate_seconds, 2),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
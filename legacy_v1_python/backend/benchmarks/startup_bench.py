@@ -0,0 +1,78 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from .timing import summarize
+
+# Runs in a fresh interpreter: imports the app, drives its lifespan startup
+# and one request through ASGI by hand (a test client would pre-import half
+# the stack and hide it from the import timing), and prints the phase times.
+CHILD = r"""
+import asyncio, json, time
+started = time.perf_counter()
+from backend.main import app
+imported = time.perf_counter()
+
+async def main():
+    lifespan_events = asyncio.Queue()
+    await lifespan_events.put({"type": "lifespan.startup"})
+    ready = asyncio.Event()
+
+    async def lifespan_send(message):
+        if message["type"] == "lifespan.startup.complete":
+            ready.set()
+        elif message["type"].endswith(".failed"):
+            raise RuntimeError(message.get("message"))
+
+    lifespan = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}}, lifespan_events.get, lifespan_send))
+    await ready.wait()
+    started_up = time.perf_counter()
+
+    status = []
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/", "raw_path": b"/", "root_path": "", "query_string": b"",
+        "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    responded = time.perf_counter()
+
+    await lifespan_events.put({"type": "lifespan.shutdown"})
+    await lifespan
+    return started_up, responded, status[0]
+
+started_up, responded, status = asyncio.run(main())
+print(json.dumps({
+    "import": imported - started, "startup": started_up - imported,
+    "first_request": responded - started_up, "status": status,
+}))
+"""
+
+def run(repeat: int = 10) -> dict:
+    """
+    Cold starts of the API: each run is a new interpreter that imports
+    backend.main, runs the lifespan startup (schema check included) and
+    serves GET /. The database comes from SPENDWISE_DATABASE_URL.
+    Returns {name: summary} for the import, the startup, the first request
+    and the whole process including interpreter start and shutdown.
+    """
+    phases = {"import": [], "startup": [], "first_request": [], "process": []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", CHILD], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parents[2],
+        ).stdout
+        phases["process"].append(time.perf_counter() - started)
+        timings = json.loads(output.strip().splitlines()[-1])
+        if timings.pop("status") != 200:
+            raise RuntimeError("GET / failed during the startup benchmark")
+        for phase, seconds in timings.items():
+            phases[phase].append(seconds)
+    return {f"startup.{phase}": summarize(samples) for phase, samples in phases.items()}
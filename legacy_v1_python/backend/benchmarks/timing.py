@@ -0,0 +1,40 @@
+import statistics
+import time
+
+def summarize(samples: list, wall_seconds: float = None) -> dict:
+    """Latency summary in milliseconds of per-call durations in seconds."""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    summary = {
+        "runs": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "min_ms": ordered[0] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+    if wall_seconds:
+        summary["throughput_per_s"] = len(ordered) / wall_seconds
+    return {key: round(value, 4) for key, value in summary.items()}
+
+def measure(fn, repeat: int = 20, warmup: int = 2, setup=None, teardown=None) -> dict:
+    """
+    Calls fn() warmup + repeat times and summarizes the timed calls. setup and
+    teardown run around every call, outside the timing, to put back whatever
+    fn changed.
+    """
+    samples = []
+    for index in range(warmup + repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        if teardown:
+            teardown()
+        if index >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
@@ -1,21 +1,102 @@
+import os
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./spendwise.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("SPENDWISE_DATABASE_URL", "sqlite:///./spendwise.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async driver used for each backend unless SPENDWISE_ASYNC_DATABASE_URL says otherwise
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
 
-# Enable WAL mode for better concurrency
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("SPENDWISE_ASYNC_DATABASE_URL", async_url(SQLALCHEMY_DATABASE_URL))
+
+READ_POOL_SIZE = int(os.getenv("SPENDWISE_DB_READ_POOL_SIZE", "8"))
+READ_MAX_OVERFLOW = int(os.getenv("SPENDWISE_DB_READ_MAX_OVERFLOW", "8"))
+WRITE_TIMEOUT = float(os.getenv("SPENDWISE_DB_WRITE_TIMEOUT", "30"))
+
+# Applied to every SQLite connection. Negative cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SPENDWISE_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SPENDWISE_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SPENDWISE_SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "cache_size": os.getenv("SPENDWISE_SQLITE_CACHE_SIZE", "-65536"),
+    "mmap_size": os.getenv("SPENDWISE_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "temp_store": os.getenv("SPENDWISE_SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+def _apply_pragmas(dbapi_connection, query_only: bool):
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    if query_only:
+        cursor.execute("PRAGMA query_only=1")
     cursor.close()
 
+if is_sqlite:
+    # Readers: a pool of connections that cannot write, so a stray write on a
+    # GET path fails loudly instead of contending for the lock.
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_MAX_OVERFLOW,
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_reader_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, query_only=True)
+
+    # Writer: SQLite allows one writer at a time anyway, so all mutations share
+    # one connection and queue for it in-process instead of failing with
+    # "database is locked". BEGIN IMMEDIATE takes the lock up front so a
+    # transaction never has to upgrade from read to write halfway through.
+    writer_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=WRITE_TIMEOUT,
+    )
+
+    @event.listens_for(writer_engine, "connect")
+    def set_writer_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, query_only=False)
+        # Let SQLAlchemy issue BEGIN itself
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer_engine, "begin")
+    def begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+else:
+    # Server databases handle concurrent writers themselves
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW, pool_pre_ping=True)
+    writer_engine = engine
+
+# Async read path for the request handlers; writes stay on writer_engine
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=READ_POOL_SIZE, max_overflow=READ_MAX_OVERFLOW)
+
+if is_sqlite:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def set_async_reader_pragmas(dbapi_connection, connection_record):
+        _apply_pragmas(dbapi_connection, query_only=True)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -25,3 +106,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_write_db():
+    """Session on the writer connection; use for every request that mutates data."""
+    db = WriterSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,214 @@
+import os
+from sqlalchemy import inspect, text, types as sqltypes
+from sqlalchemy.orm import Session
+from .database import Base, writer_engine
+from . import models
+
+# Bump together with a new entry in MIGRATIONS. Startup only migrates a
+# database that is behind this, so new tables and indexes need a bump too.
+SCHEMA_VERSION = 9
+
+# Web processes bring the schema up to date on startup unless this is "0"
+# (e.g. when a deploy step runs python -m backend.database.migrations)
+MIGRATE_ON_STARTUP = os.getenv("SPENDWISE_MIGRATE_ON_STARTUP", "1") != "0"
+
+def ensure_indexes(bind=writer_engine) -> list:
+    """
+    Creates every index declared on the models that is missing from the database.
+    create_all() skips tables that already exist, so databases created before an
+    index was added never get it without this.
+    Returns the names of the indexes that were created.
+    """
+    inspector = inspect(bind)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=bind)
+                created.append(index.name)
+
+    if created and bind.dialect.name == "sqlite":
+        # Refresh planner statistics so the new indexes get picked up
+        with bind.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return created
+
+MONEY_COLUMNS = {
+    models.Income.__table__: ["amount"],
+    models.Expense.__table__: ["amount"],
+    models.WalletTransfer.__table__: ["amount"],
+    models.WalletMonthlyBalance.__table__: [
+        "opening_balance", "total_income", "total_expense",
+        "total_transfers_in", "total_transfers_out", "closing_balance",
+    ],
+}
+
+def _rebuild_sqlite_table(conn, table, converted: dict):
+    """
+    SQLite can't change a column's type in place: move the old table aside,
+    create the current definition and copy the rows across.
+    converted maps column name -> SQL expression over the old column.
+    """
+    old_name = f"{table.name}__old"
+    old_columns = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    # Index names are schema-wide, so the old ones must go before the new table is created
+    for index in inspect(conn).get_indexes(table.name):
+        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"'))
+    table.create(conn)
+
+    names = [column.name for column in table.columns if column.name in old_columns]
+    column_list = ", ".join(f'"{name}"' for name in names)
+    selected = ", ".join(converted.get(name, f'"{name}"') for name in names)
+    conn.execute(text(f'INSERT INTO "{table.name}" ({column_list}) SELECT {selected} FROM "{old_name}"'))
+    conn.execute(text(f'DROP TABLE "{old_name}"'))
+
+def _money_to_minor_units(conn):
+    """v1: float amounts become integer cents."""
+    for table, columns in MONEY_COLUMNS.items():
+        column_types = {column["name"]: column["type"] for column in inspect(conn).get_columns(table.name)}
+        float_columns = [
+            name for name in columns
+            if name in column_types and not isinstance(column_types[name], sqltypes.Integer)
+        ]
+        if not float_columns:
+            continue
+        if conn.dialect.name == "sqlite":
+            _rebuild_sqlite_table(conn, table, {
+                name: f'CAST(ROUND("{name}" * 100) AS INTEGER)' for name in float_columns
+            })
+        else:
+            for name in float_columns:
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{name}" TYPE BIGINT USING ROUND("{name}" * 100)'
+                ))
+
+def _backfill_category_totals(conn):
+    """v2: fill the category rollup table from existing transactions."""
+    from backend.app import rollups
+    with Session(bind=conn) as session:
+        rollups.rebuild_rollups(session)
+
+def _ledger_cumulative_totals(conn):
+    """v3: running income/expense totals on the monthly ledgers."""
+    table = models.WalletMonthlyBalance.__table__
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    for name in ("cumulative_income", "cumulative_expense"):
+        # v1 rebuilds the table from the current model, which already has them
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{name}" BIGINT DEFAULT 0'))
+    conn.execute(text(
+        f'UPDATE "{table.name}" SET '
+        f'cumulative_income = (SELECT COALESCE(SUM(earlier.total_income), 0) FROM "{table.name}" earlier '
+        f'WHERE earlier.wallet_id = "{table.name}".wallet_id AND earlier.month <= "{table.name}".month), '
+        f'cumulative_expense = (SELECT COALESCE(SUM(earlier.total_expense), 0) FROM "{table.name}" earlier '
+        f'WHERE earlier.wallet_id = "{table.name}".wallet_id AND earlier.month <= "{table.name}".month)'
+    ))
+
+def _search_index(conn):
+    """v4: full-text index over transaction descriptions and categories."""
+    from backend.app import search
+    search.create_search_index(conn, backfill=True)
+
+def _ledger_version(conn):
+    """v5: optimistic-concurrency version on the monthly ledgers."""
+    table = models.WalletMonthlyBalance.__table__
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    if "version" not in existing:
+        conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "version" INTEGER NOT NULL DEFAULT 0'))
+
+def _month_close_partitions(conn):
+    """v6: checkpoint table for partitioned month close."""
+    models.MonthClosePartition.__table__.create(conn, checkfirst=True)
+
+def _time_buckets(conn):
+    """v7: daily and yearly flow buckets per wallet, backfilled from existing transactions."""
+    from backend.app import buckets
+    for model in (models.WalletDailyTotal, models.WalletYearlyTotal):
+        model.__table__.create(conn, checkfirst=True)
+    with Session(bind=conn) as session:
+        buckets.rebuild_buckets(session)
+
+def _ledger_carry_over(conn):
+    """v8: ledgers opened after a month without one carried zero; re-derive balances and running totals."""
+    table = models.WalletMonthlyBalance.__table__
+    net = "earlier.total_income - earlier.total_expense + earlier.total_transfers_in - earlier.total_transfers_out"
+    conn.execute(text(
+        f'UPDATE "{table.name}" SET '
+        f'opening_balance = (SELECT COALESCE(SUM({net}), 0) FROM "{table.name}" earlier '
+        f'WHERE earlier.wallet_id = "{table.name}".wallet_id AND earlier.month < "{table.name}".month)'
+    ))
+    conn.execute(text(
+        f'UPDATE "{table.name}" SET closing_balance = '
+        f'opening_balance + total_income - total_expense + total_transfers_in - total_transfers_out'
+    ))
+    _ledger_cumulative_totals(conn)
+
+def _drop_month_closed_index(conn):
+    """v9: the (month, is_closed) ledger index is superseded by one that also covers wallet_id."""
+    conn.execute(text("DROP INDEX IF EXISTS ix_wallet_monthly_balances_month_closed"))
+
+MIGRATIONS = {
+    1: _money_to_minor_units,
+    2: _backfill_category_totals,
+    3: _ledger_cumulative_totals,
+    4: _search_index,
+    5: _ledger_version,
+    6: _month_close_partitions,
+    7: _time_buckets,
+    8: _ledger_carry_over,
+    9: _drop_month_closed_index,
+}
+
+def get_schema_version(conn) -> int:
+    if not inspect(conn).has_table(models.SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(text(f"SELECT MAX(version) FROM {models.SchemaVersion.__tablename__}")).scalar() or 0
+
+def _set_schema_version(conn, version: int):
+    table = models.SchemaVersion.__table__
+    conn.execute(table.delete())
+    conn.execute(table.insert().values(version=version))
+
+def migrate(bind=writer_engine) -> int:
+    """
+    Brings the database up to SCHEMA_VERSION: creates missing tables, applies
+    pending migrations in order inside one transaction, makes sure the search
+    index exists, then builds missing indexes. A brand-new database is created
+    at the current version directly.
+    Returns the version the database was at before.
+    """
+    with bind.begin() as conn:
+        fresh = not inspect(conn).has_table(models.User.__tablename__)
+        previous = get_schema_version(conn)
+        Base.metadata.create_all(bind=conn)
+        if not fresh:
+            for version in range(previous + 1, SCHEMA_VERSION + 1):
+                MIGRATIONS[version](conn)
+        # Not a model table, so create_all() doesn't make it; idempotent
+        from backend.app import search
+        search.create_search_index(conn)
+        if previous != SCHEMA_VERSION:
+            _set_schema_version(conn, SCHEMA_VERSION)
+    ensure_indexes(bind)
+    return previous
+
+def ensure_schema(bind=writer_engine) -> bool:
+    """
+    Startup check: reads the schema version and runs migrate() only when the
+    database is new or behind, so a process starting against a current
+    database pays for one query instead of introspecting every table.
+    Returns whether it migrated.
+    """
+    with bind.connect() as conn:
+        if get_schema_version(conn) == SCHEMA_VERSION:
+            return False
+    migrate(bind)
+    return True
+
+if __name__ == "__main__":
+    previous = migrate(writer_engine)
+    print(f"Schema at version {SCHEMA_VERSION} (was {previous})")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -17,7 +17,7 @@ class Wallet(Base):
     __tablename__ = "wallets"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     name = Column(String) # e.g., "Main Cash", "Main Bank"
     type = Column(String) # "CASH" or "BANK"
 
@@ -36,18 +36,28 @@ class WalletMonthlyBalance(Base):
     wallet_id = Column(Integer, ForeignKey("wallets.id"))
     month = Column(String) # Format: "YYYY-MM"
     
-    opening_balance = Column(Float, default=0.0)
-    total_income = Column(Float, default=0.0)
-    total_expense = Column(Float, default=0.0)
-    total_transfers_in = Column(Float, default=0.0)
-    total_transfers_out = Column(Float, default=0.0)
-    closing_balance = Column(Float, default=0.0)
+    # All money columns hold integer minor units (cents); schemas.py converts at the API boundary
+    opening_balance = Column(BigInteger, default=0)
+    total_income = Column(BigInteger, default=0)
+    total_expense = Column(BigInteger, default=0)
+    total_transfers_in = Column(BigInteger, default=0)
+    total_transfers_out = Column(BigInteger, default=0)
+    closing_balance = Column(BigInteger, default=0)
+    # Running totals of the wallet's income/expense through the end of this month,
+    # so any month range total is cumulative[end] - cumulative[before start]
+    cumulative_income = Column(BigInteger, default=0)
+    cumulative_expense = Column(BigInteger, default=0)
     is_closed = Column(Boolean, default=False)
+    # Bumped by every write to the row; balance-checked debits compare-and-swap on it
+    version = Column(Integer, default=0, server_default="0", nullable=False)
 
     wallet = relationship("Wallet", back_populates="monthly_balances")
 
     __table_args__ = (
         UniqueConstraint('wallet_id', 'month', name='unique_wallet_month'),
+        # close_month walks open ledgers of a month in wallet_id order. Renamed
+        # when wallet_id was added: ensure_indexes only compares names
+        Index('ix_wallet_monthly_balances_month_closed_wallet', 'month', 'is_closed', 'wallet_id'),
     )
 
 class Income(Base):
@@ -55,7 +65,7 @@ class Income(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     wallet_id = Column(Integer, ForeignKey("wallets.id"))
-    amount = Column(Float)
+    amount = Column(BigInteger) # minor units (cents)
     date = Column(DateTime)
     category = Column(String)
     description = Column(String, nullable=True)
@@ -63,12 +73,19 @@ class Income(Base):
 
     wallet = relationship("Wallet", back_populates="incomes")
 
+    __table_args__ = (
+        # Covers the ledger SUMs and per-category GROUP BYs for a wallet/date range
+        Index('ix_incomes_wallet_date', 'wallet_id', 'date', 'category', 'amount'),
+        # Keyset pagination of the history walks (date, id) within a wallet
+        Index('ix_incomes_wallet_history', 'wallet_id', 'date', 'id'),
+    )
+
 class Expense(Base):
     __tablename__ = "expenses"
 
     id = Column(Integer, primary_key=True, index=True)
     wallet_id = Column(Integer, ForeignKey("wallets.id"))
-    amount = Column(Float)
+    amount = Column(BigInteger) # minor units (cents)
     date = Column(DateTime)
     category = Column(String)
     description = Column(String, nullable=True)
@@ -76,16 +93,82 @@ class Expense(Base):
 
     wallet = relationship("Wallet", back_populates="expenses")
 
+    __table_args__ = (
+        # Covers the ledger SUMs and per-category GROUP BYs for a wallet/date range
+        Index('ix_expenses_wallet_date', 'wallet_id', 'date', 'category', 'amount'),
+        # Keyset pagination of the history walks (date, id) within a wallet
+        Index('ix_expenses_wallet_history', 'wallet_id', 'date', 'id'),
+    )
+
 class WalletTransfer(Base):
     __tablename__ = "wallet_transfers"
 
     id = Column(Integer, primary_key=True, index=True)
     source_wallet_id = Column(Integer, ForeignKey("wallets.id"))
     target_wallet_id = Column(Integer, ForeignKey("wallets.id"))
-    amount = Column(Float)
+    amount = Column(BigInteger) # minor units (cents)
     date = Column(DateTime)
     description = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     source_wallet = relationship("Wallet", foreign_keys=[source_wallet_id])
     target_wallet = relationship("Wallet", foreign_keys=[target_wallet_id])
+
+    __table_args__ = (
+        # One per side; both carry the other wallet so the in/out SUMs stay index-only
+        Index('ix_wallet_transfers_source_date', 'source_wallet_id', 'date', 'target_wallet_id', 'amount'),
+        Index('ix_wallet_transfers_target_date', 'target_wallet_id', 'date', 'source_wallet_id', 'amount'),
+        Index('ix_wallet_transfers_source_history', 'source_wallet_id', 'date', 'id'),
+        Index('ix_wallet_transfers_target_history', 'target_wallet_id', 'date', 'id'),
+    )
+
+class CategoryMonthlyTotal(Base):
+    """Per-user monthly income/expense totals by category, maintained by app/rollups.py."""
+    __tablename__ = "category_monthly_totals"
+
+    # Key order serves one month's breakdown and a month range for a trend as index range scans
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    kind = Column(String, primary_key=True) # "income" or "expense"
+    month = Column(String, primary_key=True) # Format: "YYYY-MM"
+    category = Column(String, primary_key=True)
+    total = Column(BigInteger, default=0) # minor units (cents)
+
+class WalletDailyTotal(Base):
+    """Per-wallet flows by day, the finest level of the time-bucket ledger maintained by app/buckets.py."""
+    __tablename__ = "wallet_daily_totals"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    day = Column(String, primary_key=True) # Format: "YYYY-MM-DD"
+    total_income = Column(BigInteger, default=0) # minor units (cents)
+    total_expense = Column(BigInteger, default=0)
+    total_transfers_in = Column(BigInteger, default=0)
+    total_transfers_out = Column(BigInteger, default=0)
+
+class WalletYearlyTotal(Base):
+    """Per-wallet flows by year, the coarsest level of the time-bucket ledger maintained by app/buckets.py."""
+    __tablename__ = "wallet_yearly_totals"
+
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    year = Column(String, primary_key=True) # Format: "YYYY"
+    total_income = Column(BigInteger, default=0) # minor units (cents)
+    total_expense = Column(BigInteger, default=0)
+    total_transfers_in = Column(BigInteger, default=0)
+    total_transfers_out = Column(BigInteger, default=0)
+
+class MonthClosePartition(Base):
+    """A range of wallets closed together by app/month_close.py; completed ones are skipped on resume."""
+    __tablename__ = "month_close_partitions"
+
+    month = Column(String, primary_key=True) # Format: "YYYY-MM"
+    partition = Column(Integer, primary_key=True)
+    first_wallet_id = Column(Integer)
+    last_wallet_id = Column(Integer)
+    # Set in the same transaction that closes the partition's ledgers
+    closed = Column(Integer, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+class SchemaVersion(Base):
+    """Single-row table holding the schema version applied by database/migrations.py."""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
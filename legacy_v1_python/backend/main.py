@@ -1,11 +1,25 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from backend.database import models
-from backend.database.database import engine
-from backend.app.routers import auth, transactions, jobs, dashboard, wallets, stats, insights
+from backend.database import migrations
+from backend.database.database import engine, writer_engine, async_engine
+from backend.app.routers import auth, transactions, jobs, dashboard, wallets, stats, insights, metrics
+from backend.app import hashing, instrumentation
 
-models.Base.metadata.create_all(bind=engine)
+for bound in (engine, writer_engine, async_engine.sync_engine):
+    instrumentation.instrument_engine(bound)
 
-app = FastAPI(title="SpendWise API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not at import: tools and tests importing the app don't touch the database
+    if migrations.MIGRATE_ON_STARTUP:
+        migrations.ensure_schema(writer_engine)
+    yield
+    jobs.recalc_scheduler.shutdown(timeout=30)
+    hashing.pool.shutdown()
+    await async_engine.dispose()
+
+app = FastAPI(title="SpendWise API", lifespan=lifespan)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
 app.include_router(auth.router)
 app.include_router(transactions.router)
 app.include_router(jobs.router)
@@ -13,6 +27,7 @@ app.include_router(dashboard.router)
 app.include_router(wallets.router)
 app.include_router(stats.router)
 app.include_router(insights.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 def read_root():
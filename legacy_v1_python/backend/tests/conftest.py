@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.database import models
+from backend.database.database import Base
+import pytest
+
+@pytest.fixture
+def db():
+    """Session on a fresh in-memory database with every table created."""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+def _make_wallets(db):
+    user = models.User(email="wallets@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    cash = models.Wallet(user_id=user.id, name="Cash", type="CASH")
+    bank = models.Wallet(user_id=user.id, name="Bank", type="BANK")
+    db.add_all([cash, bank])
+    db.commit()
+    return cash, bank
+
+@pytest.fixture
+def make_wallets():
+    """make_wallets(db) adds a user with a cash and a bank wallet and returns (cash, bank)."""
+    return _make_wallets
@@ -0,0 +1,64 @@
+import time
+from datetime import datetime
+from backend.database import models
+from backend.app import analytics, ledger, rollups
+from backend.app.principals import WalletInfo
+import pytest
+
+def make_history(db, wallets, months):
+    """months maps YYYY-MM -> {"salary": cents into bank, "Food": cents from cash, "Rent": cents from bank}."""
+    cash, bank = wallets
+    for month_str, amounts in months.items():
+        for wallet in (cash, bank):
+            ledger.get_or_create_monthly_balance(db, wallet.id, month_str)
+        day = datetime.strptime(month_str, "%Y-%m")
+        db.add(models.Income(wallet_id=bank.id, amount=amounts["salary"], date=day, category="Salary"))
+        for wallet, category in ((cash, "Food"), (bank, "Rent")):
+            db.add(models.Expense(wallet_id=wallet.id, amount=amounts[category], date=day, category=category))
+            rollups.add_to_rollup(db, cash.user_id, rollups.EXPENSE, month_str, category, amounts[category])
+        db.commit()
+    for wallet in (cash, bank):
+        ledger.cascade_recalculation(db, wallet.id, min(months))
+    wallets = (WalletInfo(id=cash.id, name="Cash", type="CASH"), WalletInfo(id=bank.id, name="Bank", type="BANK"))
+    return cash.user_id, wallets
+
+def test_snapshot_fills_gaps_and_rules_match_the_history(db, make_wallets):
+    usual = {"salary": 100000, "Food": 10000, "Rent": 50000}
+    months = {f"2024-{month:02d}": usual for month in range(1, 13)}
+    months["2025-01"] = {"salary": 100000, "Food": 45000, "Rent": 50000}
+    user_id, wallets = make_history(db, make_wallets(db), months)
+
+    snapshot = analytics.load_snapshot(db, user_id, wallets, "2025-02")
+    assert (analytics.month_label(snapshot.first), analytics.month_label(snapshot.last)) == ("2024-01", "2025-02")
+    cash, bank = snapshot.type_row("CASH"), snapshot.type_row("BANK")
+    # February has no ledger rows yet: nothing moved and the balances carry over
+    assert snapshot.expense[:, -1].tolist() == [0, 0]
+    assert snapshot.balance[:, -1].tolist() == snapshot.balance[:, -2].tolist()
+    assert snapshot.balance[cash, -1] == -(10000 * 12 + 45000)
+    assert snapshot.balance[bank, -1] == 50000 * 13
+    assert snapshot.category_expense[snapshot.categories.index("Food")].sum() == 10000 * 12 + 45000
+
+    messages = {insight["message"]: insight["type"] for insight in analytics.insights(snapshot, "2025-01")}
+    assert messages["High burn rate: 95.0% of income used."] == "caution"
+    assert messages["Food spending is 450.00, 4.5x your usual 100.00 a month."] == "caution"
+    assert messages["Expenses are up 58.3% on last month (950.00 vs 600.00)."] == "caution"
+    assert "Rolling burn rate: 3-month 71.7%, 6-month 65.8%, 12-month 62.9%." in messages
+    assert any(message.startswith("Cash share of spending rose") for message in messages)
+    assert "Cash balance has fallen three months running, to -1,650.00." in messages
+    assert not any("Rent" in message or "Bank balance" in message for message in messages)
+
+    # A steady month raises none of the history rules
+    messages = [insight["message"] for insight in analytics.insights(snapshot, "2024-12")]
+    assert messages[0] == "Healthy burn rate: 60.0%."
+    assert not any("usual" in message or "last month" in message for message in messages)
+    assert analytics.insights(snapshot, "2023-12") == []
+    with pytest.raises(ValueError):
+        analytics.insights(snapshot, "2025-03")
+
+    # Kept until the user's next write, or the TTL for changes made by other processes
+    snapshots = analytics.SnapshotCache(ttl=0.05)
+    snapshots.put(user_id, 0, snapshot)
+    assert snapshots.get(user_id, 0, "2025-02") is snapshot
+    assert snapshots.get(user_id, 1, "2025-02") is None
+    time.sleep(0.1)
+    assert snapshots.get(user_id, 0, "2025-02") is None
@@ -0,0 +1,43 @@
+from sqlalchemy import create_engine, func, inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.database import models
+from backend.database.database import Base
+from backend.app import ledger
+from backend.benchmarks import compare, dataset, startup_bench
+
+def generate(seed):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    counts = dataset.generate(db, users=4, wallets_per_user=3, years=1, transactions_per_month=10, seed=seed)
+    return db, counts
+
+def test_dataset_is_reproducible_and_ledgers_balance():
+    db, counts = generate(seed=7)
+    again, counts_again = generate(seed=7)
+    assert counts == counts_again and counts["wallets"] == 12 and counts["months"] == 12
+    total = func.sum(models.Expense.amount)
+    assert db.query(total).scalar() == again.query(total).scalar()
+    other, _ = generate(seed=8)
+    assert other.query(total).scalar() != db.query(total).scalar()
+
+    ledgers = db.query(models.WalletMonthlyBalance).all()
+    assert len(ledgers) == 12 * 12
+    assert all(ledger.verify_ledger_totals(db, row) == {} for row in ledgers)
+
+def test_compare_flags_regressions():
+    baseline = {"results": {"a": {"p50_ms": 10.0}, "b": {"p50_ms": 10.0}, "gone": {"p50_ms": 1.0}}}
+    candidate = {"results": {"a": {"p50_ms": 12.0}, "b": {"p50_ms": 5.0}, "new": {"p50_ms": 1.0}}}
+    statuses = {row[0]: row[4] for row in compare.compare(baseline, candidate, threshold=0.15)}
+    assert statuses == {"a": "regression", "b": "improvement", "gone": "removed", "new": "added"}
+
+def test_startup_benchmark_times_a_cold_start(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPENDWISE_DATABASE_URL", f"sqlite:///{tmp_path / 'startup.db'}")
+    results = startup_bench.run(repeat=1)
+    assert sorted(results) == ["startup.first_request", "startup.import", "startup.process", "startup.startup"]
+    assert results["startup.process"]["min_ms"] > results["startup.import"]["min_ms"] > 0
+    # The lifespan created the schema in the fresh database
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    assert inspect(engine).has_table("users")
+    engine.dispose()
@@ -0,0 +1,29 @@
+import asyncio
+from backend.app import hashing
+import pytest
+
+def test_hashing_pool_rehashes_when_cost_changes():
+    old_pool = hashing.HashingPool(workers=1, rounds=4)
+    new_pool = hashing.HashingPool(workers=1, rounds=5)
+    try:
+        hashed = asyncio.run(old_pool.hash("password123"))
+        assert hashed.startswith("$2b$04$")
+        assert asyncio.run(old_pool.verify_and_update("password123", hashed)) == (True, None)
+        assert asyncio.run(old_pool.verify_and_update("wrong", hashed))[0] is False
+
+        valid, new_hash = asyncio.run(new_pool.verify_and_update("password123", hashed))
+        assert valid and new_hash.startswith("$2b$05$")
+
+        stats = old_pool.stats()
+        assert stats["completed"] == 3
+        assert stats["queue_depth"] == 0
+        assert new_pool.stats()["rehashed"] == 1
+    finally:
+        old_pool.shutdown()
+        new_pool.shutdown()
+
+def test_hashing_pool_rejects_when_full():
+    pool = hashing.HashingPool(workers=0, max_pending=0, rounds=4)
+    with pytest.raises(hashing.HashingOverloaded):
+        asyncio.run(pool.hash("password123"))
+    assert pool.stats()["rejected"] == 1
@@ -1,8 +1,22 @@
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
 from backend.main import app
+from backend.app import analytics, instrumentation, principals, response_cache, schemas, search
+from backend.app.routers import jobs, transactions
+from backend.database import migrations
+from backend.database.database import engine, writer_engine, async_engine, WriterSessionLocal
+import asyncio
+import httpx
+import json
 import pytest
+import threading
 import time
 
+# The app migrates in its lifespan, which a TestClient outside a with block skips
+migrations.migrate(writer_engine)
 client = TestClient(app)
 
 test_email = f"test_{int(time.time())}@example.com"
@@ -73,12 +87,412 @@ def test_full_flow():
     # Verify Balances (Jan)
     res = client.get("/dashboard/summary?month=2025-01", headers=headers)
     data = res.json()
-    assert abs(data["cash"]["closing"] - 700.0) < 0.01
-    assert abs(data["bank"]["closing"] - 100.0) < 0.01
+    assert data["cash"]["closing"] == 700.0
+    assert data["bank"]["closing"] == 100.0
 
     # Verify Auto-Creation / Rollover (Feb)
     res = client.get("/dashboard/summary?month=2025-02", headers=headers)
     data = res.json()
     # Opening for Feb should match Closing Jan
-    assert abs(data["cash"]["opening"] - 700.0) < 0.01
-    assert abs(data["bank"]["opening"] - 100.0) < 0.01
+    assert data["cash"]["opening"] == 700.0
+    assert data["bank"]["opening"] == 100.0
+
+def test_ledger_verify():
+    token = test_register_login()
+    headers = {"Authorization": f"Bearer {token}"}
+    wallets = client.get("/wallets/", headers=headers).json()
+    cash_wallet = next(w for w in wallets if w["type"] == "CASH")
+
+    # Incremental deltas must agree with a full rescan
+    res = client.post(f"/jobs/verify?wallet_id={cash_wallet['id']}&month_str=2025-01", headers=headers)
+    assert res.status_code == 200
+    assert res.json()["status"] == "ok"
+
+def test_warm_principal_cache_skips_auth_queries():
+    token = test_register_login()
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/wallets/", headers=headers).status_code == 200
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        res = client.get("/dashboard/summary?month=2025-01", headers=headers)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert res.status_code == 200
+    assert not [s for s in statements if "FROM users" in s or "FROM wallets" in s]
+
+def test_reads_and_writes_use_separate_connections():
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA mmap_size")).scalar() > 0
+        with pytest.raises(OperationalError):
+            conn.execute(text("DELETE FROM users WHERE id = -1"))
+    with writer_engine.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE id = -1"))
+    assert writer_engine.pool.size() == 1
+
+def register_user(prefix):
+    email = f"{prefix}_{time.time_ns()}@example.com"
+    client.post("/auth/register", json={"email": email, "password": test_password})
+    res = client.post("/auth/login", data={"username": email, "password": test_password})
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    wallets = client.get("/wallets/", headers=headers).json()
+    cash = next(w for w in wallets if w["type"] == "CASH")
+    bank = next(w for w in wallets if w["type"] == "BANK")
+    return headers, cash["id"], bank["id"]
+
+def test_register_waits_for_the_writer_off_the_event_loop():
+    headers, cash_id, _ = register_user("writer_wait")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            # A writer that fails without committing, alongside a registration on the same loop
+            rejected, registered = await asyncio.wait_for(asyncio.gather(
+                http.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 1000.0, "date": "2024-01-01T00:00:00", "category": "Food"}, headers=headers),
+                http.post("/auth/register", json={"email": f"writer_wait_{time.time_ns()}@example.com", "password": test_password}),
+            ), timeout=10)
+            assert (rejected.status_code, registered.status_code) == (400, 200)
+
+            # While another thread holds the writer, register waits on the threadpool and the loop keeps serving
+            held, release = threading.Event(), threading.Event()
+
+            def hold_writer():
+                with WriterSessionLocal() as db:
+                    db.execute(text("SELECT 1"))
+                    held.set()
+                    release.wait(5)
+
+            holder = threading.Thread(target=hold_writer)
+            holder.start()
+            held.wait(5)
+            try:
+                registering = asyncio.create_task(http.post("/auth/register", json={"email": f"writer_wait_{time.time_ns()}@example.com", "password": test_password}))
+                started = time.perf_counter()
+                await asyncio.sleep(0.2)
+                assert (await http.get("/")).status_code == 200
+                # Wall clock: a loop blocked on the pool checkout can't time anything out
+                assert time.perf_counter() - started < 2
+                assert not registering.done()
+            finally:
+                release.set()
+                holder.join()
+            assert (await asyncio.wait_for(registering, timeout=10)).status_code == 200
+
+    asyncio.run(run())
+
+def test_rejected_debits_release_the_writer_before_responding():
+    headers, cash_id, bank_id = register_user("rejected_debit")
+    principal = principals.Principal(id=0, email="rejected@example.com", wallets=(
+        principals.WalletInfo(id=cash_id, name="Cash", type="CASH"), principals.WalletInfo(id=bank_id, name="Bank", type="BANK"),
+    ))
+    expense = schemas.ExpenseCreate(wallet_id=cash_id, amount=1000.0, date="2024-01-01T00:00:00", category="Food")
+    transfer = schemas.TransferCreate(source_wallet_id=cash_id, target_wallet_id=bank_id, amount=1000.0, date="2024-01-01T00:00:00")
+    for handler, body in ((transactions.add_expense, expense), (transactions.wallet_transfer, transfer)):
+        with WriterSessionLocal() as db:
+            with pytest.raises(HTTPException) as rejected:
+                handler(body, principal, db)
+            assert rejected.value.status_code == 400
+            # No transaction left open, so other writers aren't queued behind the error response
+            assert not db.in_transaction()
+
+def test_bulk_ingest_and_statement_import():
+    headers, cash_id, bank_id = register_user("bulk")
+
+    res = client.post("/transactions/bulk", json={
+        "incomes": [{"wallet_id": cash_id, "amount": 10.0, "date": f"2024-0{1 + i % 3}-05T00:00:00", "category": "Salary"} for i in range(300)],
+        "expenses": [{"wallet_id": cash_id, "amount": 2.5, "date": "2024-02-10T00:00:00", "category": "Food"} for _ in range(40)],
+        "transfers": [{"source_wallet_id": cash_id, "target_wallet_id": bank_id, "amount": 100.0, "date": "2024-03-01T00:00:00"}],
+    }, headers=headers)
+    assert res.status_code == 200
+    assert res.json()["incomes"] == 300
+    assert res.json()["recalculated_wallets"] == 2
+
+    data = client.get("/dashboard/summary?month=2024-03", headers=headers).json()
+    assert data["cash"]["closing"] == 3000.0 - 100.0 - 100.0
+    assert data["bank"]["opening"] == 0.0
+    assert data["bank"]["closing"] == 100.0
+    data = client.get("/dashboard/summary?month=2024-02", headers=headers).json()
+    assert data["cash"]["opening"] == 1000.0
+
+    csv_body = "date,amount,category,description\n2024-04-01,-50.00,Rent,April rent\n2024-04-02,20.00,,Refund\n"
+    res = client.post(f"/transactions/import?format=csv&wallet_id={cash_id}", files={"file": ("s.csv", csv_body)}, headers=headers)
+    assert res.status_code == 200
+    assert (res.json()["incomes"], res.json()["expenses"]) == (1, 1)
+
+    ofx_body = "<OFX><BANKTRANLIST>\n<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240405120000\n<TRNAMT>-30.00\n<NAME>Grocer\n</STMTTRN>\n</BANKTRANLIST></OFX>"
+    res = client.post(f"/transactions/import?format=ofx&wallet_id={bank_id}", files={"file": ("s.ofx", ofx_body)}, headers=headers)
+    assert res.status_code == 200
+    assert res.json()["expenses"] == 1
+
+    data = client.get("/dashboard/summary?month=2024-04", headers=headers).json()
+    assert data["cash"]["closing"] == 2800.0 - 50.0 + 20.0
+    assert data["bank"]["closing"] == 70.0
+
+    # Unknown wallets roll the whole batch back
+    res = client.post("/transactions/bulk", json={
+        "incomes": [{"wallet_id": cash_id, "amount": 1.0, "date": "2024-04-01T00:00:00", "category": "X"},
+                    {"wallet_id": -1, "amount": 1.0, "date": "2024-04-01T00:00:00", "category": "X"}],
+    }, headers=headers)
+    assert res.status_code == 404
+    data = client.get("/dashboard/summary?month=2024-04", headers=headers).json()
+    assert data["cash"]["closing"] == 2770.0
+
+    # A Latin-1 export is rejected rather than half-imported
+    latin1_body = "date,amount,category,description\n2024-04-03,-5.00,Food,Caf\u00e9\n".encode("latin-1")
+    res = client.post(f"/transactions/import?format=csv&wallet_id={cash_id}", files={"file": ("s.csv", latin1_body)}, headers=headers)
+    assert res.status_code == 400
+    assert "UTF-8" in res.json()["detail"]
+    assert client.get("/dashboard/summary?month=2024-04", headers=headers).json()["cash"]["closing"] == 2770.0
+
+def test_amounts_are_exact():
+    headers, cash_id, _ = register_user("cents")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 0.3, "date": "2025-03-01T00:00:00", "category": "Gift"}, headers=headers)
+    # 0.3 - 0.1 in floats is 0.19999999999999998, which used to fail the funds check
+    for amount in (0.1, 0.2):
+        res = client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": amount, "date": "2025-03-02T00:00:00", "category": "Food"}, headers=headers)
+        assert res.status_code == 200
+
+    data = client.get("/dashboard/summary?month=2025-03", headers=headers).json()
+    assert data["cash"]["closing"] == 0.0
+    assert data["total_expense"] == 0.3
+    assert client.get("/stats/expenses-by-category?month=2025-03", headers=headers).json() == {"Food": 0.3}
+    res = client.get("/stats/category-trend?start_month=2025-01&end_month=2025-03&kind=income", headers=headers)
+    assert res.json() == {"Gift": {"2025-03": 0.3}}
+
+def test_read_endpoints_are_cached_until_a_write_touches_their_month():
+    headers, cash_id, _ = register_user("etag")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 40.0, "date": "2025-05-01T00:00:00", "category": "Salary"}, headers=headers)
+    client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 5.0, "date": "2025-05-02T00:00:00", "category": "Food"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+
+    res = client.get("/dashboard/summary?month=2025-06", headers=headers)
+    etag = res.headers["ETag"]
+    assert res.json()["cash"]["opening"] == 35.0
+    may = client.get("/stats/expenses-by-category?month=2025-05", headers=headers).headers["ETag"]
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        res = client.get("/dashboard/summary?month=2025-06", headers={**headers, "If-None-Match": etag})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert res.status_code == 304
+    assert statements == []
+
+    # A June write changes the June dashboard but not May's categories
+    client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 1.0, "date": "2025-06-03T00:00:00", "category": "Food"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+    res = client.get("/dashboard/summary?month=2025-06", headers={**headers, "If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.json()["cash"]["closing"] == 34.0
+    res = client.get("/stats/expenses-by-category?month=2025-05", headers={**headers, "If-None-Match": may})
+    assert res.status_code == 304
+
+    # A backdated write reaches every later month's balances
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 10.0, "date": "2025-04-01T00:00:00", "category": "Gift"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+    assert client.get("/dashboard/summary?month=2025-06", headers=headers).json()["cash"]["closing"] == 44.0
+
+def test_dashboard_month_is_validated_and_canonical():
+    headers, cash_id, _ = register_user("dashboard_month")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 12.0, "date": "2024-05-10T00:00:00", "category": "Salary"}, headers=headers)
+    assert client.get("/dashboard/summary?month=2024-5", headers=headers).json() == client.get("/dashboard/summary?month=2024-05", headers=headers).json()
+    assert client.get("/dashboard/summary?month=2024-5", headers=headers).json()["cash"]["closing"] == 12.0
+    assert client.get("/dashboard/summary?month=May", headers=headers).status_code == 400
+
+def test_range_analytics():
+    headers, cash_id, bank_id = register_user("range")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 100.0, "date": "2024-01-10T00:00:00", "category": "Salary"}, headers=headers)
+    client.post("/transactions/income", json={"wallet_id": bank_id, "amount": 20.0, "date": "2024-03-15T00:00:00", "category": "Gift"}, headers=headers)
+    client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 30.0, "date": "2024-02-03T00:00:00", "category": "Food"}, headers=headers)
+    client.post("/transactions/transfer", json={"source_wallet_id": cash_id, "target_wallet_id": bank_id, "amount": 10.0, "date": "2024-02-04T00:00:00"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+
+    data = client.get("/stats/range?start=2024-01&end=2024-03", headers=headers).json()
+    assert [(p["period"], p["income"], p["expense"], p["balance"]) for p in data["series"]] == [
+        ("2024-01", 100.0, 0.0, 100.0), ("2024-02", 0.0, 30.0, 70.0), ("2024-03", 20.0, 0.0, 90.0),
+    ]
+    assert (data["total_income"], data["total_expense"], data["net"]) == (120.0, 30.0, 90.0)
+
+    data = client.get("/stats/range?start=2024-02&end=2024-03", headers=headers).json()
+    assert (data["opening_balance"], data["closing_balance"], data["total_expense"]) == (100.0, 90.0, 30.0)
+
+    data = client.get("/stats/range?start=2024-02-02&end=2024-02-04&granularity=day", headers=headers).json()
+    assert [(p["period"], p["balance"]) for p in data["series"]] == [("2024-02-02", 100.0), ("2024-02-03", 70.0), ("2024-02-04", 70.0)]
+    assert data["opening_balance"] == 100.0
+
+    data = client.get("/stats/range?start=2024-02-01&end=2024-02-12&granularity=week", headers=headers).json()
+    assert [p["period"] for p in data["series"]] == ["2024-01-29", "2024-02-05", "2024-02-12"]
+    assert data["series"][0]["expense"] == 30.0
+
+    assert client.get("/stats/range?start=2024-03&end=2024-01", headers=headers).status_code == 400
+    assert client.get("/stats/range?start=2024-01&end=2024-03&granularity=hour", headers=headers).status_code == 400
+
+def test_transaction_history_pages_with_a_cursor():
+    headers, cash_id, bank_id = register_user("history")
+    for day in range(1, 6):
+        client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 10.0 * day, "date": f"2024-06-0{day}T00:00:00", "category": "Salary"}, headers=headers)
+    client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 4.0, "date": "2024-06-03T00:00:00", "category": "Food"}, headers=headers)
+    client.post("/transactions/transfer", json={"source_wallet_id": cash_id, "target_wallet_id": bank_id, "amount": 5.0, "date": "2024-06-03T00:00:00"}, headers=headers)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/transactions/", params=params, headers=headers).json()
+        seen += [(item["date"][:10], item["kind"]) for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [
+        ("2024-06-05", "income"), ("2024-06-04", "income"),
+        ("2024-06-03", "transfer"), ("2024-06-03", "expense"), ("2024-06-03", "income"),
+        ("2024-06-02", "income"), ("2024-06-01", "income"),
+    ]
+
+    page = client.get("/transactions/", params={"wallet_id": bank_id}, headers=headers).json()
+    assert [(i["kind"], i["amount"], i["target_wallet_id"]) for i in page["items"]] == [("transfer", 5.0, bank_id)]
+    page = client.get("/transactions/", params={"category": "Salary", "min_amount": 20, "max_amount": 40, "end": "2024-06-03"}, headers=headers).json()
+    assert [i["amount"] for i in page["items"]] == [30.0, 20.0]
+    assert client.get("/transactions/", params={"cursor": "nope"}, headers=headers).status_code == 400
+
+def test_export_streams_every_format():
+    headers, cash_id, bank_id = register_user("export")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 12.5, "date": "2024-07-01T00:00:00", "category": "Salary", "description": "July, part 1"}, headers=headers)
+    client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 0.05, "date": "2024-07-02T00:00:00", "category": "Food"}, headers=headers)
+    client.post("/transactions/transfer", json={"source_wallet_id": cash_id, "target_wallet_id": bank_id, "amount": 2.0, "date": "2024-07-03T00:00:00"}, headers=headers)
+
+    res = client.get("/transactions/export?format=csv", headers=headers)
+    assert res.headers["content-type"].startswith("text/csv")
+    lines = res.text.splitlines()
+    assert lines[0] == "date,kind,id,wallet_id,target_wallet_id,amount,category,description"
+    assert [line.split(",")[1] for line in lines[1:]] == ["income", "expense", "transfer"]
+    assert '12.50,Salary,"July, part 1"' in lines[1]
+    assert ",0.05,Food," in lines[2]
+
+    rows = [json.loads(line) for line in client.get(f"/transactions/export?format=ndjson&wallet_id={bank_id}", headers=headers).text.splitlines()]
+    assert [(r["kind"], r["amount"], r["target_wallet_id"]) for r in rows] == [("transfer", 2.0, bank_id)]
+
+    header, *batches = [json.loads(line) for line in client.get("/transactions/export?format=columnar", headers=headers).text.splitlines()]
+    amounts = [amount for batch in batches for amount in batch[header["columns"].index("amount")]]
+    assert amounts == [1250, 5, 200]
+
+def test_search_ranks_matches_within_the_users_wallets():
+    headers, cash_id, bank_id = register_user("search")
+    other_headers, other_cash, _ = register_user("search_other")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 50.0, "date": "2024-08-01T00:00:00", "category": "Salary", "description": "August payroll"}, headers=headers)
+    client.post("/transactions/bulk", json={
+        "expenses": [{"wallet_id": cash_id, "amount": 3.0, "date": "2024-08-02T00:00:00", "category": "Coffee", "description": f"Café latte #{i}"} for i in range(3)],
+        "transfers": [{"source_wallet_id": cash_id, "target_wallet_id": bank_id, "amount": 5.0, "date": "2024-08-03T00:00:00", "description": "coffee fund"}],
+    }, headers=headers)
+    client.post("/transactions/income", json={"wallet_id": other_cash, "amount": 1.0, "date": "2024-08-01T00:00:00", "category": "Coffee", "description": "coffee refund"}, headers=other_headers)
+
+    page = client.get("/transactions/search", params={"q": "coff"}, headers=headers).json()
+    assert sorted(item["kind"] for item in page["items"]) == ["expense", "expense", "expense", "transfer"]
+    # Diacritics are folded and words match as prefixes
+    page = client.get("/transactions/search", params={"q": "cafe lat", "limit": 2}, headers=headers).json()
+    assert len(page["items"]) == 2 and page["next_offset"] == 2
+    page = client.get("/transactions/search", params={"q": "cafe lat", "offset": 2}, headers=headers).json()
+    assert len(page["items"]) == 1 and page["next_offset"] is None
+    page = client.get("/transactions/search", params={"q": "coffee", "wallet_id": bank_id}, headers=headers).json()
+    assert [(item["kind"], item["target_wallet_id"]) for item in page["items"]] == [("transfer", bank_id)]
+    assert client.get("/transactions/search", params={"q": "payroll"}, headers=other_headers).json()["items"] == []
+    assert client.get("/transactions/search", params={"q": '"*'}, headers=headers).status_code == 400
+
+    # The LIKE fallback for databases without FTS5 treats _ in a term literally
+    client.post("/transactions/bulk", json={"expenses": [
+        {"wallet_id": cash_id, "amount": 1.0, "date": "2024-08-04T00:00:00", "category": "Misc", "description": description}
+        for description in ("ref a_b", "ref axb")
+    ]}, headers=headers)
+    with Session(engine) as db:
+        page = search._search_like(db, [cash_id], ["a_b"], 10, 0)
+    assert [item["description"] for item in page["items"]] == ["ref a_b"]
+
+def test_insights_share_a_snapshot_until_the_next_write():
+    headers, cash_id, _ = register_user("insights")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 100.0, "date": "2024-05-01T00:00:00", "category": "Salary"}, headers=headers)
+    client.post("/transactions/expense", json={"wallet_id": cash_id, "amount": 90.0, "date": "2024-05-02T00:00:00", "category": "Food"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+
+    misses = analytics.snapshots.stats()["misses"]
+    may = client.get("/insights/?month=2024-05", headers=headers).json()
+    assert {"type": "caution", "message": "High burn rate: 90.0% of income used."} in may
+    assert {"type": "info", "message": "Heavy cash usage detected."} in may
+    # Another month is computed from the same arrays
+    assert client.get("/insights/?month=2024-04", headers=headers).json() == []
+    assert analytics.snapshots.stats()["misses"] == misses + 1
+
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 100.0, "date": "2024-05-03T00:00:00", "category": "Salary"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+    may = client.get("/insights/?month=2024-05", headers=headers).json()
+    assert {"type": "success", "message": "Healthy burn rate: 45.0%."} in may
+    assert analytics.snapshots.stats()["misses"] == misses + 2
+    assert client.get("/insights/?month=May", headers=headers).status_code == 400
+
+def test_month_close_invalidates_the_owners_cached_reads():
+    headers, cash_id, _ = register_user("close_cache")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 10.0, "date": "2019-03-05T00:00:00", "category": "Salary"}, headers=headers)
+    jobs.recalc_scheduler.drain(timeout=10)
+    # Drift the ledger behind the app's back, then cache the drifted numbers
+    with writer_engine.begin() as conn:
+        conn.execute(text("UPDATE wallet_monthly_balances SET total_income = 999, closing_balance = 999 WHERE wallet_id = :id AND month = '2019-03'"), {"id": cash_id})
+    assert client.get("/dashboard/summary?month=2019-03", headers=headers).json()["cash"]["closing"] == 9.99
+    assert client.get("/dashboard/summary?month=2019-03", headers=headers).json()["cash"]["closing"] == 9.99
+
+    # The close repairs the totals and drops the stale entries
+    jobs.month_close_progress.pop("2019-03", None)
+    jobs.run_month_close("2019-03")
+    assert client.get("/dashboard/summary?month=2019-03", headers=headers).json()["cash"]["closing"] == 10.0
+    assert client.get("/dashboard/summary?month=2019-04", headers=headers).json()["cash"]["opening"] == 10.0
+
+def test_cached_responses_expire_after_the_ttl():
+    cache = response_cache.ResponseCache(ttl=0.05)
+    cache.put((1, "stats", ()), response_cache._Entry(b"{}", "etag", "2024-01", "2024-01"), cache.generation(1))
+    assert cache.get((1, "stats", ())) is not None
+    time.sleep(0.1)
+    assert cache.get((1, "stats", ())) is None and cache.stats()["entries"] == 0
+
+def test_requests_report_query_counts_and_metrics():
+    headers, cash_id, _ = register_user("metrics")
+    client.post("/transactions/income", json={"wallet_id": cash_id, "amount": 10.0, "date": "2024-09-01T00:00:00", "category": "Salary"}, headers=headers)
+
+    res = client.get("/dashboard/summary?month=2024-09", headers=headers)
+    timing = res.headers["server-timing"]
+    assert timing.startswith("db;dur=") and "total;dur=" in timing
+    statements = int(timing.split('desc="')[1].split(" ")[0])
+    assert statements > 0
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/dashboard/summary",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/dashboard/summary",le="+Inf"}' in body
+    assert 'http_request_db_commits_total{method="POST",route="/transactions/income"}' in body
+    assert "spendwise_response_cache_hits" in body
+    client.get("/no/such/path")
+    assert 'route="unmatched",status="404"' in client.get("/metrics").text
+
+def test_profiler_writes_folded_stacks_for_slow_requests(tmp_path):
+    profiler = instrumentation.SamplingProfiler(threshold_ms=10, interval_ms=1, directory=tmp_path)
+
+    def busy_work(seconds):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+
+    worker = threading.Thread(target=busy_work, args=(0.1,))
+    profile = profiler.begin()
+    worker.start()
+    worker.join()
+    path = profiler.end(profile, 0.1, "GET", "/stats/range")
+    lines = path.read_text().splitlines()
+    assert path.name.endswith("-GET-stats_range.folded")
+    assert any("busy_work (test_main.py" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    fast = profiler.begin()
+    assert profiler.end(fast, 0.001, "GET", "/") is None
@@ -0,0 +1,169 @@
+from sqlalchemy import create_engine, event, inspect, text
+from backend.database.database import Base
+from backend.database import migrations
+import pytest
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'spendwise.db'}")
+    yield engine
+    engine.dispose()
+
+def test_ensure_indexes_builds_missing_indexes(engine):
+    Base.metadata.create_all(bind=engine)
+    # Simulate a database created before the indexes existed
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_expenses_wallet_date"))
+        conn.execute(text("DROP INDEX ix_wallet_transfers_source_date"))
+
+    assert sorted(migrations.ensure_indexes(engine)) == ["ix_expenses_wallet_date", "ix_wallet_transfers_source_date"]
+    assert migrations.ensure_indexes(engine) == []
+    assert "ix_expenses_wallet_date" in {i["name"] for i in inspect(engine).get_indexes("expenses")}
+
+def test_ledger_sums_are_index_only(engine):
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        plan = " ".join(str(row[-1]) for row in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT sum(amount) FROM expenses "
+            "WHERE wallet_id = 1 AND date >= '2025-01-01' AND date < '2025-02-01'"
+        )))
+    assert "COVERING INDEX ix_expenses_wallet_date" in plan
+
+def test_migrate_converts_float_amounts_to_cents(engine):
+    # Schema as created by the original float-based models
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, email VARCHAR, hashed_password VARCHAR, created_at DATETIME)"))
+        conn.execute(text(
+            "CREATE TABLE incomes (id INTEGER NOT NULL PRIMARY KEY, wallet_id INTEGER, amount FLOAT, "
+            "date DATETIME, category VARCHAR, description VARCHAR, created_at DATETIME)"
+        ))
+        conn.execute(text("CREATE INDEX ix_incomes_id ON incomes (id)"))
+        conn.execute(text("CREATE TABLE wallets (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, name VARCHAR, type VARCHAR)"))
+        conn.execute(text("INSERT INTO wallets (id, user_id, name, type) VALUES (1, 7, 'Cash', 'CASH')"))
+        conn.execute(text(
+            "INSERT INTO incomes (wallet_id, amount, date, category) VALUES "
+            "(1, 0.1, '2025-01-01 00:00:00.000000', 'Gift'), (1, 1000.35, '2025-01-02 00:00:00.000000', 'Salary')"
+        ))
+
+    assert migrations.migrate(engine) == 0
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT amount, typeof(amount) FROM incomes ORDER BY id")).all()
+        assert migrations.get_schema_version(conn) == migrations.SCHEMA_VERSION
+    assert rows == [(10, "integer"), (100035, "integer")]
+    with engine.connect() as conn:
+        totals = conn.execute(text("SELECT user_id, kind, month, category, total FROM category_monthly_totals ORDER BY category")).all()
+    assert totals == [(7, "income", "2025-01", "Gift", 10), (7, "income", "2025-01", "Salary", 100035)]
+    assert "ix_incomes_wallet_date" in {i["name"] for i in inspect(engine).get_indexes("incomes")}
+
+    # Already current: nothing is converted twice
+    assert migrations.migrate(engine) == migrations.SCHEMA_VERSION
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT SUM(amount) FROM incomes")).scalar() == 100045
+
+def test_migrate_backfills_cumulative_ledger_totals(engine):
+    migrations.migrate(engine)
+    # Roll the ledger table back to its v2 shape
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE wallet_monthly_balances DROP COLUMN cumulative_income"))
+        conn.execute(text("ALTER TABLE wallet_monthly_balances DROP COLUMN cumulative_expense"))
+        conn.execute(text("ALTER TABLE wallet_monthly_balances DROP COLUMN version"))
+        conn.execute(text("UPDATE schema_version SET version = 2"))
+        conn.execute(text(
+            "INSERT INTO wallet_monthly_balances (wallet_id, month, total_income, total_expense) VALUES "
+            "(1, '2024-01', 100, 40), (1, '2024-03', 50, 0), (2, '2024-01', 7, 0)"
+        ))
+
+    assert migrations.migrate(engine) == 2
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT wallet_id, month, cumulative_income, cumulative_expense FROM wallet_monthly_balances ORDER BY wallet_id, month"
+        )).all()
+    assert rows == [(1, "2024-01", 100, 40), (1, "2024-03", 150, 40), (2, "2024-01", 7, 0)]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT DISTINCT version FROM wallet_monthly_balances")).scalars().all() == [0]
+
+def test_migrate_backfills_search_index(engine):
+    migrations.migrate(engine)
+    with engine.begin() as conn:
+        for table in ("incomes", "expenses", "wallet_transfers"):
+            for event in ("insert", "update", "delete"):
+                conn.execute(text(f"DROP TRIGGER {table}_fts_{event}"))
+        conn.execute(text("DROP TABLE transactions_fts"))
+        conn.execute(text("UPDATE schema_version SET version = 3"))
+        conn.execute(text("INSERT INTO expenses (id, wallet_id, amount, date, category, description) VALUES (7, 1, 100, '2024-01-02', 'Food', 'Corner bakery')"))
+
+    assert migrations.migrate(engine) == 3
+    with engine.begin() as conn:
+        match = "SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH :q"
+        assert conn.execute(text(match), {"q": "bakery"}).scalars().all() == [7 * 4 + 1]
+        # Triggers follow later writes
+        conn.execute(text("UPDATE expenses SET description = 'Corner deli' WHERE id = 7"))
+        assert conn.execute(text(match), {"q": "bakery"}).all() == []
+        conn.execute(text("DELETE FROM expenses WHERE id = 7"))
+        assert conn.execute(text(match), {"q": "food"}).all() == []
+
+def test_migrate_backfills_time_buckets(engine):
+    migrations.migrate(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE wallet_daily_totals"))
+        conn.execute(text("DROP TABLE wallet_yearly_totals"))
+        conn.execute(text("UPDATE schema_version SET version = 6"))
+        conn.execute(text("INSERT INTO incomes (wallet_id, amount, date, category) VALUES (1, 5000, '2023-12-31 09:00:00', 'Salary')"))
+        conn.execute(text("INSERT INTO expenses (wallet_id, amount, date, category) VALUES (1, 700, '2024-01-02 12:00:00', 'Food')"))
+        conn.execute(text("INSERT INTO wallet_transfers (source_wallet_id, target_wallet_id, amount, date) VALUES (1, 2, 300, '2024-01-02 13:00:00')"))
+
+    assert migrations.migrate(engine) == 6
+    with engine.begin() as conn:
+        assert conn.execute(text("SELECT wallet_id, day, total_income, total_expense, total_transfers_in, total_transfers_out FROM wallet_daily_totals ORDER BY wallet_id, day")).all() == [
+            (1, "2023-12-31", 5000, 0, 0, 0), (1, "2024-01-02", 0, 700, 0, 300), (2, "2024-01-02", 0, 0, 300, 0),
+        ]
+        assert conn.execute(text("SELECT wallet_id, year, total_income, total_expense FROM wallet_yearly_totals ORDER BY wallet_id, year")).all() == [
+            (1, "2023", 5000, 0), (1, "2024", 0, 700), (2, "2024", 0, 0),
+        ]
+
+def test_migrate_carries_ledgers_over_months_without_one(engine):
+    migrations.migrate(engine)
+    # As written before v8: March opened at zero because February had no ledger
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE schema_version SET version = 7"))
+        conn.execute(text(
+            "INSERT INTO wallet_monthly_balances (wallet_id, month, opening_balance, total_income, total_expense, "
+            "total_transfers_in, total_transfers_out, closing_balance, cumulative_income, cumulative_expense) VALUES "
+            "(1, '2024-01', 0, 10000, 0, 0, 500, 9500, 10000, 0), (1, '2024-03', 0, 2000, 300, 0, 0, 1700, 2000, 300)"
+        ))
+
+    assert migrations.migrate(engine) == 7
+    with engine.connect() as conn:
+        assert conn.execute(text(
+            "SELECT month, opening_balance, closing_balance, cumulative_income, cumulative_expense "
+            "FROM wallet_monthly_balances ORDER BY month"
+        )).all() == [("2024-01", 0, 9500, 10000, 0), ("2024-03", 9500, 11200, 12000, 300)]
+
+def test_migrate_replaces_the_month_closed_index(engine):
+    migrations.migrate(engine)
+    # As built before wallet_id was added to it
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_wallet_monthly_balances_month_closed_wallet"))
+        conn.execute(text("CREATE INDEX ix_wallet_monthly_balances_month_closed ON wallet_monthly_balances (month, is_closed)"))
+        conn.execute(text("UPDATE schema_version SET version = 8"))
+
+    assert migrations.migrate(engine) == 8
+    indexes = {i["name"]: i["column_names"] for i in inspect(engine).get_indexes("wallet_monthly_balances")}
+    assert "ix_wallet_monthly_balances_month_closed" not in indexes
+    assert indexes["ix_wallet_monthly_balances_month_closed_wallet"] == ["month", "is_closed", "wallet_id"]
+
+def test_ensure_schema_only_migrates_when_behind(engine):
+    assert migrations.ensure_schema(engine)
+    assert inspect(engine).has_table("month_close_partitions")
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert not migrations.ensure_schema(engine)
+    # The version lookup, not a pass over every table
+    assert len(statements) <= 2
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE month_close_partitions"))
+        conn.execute(text("UPDATE schema_version SET version = 5"))
+    assert migrations.ensure_schema(engine)
+    assert inspect(engine).has_table("month_close_partitions")
@@ -0,0 +1,48 @@
+import threading
+import time
+from backend.app.scheduler import RecalculationScheduler
+
+def test_scheduler_coalesces_per_wallet_keeping_earliest_month():
+    calls = []
+    scheduler = RecalculationScheduler(lambda wallet_id, month: calls.append((wallet_id, month)), workers=2, debounce_ms=50)
+    for month in ["2024-03", "2024-01", "2024-02"] * 30:
+        scheduler.schedule(1, month)
+    scheduler.schedule(2, "2024-05")
+    assert scheduler.drain(timeout=5)
+
+    assert sorted(calls) == [(1, "2024-01"), (2, "2024-05")]
+    stats = scheduler.stats()
+    assert stats["coalesced"] == 89
+    assert stats["completed"] == 2
+    assert stats["queue_length"] == 0
+    scheduler.shutdown(timeout=5)
+
+def test_scheduler_serializes_work_per_wallet_and_retries():
+    active = set()
+    overlaps = []
+    attempts = []
+    lock = threading.Lock()
+
+    def job(wallet_id, month):
+        with lock:
+            if wallet_id in active:
+                overlaps.append(wallet_id)
+            active.add(wallet_id)
+        attempts.append(month)
+        time.sleep(0.05)
+        with lock:
+            active.discard(wallet_id)
+        if len(attempts) == 1:
+            raise RuntimeError("database is locked")
+
+    scheduler = RecalculationScheduler(job, workers=4, debounce_ms=1)
+    scheduler.schedule(7, "2024-02")
+    time.sleep(0.02)
+    # Arrives while the first run is in flight; must wait for it
+    scheduler.schedule(7, "2024-01")
+    assert scheduler.drain(timeout=5)
+
+    assert overlaps == []
+    assert "2024-01" in attempts
+    assert scheduler.stats()["retried"] == 1
+    scheduler.shutdown(timeout=5)
@@ -0,0 +1,76 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from backend.app import ledger, month_close
+from backend.database import migrations
+
+logger = logging.getLogger(__name__)
+
+# How long after midnight on the 1st the previous month is closed, so
+# transactions dated on its last day have landed
+MONTH_CLOSE_DELAY_MINUTES = float(os.getenv("SPENDWISE_MONTH_CLOSE_DELAY_MINUTES", "10"))
+
+# A month close that fails is tried again this much later rather than next month
+RETRY_DELAY = timedelta(minutes=15)
+
+# Sleep in slices so a suspended host or a clock change doesn't oversleep a boundary
+MAX_SLEEP_SECONDS = 3600
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_close_at(now: datetime, delay: timedelta) -> datetime:
+    """The first month-boundary close time after now."""
+    due = month_start(now) + delay
+    if due > now:
+        return due
+    return month_start(month_start(now) + timedelta(days=32)) + delay
+
+# The web processes' response and insight caches are out of reach from here:
+# their entries for the closed month expire within SPENDWISE_RESPONSE_CACHE_TTL
+def close(month_str: str, workers: int, partition_size: int) -> dict:
+    report = month_close.run(month_str, workers=workers, partition_size=partition_size)
+    print(json.dumps(report), flush=True)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Close monthly ledgers at each month boundary.")
+    parser.add_argument("--month", help="close this month (YYYY-MM) once and exit")
+    parser.add_argument("--workers", type=int, default=month_close.MONTH_CLOSE_WORKERS, help="worker processes (0 closes in this process)")
+    parser.add_argument("--partition-size", type=int, default=month_close.MONTH_CLOSE_PARTITION_SIZE, help="wallets per partition")
+    parser.add_argument("--delay-minutes", type=float, default=MONTH_CLOSE_DELAY_MINUTES, help="wait after the month boundary")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # The worker may start before any web process has brought the schema up to date
+    migrations.migrate()
+
+    if args.month:
+        report = close(args.month, args.workers, args.partition_size)
+        sys.exit(1 if report["failed"] else 0)
+
+    delay = timedelta(minutes=args.delay_minutes)
+    while True:
+        # Also catches up on start: a month already closed plans no partitions
+        now = datetime.now()
+        due = next_close_at(now, delay)
+        if now >= month_start(now) + delay:
+            previous_month = ledger.get_previous_month(now.strftime("%Y-%m"))
+            try:
+                failed = close(previous_month, args.workers, args.partition_size)["failed"]
+            except Exception:
+                logger.exception("Month close %s failed", previous_month)
+                failed = True
+            if failed:
+                # Finished partitions are checkpointed, so the retry resumes
+                due = min(due, datetime.now() + RETRY_DELAY)
+
+        logger.info("Next month close at %s", due.isoformat(timespec="minutes"))
+        while (remaining := (due - datetime.now()).total_seconds()) > 0:
+            time.sleep(min(remaining, MAX_SLEEP_SECONDS))
+
+if __name__ == "__main__":
+    main()